@@ -4,9 +4,24 @@
 # Import necessary classes from Django
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
+from django.db.models import Q
 
 # Import models from the current application
 from .models import User, Document, Analysis, DocumentAnalysis, Report
+from . import search
+
+
+# Mixin that widens the default icontains search with full-text matches
+class FullTextSearchMixin:
+    # Name of the search source in analysis.search
+    search_source = None
+
+    def get_search_results(self, request, queryset, search_term):
+        matches, may_have_duplicates = super().get_search_results(request, queryset, search_term)
+        if search_term:
+            ids = search.matching_ids(self.search_source, search_term)
+            matches = queryset.filter(Q(pk__in=matches.values('pk')) | Q(pk__in=ids))
+        return matches, may_have_duplicates
 
 # Customize the admin interface for the User model
 @admin.register(User)
@@ -23,7 +38,7 @@ class CustomUserAdmin(UserAdmin):
     # Define fieldsets for displaying and editing user details
     fieldsets = (
         (None, {'fields': ('email', 'username', 'password')}),
-        ('Personal info', {'fields': ('account_type',)}),
+        ('Personal info', {'fields': ('account_type', 'token_quota')}),
         ('Permissions', {'fields': ('is_active', 'is_staff', 'is_superuser')}),
     )
     
@@ -41,7 +56,9 @@ class CustomUserAdmin(UserAdmin):
 
 # Customize the admin interface for the Document model
 @admin.register(Document)
-class DocumentAdmin(admin.ModelAdmin):
+class DocumentAdmin(FullTextSearchMixin, admin.ModelAdmin):
+    # Also match against the full-text index over title and content
+    search_source = 'documents'
     # Specify the fields to be displayed in the list view
     list_display = ('title', 'user', 'status', 'upload_date')
     # Add filters based on these fields in the list view
@@ -64,7 +81,8 @@ class AnalysisAdmin(admin.ModelAdmin):
     ordering = ('-created_at',)
 
 @admin.register(DocumentAnalysis)
-class DocumentAnalysisAdmin(admin.ModelAdmin):
+class DocumentAnalysisAdmin(FullTextSearchMixin, admin.ModelAdmin):
+    search_source = 'analyses'
     list_display = ('user', 'created_at')
     list_filter = ('created_at',)
     search_fields = ('user__username',)
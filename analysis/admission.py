@@ -0,0 +1,241 @@
+"""
+Cross-process admission control for expensive work.
+
+Each pool in ``settings.ADMISSION_POOLS`` ('extraction' for OCR and document
+parsing, 'llm' for model calls) allows ``LIMIT`` jobs to run at once across
+every worker process sharing the database. Jobs over the limit queue in
+arrival order; once ``MAX_QUEUE`` jobs are waiting, or a job has waited
+``WAIT_TIMEOUT`` seconds, new work is rejected with ``AdmissionRejected`` so
+the views can answer 503 with ``Retry-After`` instead of piling up.
+
+Slots are ``AdmissionTicket`` rows. Promotion from waiting to running happens
+while holding the pool's ``AdmissionPool`` row lock, so two processes can never
+both take the last slot. Tickets expire after ``LEASE`` seconds, which frees
+the slots of processes that died while holding them.
+"""
+import asyncio
+import logging
+import math
+import time
+from contextlib import asynccontextmanager, contextmanager
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from . import metrics, tracing
+from .models import AdmissionPool, AdmissionTicket
+
+logger = logging.getLogger(__name__)
+
+POLL_INTERVAL = 0.05
+MAX_POLL_INTERVAL = 0.5
+
+
+class AdmissionRejected(Exception):
+    """
+    A pool is saturated; the client should retry after ``retry_after`` seconds.
+    """
+
+    def __init__(self, pool, retry_after):
+        super().__init__(f'Too many {pool} jobs in progress; retry in {math.ceil(retry_after)}s')
+        self.pool = pool
+        self.retry_after = retry_after
+
+
+def pool_config(pool):
+    return settings.ADMISSION_POOLS[pool]
+
+
+def enabled():
+    return getattr(settings, 'ADMISSION_CONTROL', True)
+
+
+def queue_depth(pool):
+    """
+    ``(waiting, running)`` job counts for ``pool`` across all processes.
+    """
+    now = timezone.now()
+    live = AdmissionTicket.objects.filter(pool=pool, expires_at__gt=now)
+    return live.filter(state='waiting').count(), live.filter(state='running').count()
+
+
+def _retry_after(pool, waiting):
+    """
+    Rough time until a slot frees up, from the average hold time seen here.
+    """
+    config = pool_config(pool)
+    snapshot = metrics.histogram('admission_hold_seconds', {'pool': pool}).snapshot()
+    average_hold = snapshot['sum'] / snapshot['count'] if snapshot['count'] else 1.0
+    return max(1.0, average_hold * (waiting + 1) / config['LIMIT'])
+
+
+def _lock_pool(pool, now):
+    # Writing the pool row takes its lock (and SQLite's write lock), so slots
+    # in a pool are handed out one at a time.
+    AdmissionPool.objects.filter(name=pool).update(updated_at=now)
+
+
+def _enqueue(pool):
+    """
+    Create a ticket for ``pool``: running straight away if a slot is free and
+    nobody is queued, waiting otherwise.
+    """
+    config = pool_config(pool)
+    now = timezone.now()
+    AdmissionPool.objects.get_or_create(name=pool)
+    AdmissionTicket.objects.filter(pool=pool, expires_at__lte=now).delete()
+    with transaction.atomic():
+        _lock_pool(pool, now)
+        waiting, running = queue_depth(pool)
+        metrics.gauge('admission_queue_depth', {'pool': pool}).set(waiting)
+        metrics.gauge('admission_running', {'pool': pool}).set(running)
+        if not waiting and running < config['LIMIT']:
+            state = 'running'
+        elif waiting >= config['MAX_QUEUE']:
+            raise AdmissionRejected(pool, _retry_after(pool, waiting))
+        else:
+            state = 'waiting'
+        return AdmissionTicket.objects.create(
+            pool=pool, state=state, created_at=now, expires_at=now + timedelta(seconds=config['LEASE'])
+        )
+
+
+def _has_slot(ticket, limit, now):
+    """
+    Whether a slot is free and nobody is ahead of ``ticket``.
+    """
+    live = AdmissionTicket.objects.filter(pool=ticket.pool, expires_at__gt=now)
+    running = live.filter(state='running').count()
+    ahead = live.filter(state='waiting', pk__lt=ticket.pk).count()
+    return running + ahead < limit
+
+
+def _try_promote(ticket):
+    """
+    Move ``ticket`` to running if a slot is free and nobody is ahead of it.
+    """
+    limit = pool_config(ticket.pool)['LIMIT']
+    now = timezone.now()
+    # Most polls find the pool still full: check with a plain read first and
+    # only take the pool lock, on SQLite the database-wide write lock, to
+    # claim a slot. (Outside the transaction: SQLite cannot upgrade a read
+    # transaction to a write once another write has committed.)
+    if not _has_slot(ticket, limit, now):
+        return False
+    with transaction.atomic():
+        _lock_pool(ticket.pool, now)
+        if not _has_slot(ticket, limit, now):
+            return False
+        lease = timedelta(seconds=pool_config(ticket.pool)['LEASE'])
+        return bool(AdmissionTicket.objects.filter(pk=ticket.pk, state='waiting').update(
+            state='running', expires_at=now + lease
+        ))
+
+
+def _give_up(ticket):
+    AdmissionTicket.objects.filter(pk=ticket.pk).delete()
+    waiting, _ = queue_depth(ticket.pool)
+    raise AdmissionRejected(ticket.pool, _retry_after(ticket.pool, waiting))
+
+
+def _release(ticket, admitted_at):
+    AdmissionTicket.objects.filter(pk=ticket.pk).delete()
+    if admitted_at is not None:
+        metrics.histogram('admission_hold_seconds', {'pool': ticket.pool}).observe(
+            time.monotonic() - admitted_at
+        )
+
+
+def _observe_wait(pool, started):
+    waited = time.monotonic() - started
+    metrics.histogram('admission_wait_seconds', {'pool': pool}).observe(waited)
+    tracing.add_span('admission.wait', waited, pool=pool)
+
+
+@contextmanager
+def admit(pool):
+    """
+    Hold a slot in ``pool`` for the duration of the block.
+
+    Blocks while the pool is full; raises ``AdmissionRejected`` when the
+    queue is too long or the wait exceeds the pool's ``WAIT_TIMEOUT``.
+    """
+    if not enabled():
+        yield
+        return
+    started = time.monotonic()
+    deadline = started + pool_config(pool)['WAIT_TIMEOUT']
+    ticket = _enqueue(pool)
+    admitted_at = None
+    try:
+        interval = POLL_INTERVAL
+        while ticket.state != 'running' and not _try_promote(ticket):
+            if time.monotonic() >= deadline:
+                _give_up(ticket)
+            time.sleep(interval)
+            interval = min(interval * 2, MAX_POLL_INTERVAL)
+        admitted_at = time.monotonic()
+        _observe_wait(pool, started)
+        yield
+    finally:
+        _release(ticket, admitted_at)
+
+
+@asynccontextmanager
+async def aadmit(pool):
+    """
+    Async ``admit``; waits without holding a thread.
+    """
+    if not enabled():
+        yield
+        return
+    started = time.monotonic()
+    deadline = started + pool_config(pool)['WAIT_TIMEOUT']
+    ticket = await sync_to_async(_enqueue)(pool)
+    admitted_at = None
+    try:
+        interval = POLL_INTERVAL
+        while ticket.state != 'running' and not await sync_to_async(_try_promote)(ticket):
+            if time.monotonic() >= deadline:
+                await sync_to_async(_give_up)(ticket)
+            await asyncio.sleep(interval)
+            interval = min(interval * 2, MAX_POLL_INTERVAL)
+        admitted_at = time.monotonic()
+        _observe_wait(pool, started)
+        yield
+    finally:
+        # Shielded so a cancelled request still gives its slot back
+        await asyncio.shield(sync_to_async(_release)(ticket, admitted_at))
+
+
+def update_gauges():
+    """
+    Refresh the queue depth gauges of every pool from the shared tables, so
+    a scrape of any one process sees the depth across all of them.
+    """
+    for pool in settings.ADMISSION_POOLS:
+        waiting, running = queue_depth(pool)
+        metrics.gauge('admission_queue_depth', {'pool': pool}).set(waiting)
+        metrics.gauge('admission_running', {'pool': pool}).set(running)
+
+
+def pool_stats():
+    """
+    Limits and current depth of every pool, for the admin endpoint.
+    """
+    stats = {}
+    for pool, config in settings.ADMISSION_POOLS.items():
+        waiting, running = queue_depth(pool)
+        wait = metrics.histogram('admission_wait_seconds', {'pool': pool})
+        stats[pool] = {
+            'limit': config['LIMIT'],
+            'max_queue': config['MAX_QUEUE'],
+            'running': running,
+            'waiting': waiting,
+            'wait_p50_seconds': wait.quantile(0.5),
+            'wait_p95_seconds': wait.quantile(0.95),
+        }
+    return stats
@@ -0,0 +1,166 @@
+"""
+Native async views for the LLM-bound endpoints.
+
+DRF function views are sync, so under ASGI every in-flight OpenAI call would
+pin a thread. These views are plain Django coroutines: the upstream call is
+awaited on the async OpenAI client and the ORM is used through its async API,
+so a single worker can keep hundreds of analyses in flight. They accept the
+same JWT bearer tokens and return the same payloads as their DRF
+counterparts in ``views.py``.
+
+On Django 5.0+ a client disconnect cancels the running view, and with it the
+pending model call, so abandoned requests stop spending tokens.
+"""
+import json
+import math
+from functools import wraps
+
+from django.http import JsonResponse, StreamingHttpResponse
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken, TokenError
+
+from . import admission, authentication, coalesce, idempotency, llm, notifications, services, usage
+
+
+async def authenticate(request, query_token=False):
+    """
+    Resolve the request's JWT bearer token to an active user, or None. With
+    ``query_token`` the token may come in the ``access_token`` query
+    parameter instead, for ``EventSource``, which cannot send headers.
+    """
+    auth = JWTAuthentication()
+    header = auth.get_header(request)
+    if header is not None:
+        raw_token = auth.get_raw_token(header)
+    elif query_token and request.GET.get('access_token'):
+        raw_token = request.GET['access_token'].encode('utf-8')
+    else:
+        return None
+    if raw_token is None:
+        return None
+    validated_token = auth.get_validated_token(raw_token)
+    try:
+        return await authentication.aget_user(validated_token)
+    except AuthenticationFailed:
+        return None
+
+
+def jwt_required(*methods, query_token=False):
+    """
+    Async counterpart of ``@api_view(methods)`` + ``IsAuthenticated``.
+    """
+    def decorator(view):
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            if request.method not in methods:
+                return JsonResponse({'detail': f'Method "{request.method}" not allowed.'}, status=405)
+            try:
+                user = await authenticate(request, query_token)
+            except (InvalidToken, TokenError):
+                return JsonResponse({
+                    'detail': 'Given token not valid for any token type',
+                    'code': 'token_not_valid',
+                }, status=401)
+            if user is None:
+                return JsonResponse({'detail': 'Authentication credentials were not provided.'}, status=401)
+            request.user = user
+            return await view(request, *args, **kwargs)
+        # Token auth, like the DRF views; there is no session cookie to protect.
+        wrapper.csrf_exempt = True
+        return wrapper
+    return decorator
+
+
+def request_data(request):
+    """
+    Parse a JSON or form body the way DRF's ``request.data`` would.
+    """
+    if request.content_type == 'application/json':
+        try:
+            return json.loads(request.body or b'{}')
+        except ValueError:
+            return {}
+    return request.POST
+
+
+@jwt_required('POST')
+@idempotency.aidempotent
+async def analyze_text(request):
+    """
+    Analyze the provided text using OpenAI and return the analysis result.
+    """
+    data = request_data(request)
+    # A JSON list or scalar has no 'text' either
+    text = data.get('text') if isinstance(data, dict) else None
+    if not text:
+        return JsonResponse({
+            'error': 'No text provided for analysis',
+            'message': 'Please provide text to analyze'
+        }, status=400)
+    try:
+        analysis = await services.aanalyze_contract(request.user, text)
+    except llm.CircuitOpenError as circuit_error:
+        response = JsonResponse({
+            'error': str(circuit_error),
+            'message': 'The analysis service is temporarily unavailable'
+        }, status=503)
+        response['Retry-After'] = str(math.ceil(circuit_error.retry_after))
+        return response
+    except admission.AdmissionRejected as rejected:
+        response = JsonResponse({
+            'error': str(rejected),
+            'message': 'The analysis service is busy, please retry shortly'
+        }, status=503)
+        response['Retry-After'] = str(math.ceil(rejected.retry_after))
+        return response
+    except usage.RequestTooLarge as too_large:
+        return JsonResponse({
+            'error': str(too_large),
+            'message': 'This contract is too large for your analysis quota'
+        }, status=413)
+    except usage.QuotaExceeded as quota_error:
+        response = JsonResponse({
+            'error': str(quota_error),
+            'message': 'You have used your analysis quota for now'
+        }, status=429)
+        response['Retry-After'] = str(math.ceil(quota_error.retry_after))
+        return response
+    except coalesce.CoalescedAnalysisError as shared_error:
+        return JsonResponse({
+            'error': str(shared_error),
+            'message': 'The analysis service could not analyze this text'
+        }, status=502)
+    except Exception as openai_error:
+        error_message = str(openai_error)
+        if "api key" in error_message.lower():
+            error_message = "Invalid or missing OpenAI API key"
+        elif "model" in error_message.lower():
+            error_message = "Invalid model configuration"
+        return JsonResponse({
+            'error': error_message,
+            'message': 'Failed to analyze text due to API error'
+        }, status=500)
+    return JsonResponse({
+        'result': analysis.analysis_result,
+        'preflight': analysis.preflight,
+        'message': 'Analysis completed successfully'
+    }, status=200)
+
+
+@jwt_required('GET', query_token=True)
+async def notification_stream(request):
+    """
+    Push the user's new notifications, with their unread count, as Server-Sent Events.
+    """
+    if not hasattr(request, 'scope'):
+        return JsonResponse({'detail': 'Notification streaming needs the ASGI server'}, status=501)
+    last_event_id = request.headers.get('Last-Event-ID') or request.GET.get('last_event_id')
+    try:
+        last_event_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        last_event_id = None
+    response = StreamingHttpResponse(notifications.stream(request.user, last_event_id), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Stop nginx from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
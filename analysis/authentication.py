@@ -0,0 +1,207 @@
+"""
+JWT authentication from signed token claims, without a user query per request.
+
+Tokens issued by ``/api/token/`` and ``/api/register/`` carry the user fields
+requests and permission checks need (``USER_CLAIMS``) plus ``user_state_at``,
+the time they were read. ``ClaimsJWTAuthentication`` builds ``request.user``
+from them: a ``User`` with only those fields loaded and the rest deferred, so
+a view that needs, say, the password hash loads it on access. The claims may
+be a poll interval out of date, so such a user refuses ``save()`` without
+``update_fields``: it writes only what the view changed.
+
+Claims are trusted unless the user changed after they were read. Changes
+are learnt from the ``profile`` version counters (``analysis.versions``),
+which every ``User`` save and delete bumps: each process polls for counters
+bumped since its last poll, one query every ``USER_CACHE['POLL_INTERVAL']``
+seconds however many requests it serves, and drops its own cache entry at
+once when it saves the user itself (an admin PATCH or DELETE, a password
+change). A changed user's state is read from the database once and kept in
+a per-process LRU until it changes again, so deactivating or demoting a user
+takes effect within a poll interval even for tokens issued before.
+"""
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from .models import ResourceVersion, User
+
+# token_quota is read by every analysis's quota check
+USER_CLAIMS = ('email', 'username', 'account_type', 'is_active', 'is_staff', 'token_quota')
+STATE_CLAIM = 'user_state_at'
+# Re-read counters bumped this long before the last poll, in case their
+# transaction committed after it
+FEED_OVERLAP = 60
+
+
+def add_claims(token, user):
+    """
+    Add the user's state to a refresh token; access tokens made from it copy them.
+    """
+    for name in USER_CLAIMS:
+        token[name] = getattr(user, name)
+    token[STATE_CLAIM] = int(time.time())
+    return token
+
+
+class UserStates:
+    """
+    Which users changed recently, and an LRU of their current state.
+    """
+
+    def __init__(self, max_size, poll_interval, window):
+        self.max_size = max_size
+        self.poll_interval = poll_interval
+        # Refresh tokens live this long, and access tokens copy their claims
+        self.window = window
+        self.states = OrderedDict()
+        self.changed = {}
+        self.since = None
+        self.polled_at = None
+        self._lock = threading.Lock()
+
+    def due(self):
+        return self.polled_at is None or time.monotonic() - self.polled_at >= self.poll_interval
+
+    def poll(self):
+        """
+        Note users whose ``profile`` counter was bumped since the last poll.
+        """
+        now = time.time()
+        since = self.since if self.since is not None else now - self.window
+        rows = ResourceVersion.objects.filter(
+            key__startswith='profile:', updated_at__gt=datetime.fromtimestamp(since, timezone.utc)
+        ).values_list('key', 'updated_at')
+        with self._lock:
+            for key, updated_at in rows:
+                self._mark(int(key.split(':', 1)[1]), updated_at.timestamp())
+            # Tokens with claims older than the window have expired
+            self.changed = {user_id: at for user_id, at in self.changed.items() if at > now - self.window}
+            self.since = now - FEED_OVERLAP
+            self.polled_at = time.monotonic()
+
+    def _mark(self, user_id, at):
+        if at > self.changed.get(user_id, 0):
+            self.changed[user_id] = at
+            entry = self.states.get(user_id)
+            if entry is not None and entry[0] < at:
+                del self.states[user_id]
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._mark(user_id, time.time())
+
+    def lookup(self, user_id, claims):
+        """
+        ``(True, state)`` if the user's state is known without a query (from
+        ``claims`` or the cache; state None for a deleted user), else
+        ``(False, None)``.
+        """
+        with self._lock:
+            entry = self.states.get(user_id)
+            if entry is not None:
+                self.states.move_to_end(user_id)
+                return True, entry[1]
+            changed_at = self.changed.get(user_id, 0)
+        state_at = claims.get(STATE_CLAIM)
+        if state_at is not None and state_at > changed_at and all(name in claims for name in USER_CLAIMS):
+            return True, {name: claims[name] for name in USER_CLAIMS}
+        return False, None
+
+    def load(self, user_id):
+        """
+        Read the user's state from the database and cache it.
+        """
+        read_at = time.time()
+        state = User.objects.filter(pk=user_id).values(*USER_CLAIMS).first()
+        with self._lock:
+            # A change noted while reading may not be in what was read
+            if self.changed.get(user_id, 0) < read_at:
+                self.states[user_id] = (read_at, state)
+                self.states.move_to_end(user_id)
+                while len(self.states) > self.max_size:
+                    self.states.popitem(last=False)
+        return state
+
+    def clear(self):
+        with self._lock:
+            self.states.clear()
+            self.changed.clear()
+            self.since = self.polled_at = None
+
+
+def _config():
+    return getattr(settings, 'USER_CACHE', {})
+
+
+user_states = UserStates(
+    max_size=_config().get('MAX_SIZE', 10000),
+    poll_interval=_config().get('POLL_INTERVAL', 5.0),
+    window=api_settings.REFRESH_TOKEN_LIFETIME.total_seconds(),
+)
+
+
+def build_user(user_id, state):
+    """
+    A ``User`` for ``state``, or AuthenticationFailed for a deleted or
+    inactive user.
+    """
+    if state is None:
+        raise AuthenticationFailed(_('User not found'), code='user_not_found')
+    if not state['is_active']:
+        raise AuthenticationFailed(_('User is inactive'), code='user_inactive')
+    # Fields other than the claims are deferred and loaded on first access;
+    # from_db takes the loaded values in field order
+    values = dict(state, id=user_id)
+    fields = [field.attname for field in User._meta.concrete_fields if field.attname in values]
+    user = User.from_db('default', fields, [values[name] for name in fields])
+    user.from_claims = True
+    return user
+
+
+def _user_id(validated_token):
+    try:
+        # Tokens carry the id as a string
+        return User._meta.pk.to_python(validated_token[api_settings.USER_ID_CLAIM])
+    except (KeyError, ValidationError):
+        raise InvalidToken(_('Token contained no recognizable user identification'))
+
+
+def get_user(validated_token):
+    user_id = _user_id(validated_token)
+    if user_states.due():
+        user_states.poll()
+    known, state = user_states.lookup(user_id, validated_token.payload)
+    if not known:
+        state = user_states.load(user_id)
+    return build_user(user_id, state)
+
+
+async def aget_user(validated_token):
+    """
+    Async ``get_user``; only polling and cache misses leave the event loop.
+    """
+    user_id = _user_id(validated_token)
+    if user_states.due():
+        await sync_to_async(user_states.poll)()
+    known, state = user_states.lookup(user_id, validated_token.payload)
+    if not known:
+        state = await sync_to_async(user_states.load)(user_id)
+    return build_user(user_id, state)
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    """
+    ``JWTAuthentication`` that takes the user from the token's claims.
+    """
+
+    def get_user(self, validated_token):
+        return get_user(validated_token)
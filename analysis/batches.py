@@ -0,0 +1,267 @@
+"""
+Batch analysis of many contracts at once.
+
+A batch is a list of the user's document ids or the files of an uploaded zip
+archive. Items run on a shared thread pool of ``BATCH_CONCURRENCY`` workers,
+so a batch of N contracts takes about as long as its slowest one (up to the
+pool size) instead of the sum of all of them. Extraction and model calls
+still pass through admission control and the user's token quota, so a large
+batch cannot starve interactive requests. Progress is kept on the
+``AnalysisBatch`` row and can be polled while the batch runs.
+
+An uploaded archive is spooled to a temporary file and each job reads its
+own member when it starts, so memory holds at most one decompressed file per
+worker, and the declared sizes of all members are checked against
+``BATCH_MAX_ARCHIVE_SIZE`` before anything is decompressed.
+
+Batches run inside the web process: items left unfinished by a restart are
+marked failed when the batch is read after ``BATCH_STALE_AFTER`` seconds
+without any of its items starting or finishing.
+"""
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, connection
+from django.db.models import F, Max
+from django.utils import timezone
+
+from . import admission, services, tracing, versions
+from .extraction import SUPPORTED_EXTENSIONS, extract_pages, file_hash, join_pages
+from .models import AnalysisBatch, AnalysisBatchItem, Document
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+class BatchError(ValueError):
+    """
+    The batch request itself is invalid (too many items, bad archive).
+    """
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'BATCH_CONCURRENCY', 8),
+                thread_name_prefix='analysis-batch',
+            )
+        return _executor
+
+
+class Archive:
+    """
+    A zip upload spooled to disk. Batch jobs read their member when they
+    start, and the file is removed when the last of them is done.
+    """
+
+    def __init__(self, path, names):
+        self.path = path
+        self.names = names
+        self._pending = len(names)
+        self._lock = threading.Lock()
+
+    def read(self, name):
+        with zipfile.ZipFile(self.path) as zf:
+            return zf.read(name)
+
+    def release(self):
+        """
+        Note that one member's job is done.
+        """
+        with self._lock:
+            self._pending -= 1
+            if self._pending > 0:
+                return
+        self.close()
+
+    def close(self):
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+
+def read_archive(archive):
+    """
+    An ``Archive`` of the supported files in a zip upload.
+    """
+    max_items = getattr(settings, 'BATCH_MAX_ITEMS', 100)
+    max_file_size = getattr(settings, 'BATCH_MAX_FILE_SIZE', 20 * 1024 * 1024)
+    max_archive_size = getattr(settings, 'BATCH_MAX_ARCHIVE_SIZE', 200 * 1024 * 1024)
+    spooled = tempfile.NamedTemporaryFile(prefix='analysis-batch-', suffix='.zip', delete=False)
+    try:
+        with spooled:
+            shutil.copyfileobj(archive, spooled)
+        with zipfile.ZipFile(spooled.name) as zf:
+            members = [
+                info for info in zf.infolist()
+                if not info.is_dir()
+                and not info.filename.startswith('__MACOSX/')
+                and not os.path.basename(info.filename).startswith('.')
+                and info.filename.lower().rsplit('.', 1)[-1] in SUPPORTED_EXTENSIONS
+            ]
+        if len(members) > max_items:
+            raise BatchError(f'An archive may contain at most {max_items} files')
+        for info in members:
+            if info.file_size > max_file_size:
+                raise BatchError(f'{info.filename} is larger than {max_file_size // (1024 * 1024)}MB')
+        # zipfile stops at the declared size, so these bound what can be decompressed
+        if sum(info.file_size for info in members) > max_archive_size:
+            raise BatchError(f'The archive unpacks to more than {max_archive_size // (1024 * 1024)}MB')
+        return Archive(spooled.name, [info.filename for info in members])
+    except zipfile.BadZipFile:
+        os.unlink(spooled.name)
+        raise BatchError('The uploaded file is not a valid zip archive')
+    except BaseException:
+        os.unlink(spooled.name)
+        raise
+
+
+def create_batch(user, document_ids=None, archive=None):
+    """
+    Create a batch for ``document_ids`` or the members of ``archive`` and start it.
+    """
+    max_items = getattr(settings, 'BATCH_MAX_ITEMS', 100)
+    document_ids = list(dict.fromkeys(document_ids or []))
+    names = archive.names if archive is not None else []
+    total = len(document_ids) + len(names)
+    if archive is not None and not (names and total <= max_items):
+        # No job will read it
+        archive.close()
+    if not total:
+        raise BatchError('Provide document_ids or a zip archive of contracts')
+    if total > max_items:
+        raise BatchError(f'A batch may contain at most {max_items} contracts')
+
+    batch = AnalysisBatch.objects.create(user=user, total=total)
+    owned = Document.objects.filter(user=user, pk__in=document_ids).in_bulk()
+    items = AnalysisBatchItem.objects.bulk_create(
+        [AnalysisBatchItem(batch=batch, document=owned.get(doc_id), source=str(doc_id)) for doc_id in document_ids]
+        + [AnalysisBatchItem(batch=batch, source=name[:255]) for name in names]
+    )
+    members = [None] * len(document_ids) + names
+    executor = get_executor()
+    for item, member in zip(items, members):
+        executor.submit(_run_item, item.pk, archive if member is not None else None, member)
+    return batch
+
+
+def _finish_item(item, **fields):
+    finished = AnalysisBatchItem.objects.filter(pk=item.pk, status__in=['pending', 'running']).update(
+        finished_at=timezone.now(), **fields
+    )
+    if not finished:
+        # Already failed by expire_orphans; it was counted then
+        return
+    counter = 'completed' if fields['status'] == 'done' else 'failed'
+    AnalysisBatch.objects.filter(pk=item.batch_id).update(**{counter: F(counter) + 1})
+    AnalysisBatch.objects.filter(
+        pk=item.batch_id, status='running', total__lte=F('completed') + F('failed')
+    ).update(status='done', finished_at=timezone.now())
+
+
+def _run_item(item_id, archive=None, member=None):
+    close_old_connections()
+    try:
+        # Each item is its own trace: it outlives the request that created the batch
+        with tracing.trace('batch.item', **{'batch.item_id': item_id}):
+            _process_item(item_id, archive, member)
+    finally:
+        if archive is not None:
+            archive.release()
+
+
+def _process_item(item_id, archive, member):
+    try:
+        item = AnalysisBatchItem.objects.select_related('batch__user', 'document').get(pk=item_id)
+        started = AnalysisBatchItem.objects.filter(pk=item.pk, status='pending').update(
+            status='running', started_at=timezone.now()
+        )
+        if not started:
+            return
+        try:
+            user = item.batch.user
+            document, pages = item.document, None
+            if member is not None:
+                payload = archive.read(member)
+                with admission.admit('extraction'):
+                    pages = extract_pages(ContentFile(payload, name=item.source))
+                document = Document.objects.create(
+                    title=os.path.basename(item.source), content=join_pages(pages),
+                    content_hash=file_hash(payload), user=user
+                )
+                AnalysisBatchItem.objects.filter(pk=item.pk).update(document=document)
+            elif document is None:
+                raise LookupError('Document not found')
+            analysis = services.analyze_contract(user, document.content, pages)
+            Document.objects.filter(pk=document.pk).update(status='analyzed')
+            versions.bump('documents', user.pk)
+        except Exception as e:
+            logger.warning('Batch %s item %s failed: %s', item.batch_id, item.source, e)
+            _finish_item(item, status='failed', error=str(e)[:1000])
+        else:
+            _finish_item(item, status='done', analysis=analysis)
+    except Exception:
+        logger.exception('Batch item %s could not be recorded', item_id)
+    finally:
+        connection.close()
+
+
+def expire_orphans(batch):
+    """
+    Fail the unfinished items of a batch none of whose items has started or
+    finished for longer than any item could run, i.e. whose worker process
+    is gone.
+    """
+    if batch.status != 'running':
+        return batch
+    stale_after = getattr(settings, 'BATCH_STALE_AFTER', 3600)
+    progress = batch.items.aggregate(started=Max('started_at'), finished=Max('finished_at'))
+    last_progress = max(at for at in (batch.created_at, progress['started'], progress['finished']) if at)
+    if (timezone.now() - last_progress).total_seconds() < stale_after:
+        return batch
+    for item in batch.items.filter(status__in=['pending', 'running']):
+        _finish_item(item, status='failed', error='Interrupted by a server restart')
+    batch.refresh_from_db()
+    return batch
+
+
+def progress(batch, include_results=True):
+    """
+    Response payload describing ``batch`` and each of its items.
+    """
+    items = batch.items.select_related('analysis')
+    return {
+        'id': batch.id,
+        'status': batch.status,
+        'total': batch.total,
+        'completed': batch.completed,
+        'failed': batch.failed,
+        'pending': batch.total - batch.completed - batch.failed,
+        'created_at': batch.created_at,
+        'finished_at': batch.finished_at,
+        'items': [{
+            'id': item.id,
+            'source': item.source,
+            'document_id': item.document_id,
+            'status': item.status,
+            'analysis_id': item.analysis_id,
+            'result': item.analysis.analysis_result if include_results and item.analysis else None,
+            'error': item.error or None,
+            'seconds': (
+                round((item.finished_at - item.started_at).total_seconds(), 2)
+                if item.started_at and item.finished_at else None
+            ),
+        } for item in items],
+    }
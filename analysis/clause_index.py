@@ -0,0 +1,291 @@
+"""
+Local similar-clause retrieval index.
+
+Clauses are embedded with hashed TF-IDF: unigrams and bigrams are hashed into
+a large document-frequency table for IDF weighting, then folded with a signed
+hash into a small dense vector and L2-normalised, so cosine similarity is a
+plain dot product. No model download or GPU is needed.
+
+Rows are stored in a single append-only file of fixed-size records
+``(clause id, owner id, float32 vector)`` that is memory-mapped for queries,
+so the index costs ``16 + 4 * dims`` bytes per clause on disk and only the
+pages being scanned in memory. float32 is kept over float16 because the
+half-precision conversion costs more than the BLAS dot product itself. Deletions are recorded as tombstones and
+dropped by ``compact()``, which rewrites the file and swaps it in atomically.
+Writers serialise on an ``flock`` so several worker processes can add to the
+same index.
+"""
+import fcntl
+import json
+import math
+import os
+import re
+import zlib
+from collections import Counter
+from contextlib import contextmanager
+
+import numpy as np
+
+DEFAULT_DIMENSIONS = 256
+# Buckets in the document-frequency table used for IDF weights.
+DF_BUCKETS = 1 << 20
+# Rows scored per step; bounds the float32 scratch space used by a query.
+QUERY_CHUNK_ROWS = 1 << 16
+
+TOKEN_RE = re.compile(r'[a-z0-9]{2,}')
+
+
+def tokenize(text):
+    """
+    Lower-cased word unigrams and bigrams of a clause.
+    """
+    words = TOKEN_RE.findall(text.lower())
+    return words + [f'{a} {b}' for a, b in zip(words, words[1:])]
+
+
+def _hash(token):
+    return zlib.crc32(token.encode('utf-8'))
+
+
+class ClauseIndex:
+    """
+    Dense hashed TF-IDF vectors for clauses, stored in memory-mapped NumPy arrays.
+    """
+
+    def __init__(self, path, dimensions=DEFAULT_DIMENSIONS):
+        self.path = path
+        self.dimensions = dimensions
+        self.dtype = np.dtype([
+            ('id', '<i8'),
+            ('owner', '<i8'),
+            ('vector', '<f4', (dimensions,)),
+        ])
+        os.makedirs(path, exist_ok=True)
+        self._rows_file = os.path.join(path, 'clauses.bin')
+        self._tombstones_file = os.path.join(path, 'tombstones.i64')
+        self._df_file = os.path.join(path, 'df.i32')
+        self._meta_file = os.path.join(path, 'meta.json')
+        self._lock_file = os.path.join(path, 'index.lock')
+        self._check_meta()
+        self._rows = None
+        self._rows_key = None
+        self._tombstones = None
+        self._tombstones_key = None
+
+    def _check_meta(self):
+        if os.path.exists(self._meta_file):
+            with open(self._meta_file) as f:
+                meta = json.load(f)
+            if meta['dimensions'] != self.dimensions:
+                raise ValueError(
+                    f"Clause index at {self.path} has {meta['dimensions']} dimensions, "
+                    f"not {self.dimensions}"
+                )
+        else:
+            self._write_meta({'dimensions': self.dimensions, 'documents': 0})
+
+    def _read_meta(self):
+        with open(self._meta_file) as f:
+            return json.load(f)
+
+    def _write_meta(self, meta):
+        tmp = self._meta_file + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(meta, f)
+        os.replace(tmp, self._meta_file)
+
+    @contextmanager
+    def _locked(self):
+        with open(self._lock_file, 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _document_frequencies(self, mode='r'):
+        if not os.path.exists(self._df_file):
+            np.zeros(DF_BUCKETS, dtype=np.int32).tofile(self._df_file)
+        return np.memmap(self._df_file, dtype=np.int32, mode=mode, shape=(DF_BUCKETS,))
+
+    # Embedding
+
+    def embed(self, texts, update_frequencies=False):
+        """
+        Embed texts as a float32 array of shape ``(len(texts), dimensions)``.
+
+        With ``update_frequencies`` the texts are counted into the IDF table
+        first; callers must hold the writer lock.
+        """
+        token_counts = [Counter(_hash(token) for token in tokenize(text)) for text in texts]
+        df = self._document_frequencies(mode='r+' if update_frequencies else 'r')
+        meta = self._read_meta()
+        if update_frequencies:
+            for counts in token_counts:
+                buckets = np.fromiter((h % DF_BUCKETS for h in counts), dtype=np.int64, count=len(counts))
+                df[np.unique(buckets)] += 1
+            df.flush()
+            meta['documents'] += len(texts)
+            self._write_meta(meta)
+        documents = meta['documents']
+
+        vectors = np.zeros((len(texts), self.dimensions), dtype=np.float32)
+        for row, counts in enumerate(token_counts):
+            if not counts:
+                continue
+            hashes = np.fromiter(counts.keys(), dtype=np.int64, count=len(counts))
+            tf = 1.0 + np.log(np.fromiter(counts.values(), dtype=np.float32, count=len(counts)))
+            idf = np.log((1.0 + documents) / (1.0 + df[hashes % DF_BUCKETS])) + 1.0
+            # The high bit of the hash is independent of the bucket bits and
+            # picks the sign, so colliding tokens cancel out instead of piling up.
+            signs = np.where(hashes & 0x80000000, 1.0, -1.0)
+            np.add.at(vectors[row], hashes % self.dimensions, signs * tf * idf)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        np.divide(vectors, norms, out=vectors, where=norms > 0)
+        return vectors
+
+    # Storage
+
+    def _mapped_rows(self):
+        try:
+            stat = os.stat(self._rows_file)
+        except FileNotFoundError:
+            return np.zeros(0, dtype=self.dtype)
+        key = (stat.st_ino, stat.st_size)
+        if key != self._rows_key:
+            count = stat.st_size // self.dtype.itemsize
+            if count:
+                self._rows = np.memmap(self._rows_file, dtype=self.dtype, mode='r', shape=(count,))
+            else:
+                self._rows = np.zeros(0, dtype=self.dtype)
+            self._rows_key = key
+        return self._rows
+
+    def _deleted_ids(self):
+        try:
+            stat = os.stat(self._tombstones_file)
+        except FileNotFoundError:
+            return None
+        key = (stat.st_ino, stat.st_size)
+        if key != self._tombstones_key:
+            ids = np.fromfile(self._tombstones_file, dtype='<i8')
+            self._tombstones = np.unique(ids) if ids.size else None
+            self._tombstones_key = key
+        return self._tombstones
+
+    def __len__(self):
+        return len(self._mapped_rows())
+
+    def append_vectors(self, ids, owners, vectors):
+        """
+        Append pre-computed unit vectors; used by ``add`` and by benchmarks.
+        """
+        records = np.zeros(len(ids), dtype=self.dtype)
+        records['id'] = ids
+        records['owner'] = owners
+        records['vector'] = vectors
+        with open(self._rows_file, 'ab') as f:
+            f.write(records.tobytes())
+
+    def add(self, ids, owners, texts):
+        """
+        Embed and append clauses. ``owners`` are the user ids used for scoping.
+        """
+        if not len(ids):
+            return
+        with self._locked():
+            vectors = self.embed(texts, update_frequencies=True)
+            self.append_vectors(ids, owners, vectors)
+
+    def remove(self, ids):
+        """
+        Tombstone clauses; they stop matching at once and are dropped on compaction.
+        """
+        if not len(ids):
+            return
+        with self._locked():
+            with open(self._tombstones_file, 'ab') as f:
+                f.write(np.asarray(ids, dtype='<i8').tobytes())
+
+    def query(self, text, k=10, owner=None):
+        """
+        Return up to ``k`` ``(clause id, cosine similarity)`` pairs, best first.
+        """
+        rows = self._mapped_rows()
+        if not len(rows) or k <= 0:
+            return []
+        query_vector = self.embed([text])[0]
+        if not query_vector.any():
+            return []
+        deleted = self._deleted_ids()
+
+        best_scores = np.empty(0, dtype=np.float32)
+        best_ids = np.empty(0, dtype=np.int64)
+        for start in range(0, len(rows), QUERY_CHUNK_ROWS):
+            block = rows[start:start + QUERY_CHUNK_ROWS]
+            if owner is not None:
+                # Score only the owner's rows instead of masking the whole block.
+                block = block[block['owner'] == owner]
+                if not len(block):
+                    continue
+            scores = block['vector'] @ query_vector
+            ids = block['id']
+            if deleted is not None:
+                scores[np.isin(ids, deleted)] = -np.inf
+            if len(scores) > k:
+                top = np.argpartition(scores, -k)[-k:]
+                scores, ids = scores[top], ids[top]
+            best_scores = np.concatenate([best_scores, scores])
+            best_ids = np.concatenate([best_ids, ids])
+            if len(best_scores) > k:
+                top = np.argpartition(best_scores, -k)[-k:]
+                best_scores, best_ids = best_scores[top], best_ids[top]
+
+        order = np.argsort(-best_scores)
+        return [
+            (int(best_ids[i]), float(best_scores[i]))
+            for i in order if math.isfinite(best_scores[i])
+        ]
+
+    def clear(self):
+        """
+        Drop every row and reset the IDF statistics.
+        """
+        with self._locked():
+            for path in (self._rows_file, self._tombstones_file, self._df_file):
+                if os.path.exists(path):
+                    os.remove(path)
+            self._write_meta({'dimensions': self.dimensions, 'documents': 0})
+            self._rows_key = None
+            self._tombstones_key = None
+
+    def compact(self):
+        """
+        Rewrite the row file without tombstoned or superseded rows.
+
+        Returns the number of rows dropped.
+        """
+        with self._locked():
+            rows = self._mapped_rows()
+            deleted = self._deleted_ids()
+            keep = np.ones(len(rows), dtype=bool)
+            if deleted is not None:
+                keep &= ~np.isin(rows['id'], deleted)
+            # A clause re-added later supersedes its earlier rows.
+            _, last = np.unique(rows['id'][::-1], return_index=True)
+            latest = np.zeros(len(rows), dtype=bool)
+            latest[len(rows) - 1 - last] = True
+            keep &= latest
+
+            tmp = self._rows_file + '.tmp'
+            with open(tmp, 'wb') as f:
+                for start in range(0, len(rows), QUERY_CHUNK_ROWS):
+                    f.write(rows[start:start + QUERY_CHUNK_ROWS][keep[start:start + QUERY_CHUNK_ROWS]].tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self._rows_file)
+            if os.path.exists(self._tombstones_file):
+                os.remove(self._tombstones_file)
+            self._rows_key = None
+            self._tombstones_key = None
+            return int(len(rows) - keep.sum())
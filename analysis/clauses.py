@@ -0,0 +1,97 @@
+"""
+Clause extraction from analysis reports and the glue to the similarity index.
+"""
+import logging
+import re
+import threading
+
+from django.conf import settings
+
+from .models import Clause
+
+logger = logging.getLogger(__name__)
+
+# Matches the "Extracted Text (verbatim)" item of CONTRACT_PROMPT and the
+# "Risk Assessment" item that follows it within the same clause block.
+CLAUSE_RE = re.compile(r'Extracted Text \(verbatim\):\s*["“](.+?)["”]', re.DOTALL)
+RISK_RE = re.compile(r'Risk Assessment:\s*(.+)')
+RISK_LEVEL_RE = re.compile(r'\b(low|medium|high)\b', re.IGNORECASE)
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_index():
+    """
+    Return the process-wide clause index configured in settings.
+    """
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                # numpy is imported with the index, not at worker boot
+                from .clause_index import ClauseIndex
+                _index = ClauseIndex(settings.CLAUSE_INDEX_DIR, settings.CLAUSE_INDEX_DIMENSIONS)
+    return _index
+
+
+def extract_clauses(analysis_result):
+    """
+    Return ``(text, risk_level, risk_assessment)`` for every quoted clause in a report.
+    """
+    matches = list(CLAUSE_RE.finditer(analysis_result or ''))
+    clauses = []
+    for i, match in enumerate(matches):
+        text = ' '.join(match.group(1).split())
+        if not text:
+            continue
+        end = matches[i + 1].start() if i + 1 < len(matches) else len(analysis_result)
+        risk = RISK_RE.search(analysis_result, match.end(), end)
+        risk_assessment = risk.group(1).strip() if risk else ''
+        level = RISK_LEVEL_RE.search(risk_assessment)
+        clauses.append((text, level.group(1).lower() if level else 'unknown', risk_assessment))
+    return clauses
+
+
+def index_analysis(analysis):
+    """
+    Store the clauses of a saved DocumentAnalysis and add them to the index.
+
+    Indexing is best effort: a failure is logged and never fails the analysis.
+    """
+    try:
+        clauses = Clause.objects.bulk_create([
+            Clause(
+                analysis=analysis,
+                user_id=analysis.user_id,
+                position=position,
+                text=text,
+                risk_level=risk_level,
+                risk_assessment=risk_assessment,
+            )
+            for position, (text, risk_level, risk_assessment)
+            in enumerate(extract_clauses(analysis.analysis_result), start=1)
+        ])
+        if clauses and clauses[0].pk is None:
+            # Backends without RETURNING on bulk insert; fetch the ids back.
+            clauses = list(Clause.objects.filter(analysis=analysis))
+        get_index().add(
+            [clause.pk for clause in clauses],
+            [clause.user_id for clause in clauses],
+            [clause.text for clause in clauses],
+        )
+        return clauses
+    except Exception:
+        logger.exception('Failed to index clauses for analysis %s', analysis.pk)
+        return []
+
+
+def similar_clauses(text, k=10, user_id=None):
+    """
+    Return the ``k`` stored clauses most similar to ``text`` with their scores.
+    """
+    hits = get_index().query(text, k=k, owner=user_id)
+    clauses = Clause.objects.select_related('analysis').only(
+        'id', 'text', 'risk_level', 'risk_assessment', 'analysis_id', 'analysis__created_at'
+    ).in_bulk([clause_id for clause_id, _ in hits])
+    return [(clauses[clause_id], score) for clause_id, score in hits if clause_id in clauses]
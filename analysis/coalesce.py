@@ -0,0 +1,219 @@
+"""
+Single-flight coalescing of identical analyses across worker processes.
+
+The first request for a key inserts an ``AnalysisFlight`` row (the unique
+constraint on ``key`` is the lock) and runs the work. Concurrent requests for
+the same key find the running row and poll it until the leader stores its
+result, so a burst of identical analyses costs one upstream call. A finished
+result keeps being served for ``ANALYSIS_COALESCE_RESULT_TTL`` seconds.
+
+If a leader dies, its row goes stale after ``ANALYSIS_COALESCE_STALE_AFTER``
+seconds and the next request takes it over. A follower that waits longer
+than ``ANALYSIS_COALESCE_WAIT_TIMEOUT`` runs the work itself rather than fail.
+
+Waiters share a leader's failure only when repeating the call would fail the
+same way (the model rejected the request). A leader that was cancelled, shed
+by admission control or the circuit breaker, out of quota, or out of retries
+on a transient error drops its flight instead, and a waiter takes it over.
+"""
+import asyncio
+import hashlib
+import logging
+import time
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from . import admission, llm, usage
+from .models import AnalysisFlight
+
+logger = logging.getLogger(__name__)
+
+
+class CoalescedAnalysisError(Exception):
+    """
+    The leader of a flight this request was waiting on failed.
+    """
+
+
+def make_key(*parts):
+    """
+    Hash the parts that determine an LLM result into a flight key.
+    """
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(str(part).encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def _claim(key):
+    """
+    Try to become the leader for ``key``.
+
+    Returns ``('leader', flight)``, ``('done', flight)`` or ``('wait', flight)``.
+    """
+    now = timezone.now()
+    result_ttl = timedelta(seconds=_setting('ANALYSIS_COALESCE_RESULT_TTL', 30))
+    stale_after = timedelta(seconds=_setting('ANALYSIS_COALESCE_STALE_AFTER', 300))
+    try:
+        with transaction.atomic():
+            return 'leader', AnalysisFlight.objects.create(key=key, started_at=now)
+    except IntegrityError:
+        pass
+
+    flight = AnalysisFlight.objects.filter(key=key).first()
+    if flight is None:
+        # Deleted between our insert and read; let the caller retry.
+        return 'wait', None
+    if flight.status == 'done' and flight.finished_at and flight.finished_at > now - result_ttl:
+        return 'done', flight
+    if flight.status == 'running' and flight.started_at > now - stale_after:
+        return 'wait', flight
+
+    # Failed, expired or abandoned: take the flight over. The conditional
+    # update makes sure only one process wins.
+    taken = AnalysisFlight.objects.filter(
+        pk=flight.pk, status=flight.status, started_at=flight.started_at,
+    ).update(status='running', started_at=now, finished_at=None, result='', error='')
+    if taken:
+        flight.status, flight.started_at = 'running', now
+        return 'leader', flight
+    return 'wait', flight
+
+
+# Failures of the moment or of the leader's user rather than of the analysis
+UNSHARED_ERRORS = (
+    asyncio.CancelledError, asyncio.TimeoutError, TimeoutError,
+    admission.AdmissionRejected, llm.CircuitOpenError, usage.QuotaExceeded,
+)
+
+
+def _shared(error):
+    """
+    Whether waiters should get ``error`` instead of trying again themselves.
+    """
+    if not isinstance(error, Exception) or isinstance(error, UNSHARED_ERRORS):
+        return False
+    return not llm.is_retryable(error)
+
+
+def _finish(flight, result=None, error=None):
+    now = timezone.now()
+    if error is not None and not _shared(error):
+        # Not a failure of the analysis: drop the flight so a waiter takes
+        # it over instead of reporting an error, or a 500 for a 503.
+        AnalysisFlight.objects.filter(pk=flight.pk, status='running').delete()
+        return
+    if error is not None:
+        AnalysisFlight.objects.filter(pk=flight.pk).update(
+            status='failed', error=str(error)[:1000], finished_at=now
+        )
+        return
+    AnalysisFlight.objects.filter(pk=flight.pk).update(status='done', result=result, finished_at=now)
+    # Results are only ever served within the TTL, so older rows are garbage.
+    keep_for = timedelta(seconds=max(_setting('ANALYSIS_COALESCE_RESULT_TTL', 30), 3600))
+    AnalysisFlight.objects.filter(finished_at__lt=now - keep_for).delete()
+
+
+def _lead(flight, compute):
+    try:
+        result = compute()
+    except BaseException as e:
+        _finish(flight, error=e)
+        raise
+    _finish(flight, result=result)
+    return result
+
+
+def _poll(key):
+    return AnalysisFlight.objects.filter(key=key).only('status', 'result', 'error').first()
+
+
+def _outcome(flight):
+    """
+    Result of a flight that stopped running, or None if it vanished.
+    """
+    if flight is not None and flight.status == 'done':
+        return flight.result
+    if flight is not None and flight.status == 'failed':
+        # Share the leader's failure instead of repeating a failing call
+        # once per waiter; later requests will take the flight over.
+        raise CoalescedAnalysisError(flight.error)
+    return None
+
+
+def single_flight(key, compute):
+    """
+    Run ``compute()`` at most once at a time per ``key`` across all processes.
+
+    Returns ``(result, shared)`` where ``shared`` is True when the result came
+    from another request's call.
+    """
+    wait_timeout = _setting('ANALYSIS_COALESCE_WAIT_TIMEOUT', 120)
+    poll_interval = _setting('ANALYSIS_COALESCE_POLL_INTERVAL', 0.25)
+    deadline = time.monotonic() + wait_timeout
+
+    while True:
+        state, flight = _claim(key)
+        if state == 'leader':
+            return _lead(flight, compute), False
+        if state == 'done':
+            return flight.result, True
+
+        # Follow the leader until it finishes, fails or we run out of patience.
+        while time.monotonic() < deadline:
+            time.sleep(poll_interval)
+            flight = _poll(key)
+            if flight is None or flight.status != 'running':
+                break
+        else:
+            logger.warning('Gave up waiting for coalesced analysis %s; running it directly', key[:12])
+            return compute(), False
+
+        result = _outcome(flight)
+        if result is not None:
+            return result, True
+        # The leader vanished: loop and try to take over.
+
+
+async def single_flight_async(key, compute):
+    """
+    ``single_flight`` for async views; ``compute`` is a coroutine function.
+    """
+    wait_timeout = _setting('ANALYSIS_COALESCE_WAIT_TIMEOUT', 120)
+    poll_interval = _setting('ANALYSIS_COALESCE_POLL_INTERVAL', 0.25)
+    deadline = time.monotonic() + wait_timeout
+
+    while True:
+        state, flight = await sync_to_async(_claim)(key)
+        if state == 'leader':
+            try:
+                result = await compute()
+            except BaseException as e:
+                await asyncio.shield(sync_to_async(_finish)(flight, error=e))
+                raise
+            await sync_to_async(_finish)(flight, result=result)
+            return result, False
+        if state == 'done':
+            return flight.result, True
+
+        while time.monotonic() < deadline:
+            await asyncio.sleep(poll_interval)
+            flight = await sync_to_async(_poll)(key)
+            if flight is None or flight.status != 'running':
+                break
+        else:
+            logger.warning('Gave up waiting for coalesced analysis %s; running it directly', key[:12])
+            return await compute(), False
+
+        result = _outcome(flight)
+        if result is not None:
+            return result, True
@@ -0,0 +1,58 @@
+"""
+Content-encoding negotiation and compression, shared by the frontend shell
+and ``CompressionMiddleware``.
+
+Brotli is used when the ``brotli`` package is installed (it comes with
+``whitenoise[brotli]``), gzip otherwise.
+"""
+import gzip
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Supported encodings in order of preference
+ENCODINGS = ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def accepted_encodings(accept_encoding):
+    """
+    ``{encoding: quality}`` from an ``Accept-Encoding`` header.
+    """
+    accepted = {}
+    for part in (accept_encoding or '').split(','):
+        name, _, params = part.strip().partition(';')
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                pass
+        if name:
+            accepted[name.strip().lower()] = quality
+    return accepted
+
+
+def negotiate(accept_encoding, available=ENCODINGS):
+    """
+    The preferred encoding in ``available`` the client accepts, or 'identity'.
+    """
+    accepted = accepted_encodings(accept_encoding)
+    for encoding in ENCODINGS:
+        if encoding in available and accepted.get(encoding, accepted.get('*', 0)) > 0:
+            return encoding
+    return 'identity'
+
+
+def compress(data, encoding, level=None):
+    """
+    ``data`` encoded with ``encoding``; ``level`` defaults to each codec's
+    maximum, for content compressed once and served many times.
+    """
+    if encoding == 'gzip':
+        return gzip.compress(data, compresslevel=9 if level is None else level, mtime=0)
+    if encoding == 'br':
+        return brotli.compress(data, quality=11 if level is None else level)
+    raise ValueError(f'Unsupported encoding: {encoding}')
@@ -0,0 +1,185 @@
+"""
+Streaming CSV / NDJSON exports for admins.
+
+Rows are read with ``values_list(...).iterator(chunk_size=...)`` (a
+server-side cursor on PostgreSQL) and written to the response as they
+arrive, so an export holds one chunk in memory whether it has a hundred rows
+or ten million. No model instances are built. Under ASGI, Django would drain a
+sync iterator into a list before sending it, so ``astream`` fetches the rows
+a chunk at a time through ``sync_to_async`` instead.
+
+CSV cells that a spreadsheet would run as a formula are prefixed with ``'``.
+"""
+import csv
+from datetime import datetime
+from itertools import islice
+
+from asgiref.sync import sync_to_async
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .models import Document, DocumentAnalysis, Report, User
+
+CHUNK_SIZE = 2000
+# Lines per write to the socket
+BATCH_LINES = 200
+# Leading characters that make a spreadsheet treat a cell as a formula
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson',
+}
+
+# Per export: queryset, the field filtered by since/until, and (column, field) pairs
+EXPORTS = {
+    'documents': {
+        'queryset': lambda: Document.objects.order_by('pk'),
+        'date_field': 'upload_date',
+        'columns': [
+            ('id', 'id'), ('title', 'title'), ('status', 'status'), ('upload_date', 'upload_date'),
+            ('user_id', 'user_id'), ('user_email', 'user__email'), ('content', 'content'),
+        ],
+    },
+    'analyses': {
+        'queryset': lambda: DocumentAnalysis.objects.order_by('pk'),
+        'date_field': 'created_at',
+        'columns': [
+            ('id', 'id'), ('created_at', 'created_at'), ('user_id', 'user_id'),
+            ('user_email', 'user__email'), ('content', 'content'), ('analysis_result', 'analysis_result'),
+        ],
+    },
+    'reports': {
+        'queryset': lambda: Report.objects.order_by('pk'),
+        'date_field': 'created_at',
+        'columns': [
+            ('id', 'id'), ('title', 'title'), ('type', 'type'), ('status', 'status'),
+            ('priority', 'priority'), ('created_at', 'created_at'), ('updated_at', 'updated_at'),
+            ('user_id', 'user_id'), ('user_email', 'user__email'), ('description', 'description'),
+            ('steps', 'steps'),
+        ],
+    },
+    'users': {
+        'queryset': lambda: User.objects.order_by('pk'),
+        'date_field': 'created_at',
+        'columns': [
+            ('id', 'id'), ('username', 'username'), ('email', 'email'), ('account_type', 'account_type'),
+            ('is_active', 'is_active'), ('is_staff', 'is_staff'), ('created_at', 'created_at'),
+            ('last_login', 'last_login'),
+        ],
+    },
+}
+
+
+class ExportError(ValueError):
+    pass
+
+
+def parse_bound(value, name):
+    """
+    Parse a ``since``/``until`` query value (date or ISO datetime).
+    """
+    moment = parse_datetime(value)
+    if moment is None:
+        day = parse_date(value)
+        if day is None:
+            raise ExportError(f'{name} must be a date (YYYY-MM-DD) or an ISO datetime')
+        moment = datetime(day.year, day.month, day.day)
+    return timezone.make_aware(moment) if timezone.is_naive(moment) else moment
+
+
+def rows(kind, since=None, until=None):
+    """
+    Column names and a ``values_list`` queryset of the rows of an export.
+    """
+    if kind not in EXPORTS:
+        raise ExportError(f'Unknown export {kind!r}; choose from {", ".join(EXPORTS)}')
+    spec = EXPORTS[kind]
+    queryset = spec['queryset']()
+    if since is not None:
+        queryset = queryset.filter(**{f'{spec["date_field"]}__gte': since})
+    if until is not None:
+        queryset = queryset.filter(**{f'{spec["date_field"]}__lt': until})
+    names = [name for name, _ in spec['columns']]
+    fields = [field for _, field in spec['columns']]
+    return names, queryset.values_list(*fields)
+
+
+class _Echo:
+    # csv.writer target that hands each formatted line back instead of storing it
+    def write(self, value):
+        return value
+
+
+def _csv_cell(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def _formatter(names, export_format):
+    # The header and a function formatting one record as a line
+    if export_format == 'csv':
+        writer = csv.writer(_Echo())
+        return writer.writerow(names), lambda record: writer.writerow([_csv_cell(value) for value in record])
+    encoder = DjangoJSONEncoder(ensure_ascii=False)
+    return '', lambda record: encoder.encode(dict(zip(names, record))) + '\n'
+
+
+def _batched(header, format_record, records):
+    # Fewer, larger writes to the socket than one per row
+    batch = [header]
+    for record in records:
+        batch.append(format_record(record))
+        if len(batch) >= BATCH_LINES:
+            yield ''.join(batch)
+            batch = []
+    if any(batch):
+        yield ''.join(batch)
+
+
+async def _arecords(records):
+    # QuerySet.aiterator() runs a values_list query in the event loop, so
+    # fetch the chunks on the ORM thread; it is the same thread every time,
+    # which keeps the cursor usable between chunks
+    iterator = records.iterator(chunk_size=CHUNK_SIZE)
+    fetch = sync_to_async(lambda: list(islice(iterator, CHUNK_SIZE)))
+    while chunk := await fetch():
+        for record in chunk:
+            yield record
+
+
+async def _abatched(header, format_record, records):
+    batch = [header]
+    async for record in records:
+        batch.append(format_record(record))
+        if len(batch) >= BATCH_LINES:
+            yield ''.join(batch)
+            batch = []
+    if any(batch):
+        yield ''.join(batch)
+
+
+def _prepare(kind, export_format, since, until):
+    if export_format not in FORMATS:
+        raise ExportError(f'Unknown format {export_format!r}; choose from {", ".join(FORMATS)}')
+    names, records = rows(kind, since, until)
+    return _formatter(names, export_format), records
+
+
+def stream(kind, export_format, since=None, until=None):
+    """
+    ``(content chunks, content type)`` for an export.
+    """
+    (header, format_record), records = _prepare(kind, export_format, since, until)
+    return _batched(header, format_record, records.iterator(chunk_size=CHUNK_SIZE)), FORMATS[export_format]
+
+
+def astream(kind, export_format, since=None, until=None):
+    """
+    ``stream`` with async content chunks, for responses served under ASGI.
+    """
+    (header, format_record), records = _prepare(kind, export_format, since, until)
+    return _abatched(header, format_record, _arecords(records)), FORMATS[export_format]
@@ -0,0 +1,111 @@
+"""
+Text extraction from uploaded contract files (PDF, Word, images, plain text).
+
+The parsing libraries are imported by the extractor that needs them, so
+loading this module (and the views that use it) stays cheap at worker boot.
+"""
+import hashlib
+import io
+import os
+
+from . import timing, tracing
+
+# File extensions process_uploaded_file can read
+SUPPORTED_EXTENSIONS = {'pdf', 'doc', 'docx', 'png', 'jpg', 'jpeg', 'txt'}
+
+
+def extract_pdf_pages(file):
+    import PyPDF2
+
+    pdf_reader = PyPDF2.PdfReader(file)
+    pages = []
+    for number, page in enumerate(pdf_reader.pages, 1):
+        with tracing.span('extract.pdf_page', page=number):
+            pages.append(page.extract_text())
+    return pages
+
+
+def extract_text_from_pdf(file):
+    return join_pages(extract_pdf_pages(file))
+
+
+def extract_text_from_docx(file):
+    import docx
+
+    doc = docx.Document(file)
+    text = ""
+    for paragraph in doc.paragraphs:
+        text += paragraph.text + "\n"
+    return text
+
+
+def extract_text_from_image(file):
+    import pytesseract
+    from PIL import Image
+
+    image = Image.open(file)
+    with timing.stage('ocr', width=image.width, height=image.height):
+        text = pytesseract.image_to_string(image)
+    return text
+
+
+def join_pages(pages):
+    """
+    The stored text of a document extracted as ``pages``. Pre-flight takes
+    the pages themselves, to find running headers and footers.
+    """
+    return "".join(pages)
+
+
+def extract_pages(file):
+    """
+    Text of an uploaded file, as a list of its PDF pages or a single item.
+    """
+    file_extension = file.name.lower().split('.')[-1]
+    with timing.stage('extraction', format=file_extension):
+        if file_extension == 'pdf':
+            return extract_pdf_pages(file)
+        elif file_extension in ['doc', 'docx']:
+            return [extract_text_from_docx(file)]
+        elif file_extension in ['png', 'jpg', 'jpeg']:
+            return [extract_text_from_image(file)]
+        elif file_extension == 'txt':
+            return [file.read().decode('utf-8')]
+        else:
+            raise ValueError(f"Unsupported file type: {file_extension}")
+
+
+def process_uploaded_file(file):
+    return join_pages(extract_pages(file))
+
+
+def file_hash(data):
+    """
+    SHA-256 of a file's bytes, stored as ``Document.content_hash``.
+    """
+    return hashlib.sha256(data).hexdigest()
+
+
+def extract_path(path):
+    """
+    Read and extract one file from disk.
+
+    Returns ``(path, content_hash, text, pages, error)``; on failure text is
+    None and error holds the message. Needs no Django setup (outside a
+    trace its stages only feed this process's metrics), so it can run in
+    spawned worker processes.
+    """
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+    except OSError as e:
+        return path, None, None, 0, str(e)
+    digest = file_hash(data)
+    buffer = io.BytesIO(data)
+    buffer.name = os.path.basename(path)
+    try:
+        pages = extract_pages(buffer)
+    except Exception as e:
+        return path, digest, None, 0, f'{type(e).__name__}: {e}'
+    # PostgreSQL text columns cannot hold NUL bytes
+    return path, digest, join_pages(pages).replace('\x00', ''), len(pages), None
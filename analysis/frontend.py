@@ -0,0 +1,81 @@
+"""
+The frontend shell (``frontend/dist/index.html``), cached in memory.
+
+The file is read once and kept with its gzip and, when the ``brotli``
+package is installed, brotli encodings, the same variants WhiteNoise
+precompresses for static assets. Each request only stats the file; a new
+build (a changed mtime or size) is picked up on the next request without a
+restart.
+
+Every encoding has its own strong ETag derived from the content hash, and
+the shell is sent with ``Cache-Control: no-cache`` so browsers revalidate it
+and pick up new asset hashes as soon as they are deployed, answered with a
+304 while it is unchanged.
+"""
+import hashlib
+import os
+import threading
+
+from django.conf import settings
+from django.utils.http import parse_etags
+
+from . import compression
+
+
+class Shell:
+    """
+    One version of ``index.html`` and its precompressed encodings.
+    """
+
+    def __init__(self, content, stamp):
+        self.stamp = stamp
+        self.digest = hashlib.sha256(content).hexdigest()[:32]
+        self.bodies = {'identity': content}
+        for encoding in compression.ENCODINGS:
+            compressed = compression.compress(content, encoding)
+            if len(compressed) < len(content):
+                self.bodies[encoding] = compressed
+
+    def etag(self, encoding):
+        return f'"{self.digest}"' if encoding == 'identity' else f'"{self.digest}-{encoding}"'
+
+    def matches(self, if_none_match):
+        """
+        True if ``If-None-Match`` names this version, in any encoding.
+        """
+        if not if_none_match:
+            return False
+        tags = parse_etags(if_none_match)
+        if tags == ['*']:
+            return True
+        return any(tag.strip('"').split('-')[0] == self.digest for tag in tags)
+
+    def negotiate(self, accept_encoding):
+        return compression.negotiate(accept_encoding, self.bodies)
+
+
+_shell = None
+_lock = threading.Lock()
+
+
+def index_path():
+    return getattr(settings, 'FRONTEND_INDEX', os.path.join(settings.BASE_DIR, 'frontend', 'dist', 'index.html'))
+
+
+def get_shell():
+    """
+    The current shell, re-read if the file changed since it was cached.
+    Raises ``FileNotFoundError`` when the frontend has not been built.
+    """
+    global _shell
+    path = index_path()
+    info = os.stat(path)
+    stamp = (info.st_mtime_ns, info.st_size)
+    shell = _shell
+    if shell is not None and shell.stamp == stamp:
+        return shell
+    with _lock:
+        if _shell is None or _shell.stamp != stamp:
+            with open(path, 'rb') as f:
+                _shell = Shell(f.read(), stamp)
+        return _shell
@@ -0,0 +1,194 @@
+"""
+``Idempotency-Key`` support for endpoints that create records or call the LLM.
+
+The first request with a given key (per user and endpoint) runs normally and
+its response is stored. Repeats within ``IDEMPOTENCY_TTL`` seconds get the
+stored response back, marked with ``Idempotent-Replayed: true``, without
+creating another record or paying for another model call. A repeat that
+arrives while the first request is still running gets 409 with
+``Retry-After``; a key reused with a different body gets 422.
+
+Failures that are worth retrying (5xx, 409, 429, exceptions, cancelled
+requests) are not stored, so the client's next retry runs again.
+"""
+import asyncio
+import hashlib
+import json
+from datetime import timedelta
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse, JsonResponse
+from django.utils import timezone
+from rest_framework.utils.encoders import JSONEncoder
+
+from .models import IdempotencyRecord
+
+HEADER = 'Idempotency-Key'
+# Statuses a retry could change, so they are never replayed
+TRANSIENT_STATUSES = {408, 409, 425, 429}
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def fingerprint(request):
+    """
+    Hash of the request body. Multipart bodies are hashed field by field,
+    since their boundary changes on every retry.
+    """
+    digest = hashlib.sha256()
+    if (request.content_type or '').startswith('multipart/form-data'):
+        for name, value in sorted(request.POST.items()):
+            digest.update(f'{name}={value}\0'.encode('utf-8'))
+        for name, upload in sorted(request.FILES.items()):
+            digest.update(f'{name}:{upload.name}\0'.encode('utf-8'))
+            for chunk in upload.chunks():
+                digest.update(chunk)
+            upload.seek(0)
+    else:
+        digest.update(request.body)
+    return digest.hexdigest()
+
+
+def _claim(user, key, path, request_fingerprint):
+    """
+    Returns ``('run', record)``, ``('replay', record)``, ``('conflict', None)``
+    or ``('mismatch', None)``.
+    """
+    now = timezone.now()
+    ttl = timedelta(seconds=_setting('IDEMPOTENCY_TTL', 86400))
+    processing_timeout = timedelta(seconds=_setting('IDEMPOTENCY_PROCESSING_TIMEOUT', 600))
+    lookup = {'user': user, 'key': key, 'path': path}
+    for _ in range(2):
+        try:
+            with transaction.atomic():
+                return 'run', IdempotencyRecord.objects.create(
+                    **lookup, fingerprint=request_fingerprint, created_at=now
+                )
+        except IntegrityError:
+            pass
+        record = IdempotencyRecord.objects.filter(**lookup).first()
+        if record is None:
+            continue
+        expired = record.created_at < now - (ttl if record.status == 'done' else processing_timeout)
+        if expired:
+            # Old enough to forget (or abandoned by a crashed worker): start over
+            IdempotencyRecord.objects.filter(pk=record.pk, created_at=record.created_at).delete()
+            continue
+        if record.fingerprint != request_fingerprint:
+            return 'mismatch', None
+        if record.status == 'done':
+            return 'replay', record
+        return 'conflict', None
+    return 'conflict', None
+
+
+def _response_body(response):
+    data = getattr(response, 'data', None)
+    if data is not None:
+        # DRF response, not rendered yet
+        return json.dumps(data, cls=JSONEncoder)
+    return response.content.decode('utf-8')
+
+
+def _store(record, response):
+    if response.status_code >= 500 or response.status_code in TRANSIENT_STATUSES:
+        _discard(record)
+        return
+    IdempotencyRecord.objects.filter(pk=record.pk).update(
+        status='done',
+        response_status=response.status_code,
+        response_body=_response_body(response),
+    )
+    # Forget this user's keys that are past the replay window
+    ttl = timedelta(seconds=_setting('IDEMPOTENCY_TTL', 86400))
+    IdempotencyRecord.objects.filter(user=record.user_id, created_at__lt=timezone.now() - ttl).delete()
+
+
+def _discard(record):
+    IdempotencyRecord.objects.filter(pk=record.pk).delete()
+
+
+def _replay(record):
+    response = HttpResponse(record.response_body, status=record.response_status, content_type='application/json')
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def _refusal(state):
+    if state == 'mismatch':
+        return JsonResponse({
+            'error': f'{HEADER} was already used for a different request',
+            'message': 'Use a new idempotency key for a new request'
+        }, status=422)
+    response = JsonResponse({
+        'error': f'A request with this {HEADER} is still being processed',
+        'message': 'Retry shortly to get its result'
+    }, status=409)
+    response['Retry-After'] = '1'
+    return response
+
+
+def _check_key(key):
+    if len(key) > 255:
+        return JsonResponse({'error': f'{HEADER} must be at most 255 characters'}, status=400)
+    return None
+
+
+def idempotent(view):
+    """
+    Add ``Idempotency-Key`` handling to an authenticated DRF function view.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if not key:
+            return view(request, *args, **kwargs)
+        invalid = _check_key(key)
+        if invalid is not None:
+            return invalid
+        state, record = _claim(request.user, key, request.path, fingerprint(request))
+        if state == 'replay':
+            return _replay(record)
+        if state != 'run':
+            return _refusal(state)
+        try:
+            response = view(request, *args, **kwargs)
+        except BaseException:
+            _discard(record)
+            raise
+        _store(record, response)
+        return response
+    return wrapper
+
+
+def aidempotent(view):
+    """
+    ``idempotent`` for the async views; apply it inside ``jwt_required``.
+    """
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if not key:
+            return await view(request, *args, **kwargs)
+        invalid = _check_key(key)
+        if invalid is not None:
+            return invalid
+        state, record = await sync_to_async(_claim)(request.user, key, request.path, fingerprint(request))
+        if state == 'replay':
+            return _replay(record)
+        if state != 'run':
+            return _refusal(state)
+        try:
+            response = await view(request, *args, **kwargs)
+        except BaseException:
+            # Includes the client disconnecting: let its retry run again
+            await asyncio.shield(sync_to_async(_discard)(record))
+            raise
+        await sync_to_async(_store)(record, response)
+        return response
+    return wrapper
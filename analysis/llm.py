@@ -0,0 +1,515 @@
+"""
+LLM client layer.
+
+``get_client()`` returns a process-wide ``LLMClient`` built on first use from
+``settings.LLM``. The client wraps a backend with:
+
+* jittered exponential retries on 429, 5xx, timeouts and connection errors
+  (honouring ``Retry-After`` when the API sends one),
+* a circuit breaker that fails fast after repeated upstream failures.
+
+Both ``complete`` and the async ``acomplete`` are available; async views
+use the latter so a pending upstream call holds no thread. The backends are:
+
+* ``openai``: the OpenAI SDK on a pooled keep-alive ``httpx`` client with
+  explicit connect/read timeouts; the SDK's own retries are disabled so the
+  policy here is the only one.
+* ``stub``: an offline backend that replays recorded responses from
+  ``STUB_RESPONSES_DIR`` and otherwise returns a canned report, with optional
+  latency and error injection for load tests.
+
+Setting ``RECORD_DIR`` with the OpenAI backend saves every response in the
+format the stub backend replays.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import random
+import threading
+import time
+from dataclasses import dataclass
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+RETRYABLE_STATUS_CODES = {408, 409, 429}
+
+
+class LLMError(Exception):
+    """
+    Base class for errors raised by the LLM layer itself.
+    """
+
+
+class CircuitOpenError(LLMError):
+    """
+    The circuit breaker is open; the call was not attempted.
+    """
+
+    def __init__(self, retry_after):
+        super().__init__(f'LLM backend unavailable, retry in {retry_after:.0f}s')
+        self.retry_after = retry_after
+
+
+class StubBackendError(LLMError):
+    """
+    Failure injected by the stub backend.
+    """
+
+    def __init__(self, status_code=503):
+        super().__init__(f'Injected stub failure ({status_code})')
+        self.status_code = status_code
+
+
+@dataclass
+class LLMResult:
+    text: str
+    model: str
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    latency: float = 0.0
+    attempts: int = 1
+
+
+def request_key(model, messages):
+    """
+    Stable hash of a chat request, used to name recorded responses.
+    """
+    payload = json.dumps({'model': model, 'messages': messages}, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def status_code_of(error):
+    """
+    HTTP status carried by an SDK or stub error, if any.
+    """
+    code = getattr(error, 'status_code', None)
+    if code is None:
+        response = getattr(error, 'response', None)
+        code = getattr(response, 'status_code', None)
+    return code
+
+
+def is_retryable(error):
+    """
+    Whether an error is transient: throttling, server errors, timeouts and dropped connections.
+    """
+    code = status_code_of(error)
+    if code is not None:
+        return code in RETRYABLE_STATUS_CODES or code >= 500
+    try:
+        import openai
+    except ImportError:
+        return False
+    return isinstance(error, (openai.APIConnectionError, openai.APITimeoutError))
+
+
+def retry_after_of(error):
+    """
+    Seconds requested by a ``Retry-After`` response header, if present.
+    """
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None) or {}
+    try:
+        return float(headers.get('retry-after'))
+    except (TypeError, ValueError):
+        return None
+
+
+class CircuitBreaker:
+    """
+    Opens after ``failure_threshold`` consecutive failures and fails fast for
+    ``reset_timeout`` seconds, then lets a single trial call through
+    (half-open) to decide whether to close again.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._opened_at is None:
+                return 'closed'
+            if time.monotonic() - self._opened_at >= self.reset_timeout:
+                return 'half_open'
+            return 'open'
+
+    def before_call(self):
+        """
+        Raise ``CircuitOpenError`` unless a call may proceed.
+        """
+        with self._lock:
+            if self._opened_at is None:
+                return
+            waited = time.monotonic() - self._opened_at
+            if waited < self.reset_timeout:
+                raise CircuitOpenError(self.reset_timeout - waited)
+            if self._trial_in_flight:
+                raise CircuitOpenError(1.0)
+            self._trial_in_flight = True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+
+    def release_trial(self):
+        """
+        End a call that says nothing about the backend (cancelled, or a bad
+        request), leaving the state as it is.
+        """
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_in_flight = False
+            if self._opened_at is not None or self._failures >= self.failure_threshold:
+                if self._opened_at is None:
+                    logger.warning('LLM circuit opened after %s consecutive failures', self._failures)
+                self._opened_at = time.monotonic()
+
+
+class OpenAIBackend:
+    """
+    OpenAI chat completions over a pooled keep-alive HTTP connection.
+    """
+
+    name = 'openai'
+
+    def __init__(self, api_key, base_url=None, timeout=120.0, connect_timeout=5.0,
+                 max_connections=20, max_keepalive_connections=10, keepalive_expiry=60.0,
+                 record_dir=None):
+        import httpx
+        from openai import OpenAI
+
+        self.timeout = httpx.Timeout(timeout, connect=connect_timeout)
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self.api_key = api_key
+        self.base_url = base_url
+        self.record_dir = record_dir
+        self.client = OpenAI(
+            api_key=api_key,
+            base_url=base_url,
+            timeout=self.timeout,
+            max_retries=0,
+            http_client=httpx.Client(timeout=self.timeout, limits=self.limits),
+        )
+        # Async connection pools are bound to the event loop that opened them:
+        # loop -> (client, the task that closes it when the loop shuts down)
+        self._async_clients = {}
+
+    def _async_client(self):
+        """
+        The async client of the running loop, closed when the loop shuts down.
+        """
+        import httpx
+        from openai import AsyncOpenAI
+
+        loop = asyncio.get_running_loop()
+        entry = self._async_clients.get(loop)
+        if entry is None:
+            client = AsyncOpenAI(
+                api_key=self.api_key,
+                base_url=self.base_url,
+                timeout=self.timeout,
+                max_retries=0,
+                http_client=httpx.AsyncClient(timeout=self.timeout, limits=self.limits),
+            )
+            entry = self._async_clients[loop] = (client, loop.create_task(self._close_on_shutdown(loop, client)))
+        return entry[0]
+
+    async def _close_on_shutdown(self, loop, client):
+        # asyncio.run() cancels the tasks still pending before it closes the loop
+        try:
+            await asyncio.Event().wait()
+        finally:
+            del self._async_clients[loop]
+            await client.close()
+
+    def _result(self, response, model, messages):
+        usage = response.usage
+        result = LLMResult(
+            text=response.choices[0].message.content,
+            model=response.model or model,
+            prompt_tokens=getattr(usage, 'prompt_tokens', 0) or 0,
+            completion_tokens=getattr(usage, 'completion_tokens', 0) or 0,
+        )
+        if self.record_dir:
+            record_response(self.record_dir, model, messages, result)
+        return result
+
+    def complete(self, model, messages, **params):
+        response = self.client.chat.completions.create(model=model, messages=messages, **params)
+        return self._result(response, model, messages)
+
+    async def acomplete(self, model, messages, **params):
+        if threading.current_thread() is not threading.main_thread():
+            # An event loop outside the main thread is async_to_sync's loop
+            # for a single call (an async view under WSGI): an async pool
+            # would be opened and thrown away per request, so use the pooled
+            # sync client from the request's thread instead.
+            return await sync_to_async(self.complete)(model, messages, **params)
+        response = await self._async_client().chat.completions.create(model=model, messages=messages, **params)
+        return self._result(response, model, messages)
+
+
+def record_response(directory, model, messages, result):
+    """
+    Save a response where the stub backend will find it.
+    """
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f'{request_key(model, messages)}.json')
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({
+            'model': result.model,
+            'content': result.text,
+            'usage': {
+                'prompt_tokens': result.prompt_tokens,
+                'completion_tokens': result.completion_tokens,
+            },
+        }, f)
+
+
+STUB_REPORT = """---REPORT---
+
+1. Parties Identification
+   1.1 First Party
+       • Name: Stub Employer
+       • Role: Employer
+   1.2 Second Party
+       • Name: Stub Employee
+       • Role: Employee
+
+2. Clause Extraction and Analysis
+   1. Termination Conditions
+   i. Extracted Text (verbatim): "{excerpt}"
+   ii. Legal Basis: Labour Act [Chapter 28:01] §12
+   iii. Requirements Summary: Offline stub response; no model was called.
+   iv. Risk Assessment: Low – generated by the stub backend
+
+7. Summary
+This report was produced by the offline stub backend for request {key}.
+
+---END OF REPORT---"""
+
+
+class StubBackend:
+    """
+    Offline backend: replays recorded responses, else returns a canned report.
+    """
+
+    name = 'stub'
+
+    def __init__(self, responses_dir=None, latency=0.0, jitter=0.0, error_rate=0.0):
+        self.responses_dir = responses_dir
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+
+    def _delay(self):
+        if self.latency or self.jitter:
+            return max(0.0, self.latency + random.uniform(-self.jitter, self.jitter))
+        return 0.0
+
+    def _result(self, model, messages, params):
+        key = request_key(model, messages)
+        if self.responses_dir:
+            path = os.path.join(self.responses_dir, f'{key}.json')
+            if os.path.exists(path):
+                with open(path, encoding='utf-8') as f:
+                    recorded = json.load(f)
+                usage = recorded.get('usage', {})
+                return LLMResult(
+                    text=recorded['content'],
+                    model=recorded.get('model', model),
+                    prompt_tokens=usage.get('prompt_tokens', 0),
+                    completion_tokens=usage.get('completion_tokens', 0),
+                )
+        prompt = ' '.join(str(message.get('content', '')) for message in messages)
+        contract = prompt.rsplit('Contract Text:', 1)[-1]
+        excerpt = ' '.join(contract.split()[:30]).replace('"', "'")
+        text = STUB_REPORT.format(excerpt=excerpt or 'No contract text', key=key[:12])
+        return LLMResult(
+            text=text,
+            model=model,
+            prompt_tokens=len(prompt) // 4,
+            completion_tokens=min(len(text) // 4, params.get('max_tokens') or len(text)),
+        )
+
+    def complete(self, model, messages, **params):
+        time.sleep(self._delay())
+        if self.error_rate and random.random() < self.error_rate:
+            raise StubBackendError()
+        return self._result(model, messages, params)
+
+    async def acomplete(self, model, messages, **params):
+        await asyncio.sleep(self._delay())
+        if self.error_rate and random.random() < self.error_rate:
+            raise StubBackendError()
+        return self._result(model, messages, params)
+
+
+class LLMClient:
+    """
+    Retries, backoff and circuit breaking around a backend.
+    """
+
+    def __init__(self, backend, max_retries=3, backoff_base=0.5, backoff_max=20.0, breaker=None):
+        self.backend = backend
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker = breaker or CircuitBreaker()
+
+    def backoff(self, attempt, error=None):
+        """
+        Full-jitter exponential backoff, stretched to any ``Retry-After``.
+        """
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+        retry_after = retry_after_of(error) if error is not None else None
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.backoff_max))
+        return delay
+
+    def complete(self, model, messages, **params):
+        """
+        Run a chat completion and return an ``LLMResult``.
+        """
+        self.breaker.before_call()
+        started = time.perf_counter()
+        attempt = 0
+        settled = False
+        try:
+            while True:
+                try:
+                    result = self.backend.complete(model, messages, **params)
+                except Exception as e:
+                    # A bad request is not an outage; don't trip the breaker.
+                    if not is_retryable(e):
+                        raise
+                    if attempt >= self.max_retries:
+                        settled = True
+                        self.breaker.record_failure()
+                        raise
+                    delay = self.backoff(attempt, e)
+                    logger.info('LLM call failed (%s), retry %s in %.2fs', status_code_of(e) or type(e).__name__,
+                                attempt + 1, delay)
+                    attempt += 1
+                    time.sleep(delay)
+                    continue
+                settled = True
+                self.breaker.record_success()
+                result.latency = time.perf_counter() - started
+                result.attempts = attempt + 1
+                return result
+        finally:
+            if not settled:
+                # Don't leave a half-open trial in flight, or the circuit never closes
+                self.breaker.release_trial()
+
+    async def acomplete(self, model, messages, **params):
+        """
+        Async ``complete``; shares the retry policy and circuit breaker.
+        """
+        self.breaker.before_call()
+        started = time.perf_counter()
+        attempt = 0
+        settled = False
+        try:
+            while True:
+                try:
+                    result = await self.backend.acomplete(model, messages, **params)
+                except Exception as e:
+                    if not is_retryable(e):
+                        raise
+                    if attempt >= self.max_retries:
+                        settled = True
+                        self.breaker.record_failure()
+                        raise
+                    delay = self.backoff(attempt, e)
+                    logger.info('LLM call failed (%s), retry %s in %.2fs', status_code_of(e) or type(e).__name__,
+                                attempt + 1, delay)
+                    attempt += 1
+                    await asyncio.sleep(delay)
+                    continue
+                settled = True
+                self.breaker.record_success()
+                result.latency = time.perf_counter() - started
+                result.attempts = attempt + 1
+                return result
+        finally:
+            if not settled:
+                # Cancelled (the caller went away) or a bad request: no verdict on the backend
+                self.breaker.release_trial()
+
+
+def build_backend(config):
+    backend = config.get('BACKEND', 'openai')
+    if backend == 'stub':
+        return StubBackend(
+            responses_dir=config.get('STUB_RESPONSES_DIR'),
+            latency=config.get('STUB_LATENCY', 0.0),
+            jitter=config.get('STUB_JITTER', 0.0),
+            error_rate=config.get('STUB_ERROR_RATE', 0.0),
+        )
+    if backend == 'openai':
+        api_key = config.get('API_KEY')
+        if not api_key:
+            raise ValueError("OPENAI_API_KEY is not set in settings")
+        return OpenAIBackend(
+            api_key=api_key,
+            base_url=config.get('BASE_URL'),
+            timeout=config.get('TIMEOUT', 120.0),
+            connect_timeout=config.get('CONNECT_TIMEOUT', 5.0),
+            max_connections=config.get('MAX_CONNECTIONS', 20),
+            max_keepalive_connections=config.get('MAX_KEEPALIVE_CONNECTIONS', 10),
+            keepalive_expiry=config.get('KEEPALIVE_EXPIRY', 60.0),
+            record_dir=config.get('RECORD_DIR'),
+        )
+    raise ValueError(f"Unknown LLM backend: {backend}")
+
+
+def build_client(config):
+    return LLMClient(
+        build_backend(config),
+        max_retries=config.get('MAX_RETRIES', 3),
+        backoff_base=config.get('BACKOFF_BASE', 0.5),
+        backoff_max=config.get('BACKOFF_MAX', 20.0),
+        breaker=CircuitBreaker(
+            failure_threshold=config.get('CIRCUIT_FAILURE_THRESHOLD', 5),
+            reset_timeout=config.get('CIRCUIT_RESET_TIMEOUT', 30.0),
+        ),
+    )
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """
+    Return the process-wide LLM client, building it on first use.
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = build_client(settings.LLM)
+    return _client
@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand
+
+from analysis import clauses
+from analysis.models import Clause, DocumentAnalysis
+
+
+class Command(BaseCommand):
+    help = (
+        'Maintain the similar-clause index. Run with --compact periodically (e.g. nightly) '
+        'to drop deleted clauses from the vector file.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--backfill', action='store_true',
+                            help='Extract and index clauses for analyses that have none yet')
+        parser.add_argument('--rebuild', action='store_true',
+                            help='Discard the index files and re-index every stored clause')
+        parser.add_argument('--compact', action='store_true',
+                            help='Rewrite the index without deleted clauses')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        index = clauses.get_index()
+
+        if options['backfill']:
+            pending = DocumentAnalysis.objects.filter(clauses__isnull=True).only(
+                'id', 'user_id', 'analysis_result'
+            )
+            count = 0
+            for analysis in pending.iterator(chunk_size=batch_size):
+                count += len(clauses.index_analysis(analysis))
+            self.stdout.write(f'Indexed {count} clauses from existing analyses')
+
+        if options['rebuild']:
+            index.clear()
+            batch = []
+            for clause in Clause.objects.only('id', 'user_id', 'text').iterator(chunk_size=batch_size):
+                batch.append(clause)
+                if len(batch) >= batch_size:
+                    index.add([c.id for c in batch], [c.user_id for c in batch], [c.text for c in batch])
+                    batch = []
+            if batch:
+                index.add([c.id for c in batch], [c.user_id for c in batch], [c.text for c in batch])
+            self.stdout.write(f'Rebuilt index with {len(index)} clauses')
+
+        if options['compact']:
+            dropped = index.compact()
+            self.stdout.write(f'Compacted index: dropped {dropped} rows, {len(index)} remain')
+
+        self.stdout.write(self.style.SUCCESS('Done'))
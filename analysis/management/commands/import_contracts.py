@@ -0,0 +1,162 @@
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from analysis import versions
+from analysis.extraction import SUPPORTED_EXTENSIONS, extract_path
+from analysis.models import Document, User
+
+
+def walk(root):
+    """
+    Yield supported files under ``root`` depth-first in sorted order, one
+    directory listing at a time. The order only depends on the file names,
+    so a checkpointed path says exactly which files were already handled.
+    """
+    try:
+        entries = sorted(os.scandir(root), key=lambda entry: entry.name)
+    except OSError:
+        return
+    for entry in entries:
+        if entry.name.startswith('.'):
+            continue
+        if entry.is_dir(follow_symlinks=False):
+            yield from walk(entry.path)
+        elif entry.is_file() and entry.name.lower().rsplit('.', 1)[-1] in SUPPORTED_EXTENSIONS:
+            yield entry.path
+
+
+def sort_key(relative_path):
+    # Depth-first sorted order equals ordering by path components
+    return tuple(relative_path.split(os.sep))
+
+
+class Command(BaseCommand):
+    help = (
+        'Import a directory tree of contract files (PDF, Word, images, text) as documents. '
+        "Files are extracted in parallel, duplicates of the user's documents (by file hash) are skipped, and progress "
+        'is checkpointed so an interrupted import resumes where it stopped.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('directory')
+        parser.add_argument('--user', required=True, help='Email or id of the user who will own the documents')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help='Extraction processes (default: one per CPU)')
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Files per bulk insert and checkpoint')
+        parser.add_argument('--checkpoint',
+                            help='Checkpoint file (default: .import_contracts-<directory name>.json)')
+        parser.add_argument('--restart', action='store_true', help='Ignore an existing checkpoint')
+
+    def handle(self, *args, **options):
+        root = os.path.abspath(options['directory'])
+        if not os.path.isdir(root):
+            raise CommandError(f'{root} is not a directory')
+        user = self.get_user(options['user'])
+        batch_size = max(1, options['batch_size'])
+        checkpoint_path = options['checkpoint'] or f'.import_contracts-{os.path.basename(root)}.json'
+
+        state = {'directory': root, 'last_path': None, 'imported': 0, 'duplicates': 0,
+                 'failed': 0, 'pages': 0, 'seconds': 0.0}
+        if os.path.exists(checkpoint_path) and not options['restart']:
+            with open(checkpoint_path) as f:
+                saved = json.load(f)
+            if saved.get('directory') != root:
+                raise CommandError(f'{checkpoint_path} belongs to {saved.get("directory")}; use --checkpoint or --restart')
+            state.update(saved)
+            self.stdout.write(f'Resuming after {state["last_path"]} ({state["imported"]} imported so far)')
+
+        paths = walk(root)
+        if state['last_path']:
+            resume_after = sort_key(state['last_path'])
+            paths = (p for p in paths if sort_key(os.path.relpath(p, root)) > resume_after)
+
+        started = time.monotonic()
+        previous_seconds = state['seconds']
+        session = {'files': 0, 'pages': 0}
+        # Spawned, not forked: workers need no Django setup and must not share this process's DB connection
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=options['workers'], mp_context=context) as executor:
+            chunksize = max(1, batch_size // (options['workers'] * 4))
+            batch = list(islice(paths, batch_size))
+            # Extract the next batch while the current one is being inserted
+            pending = executor.map(extract_path, batch, chunksize=chunksize) if batch else None
+            while pending is not None:
+                results = list(pending)
+                next_batch = list(islice(paths, batch_size))
+                pending = executor.map(extract_path, next_batch, chunksize=chunksize) if next_batch else None
+
+                self.save_batch(user, root, results, state)
+                state['last_path'] = os.path.relpath(results[-1][0], root)
+                state['seconds'] = previous_seconds + time.monotonic() - started
+                self.write_checkpoint(checkpoint_path, state)
+
+                session['files'] += len(results)
+                session['pages'] += sum(result[3] for result in results)
+                elapsed = time.monotonic() - started
+                self.stdout.write(
+                    f'{state["imported"]} imported, {state["duplicates"]} duplicates, {state["failed"]} failed '
+                    f'| {session["files"] / elapsed:.1f} docs/s, {session["pages"] / elapsed:.1f} pages/s'
+                )
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Done: {state["imported"]} imported, {state["duplicates"]} duplicates, {state["failed"]} failed, '
+            f'{state["pages"]} pages. This run: {session["files"]} files in {elapsed:.1f}s '
+            f'({session["files"] / elapsed if elapsed else 0:.1f} docs/s, '
+            f'{session["pages"] / elapsed if elapsed else 0:.1f} pages/s)'
+        ))
+
+    def get_user(self, identifier):
+        lookup = {'pk': identifier} if identifier.isdigit() else {'email': identifier}
+        try:
+            return User.objects.get(**lookup)
+        except User.DoesNotExist:
+            raise CommandError(f'No user {identifier}')
+
+    def save_batch(self, user, root, results, state):
+        """
+        Insert the new documents of one batch in a single transaction.
+        """
+        extracted = []
+        for path, content_hash, text, pages, error in results:
+            if error is not None:
+                state['failed'] += 1
+                self.stderr.write(f'{os.path.relpath(path, root)}: {error}')
+            else:
+                extracted.append((path, content_hash, text, pages))
+
+        hashes = {content_hash for _, content_hash, _, _ in extracted}
+        # Duplicates of the user's own documents; other accounts' copies don't count
+        seen = set(
+            Document.objects.filter(user=user, content_hash__in=hashes).values_list('content_hash', flat=True)
+        )
+        documents = []
+        for path, content_hash, text, pages in extracted:
+            if content_hash in seen:
+                state['duplicates'] += 1
+                continue
+            seen.add(content_hash)
+            state['pages'] += pages
+            documents.append(Document(
+                title=os.path.basename(path)[:255], content=text, content_hash=content_hash, user=user
+            ))
+        with transaction.atomic():
+            Document.objects.bulk_create(documents)
+            # bulk_create sends no signals
+            versions.bump('documents', user.pk)
+        state['imported'] += len(documents)
+
+    def write_checkpoint(self, path, state):
+        # Write then rename, so a crash never leaves a half-written checkpoint
+        temporary = f'{path}.tmp'
+        with open(temporary, 'w') as f:
+            json.dump(state, f)
+        os.replace(temporary, path)
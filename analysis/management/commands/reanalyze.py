@@ -0,0 +1,185 @@
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from analysis import admission, llm, preflight, services, usage
+from analysis.models import Analysis, Document
+
+# Attempts per document when the LLM pool is saturated or the circuit is open
+MAX_ATTEMPTS = 5
+
+
+def parse_date(value):
+    try:
+        moment = datetime.fromisoformat(value)
+    except ValueError:
+        raise CommandError(f'Invalid date {value!r}; use YYYY-MM-DD or an ISO timestamp')
+    return timezone.make_aware(moment) if timezone.is_naive(moment) else moment
+
+
+class Command(BaseCommand):
+    help = (
+        'Re-run contract analysis over stored documents, e.g. after CONTRACT_PROMPT changes. '
+        'Results are saved as Analysis rows in batches; progress is checkpointed per prompt '
+        'version so an interrupted run resumes where it stopped, skipping documents that already '
+        'have an analysis from this prompt. Use --dry-run for a token and cost estimate.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='Only documents of this user (email or id)')
+        parser.add_argument('--since', help='Only documents uploaded on or after this date')
+        parser.add_argument('--until', help='Only documents uploaded before this date')
+        parser.add_argument('--status', help='Only documents with this status')
+        parser.add_argument('--ids', help='Comma-separated document ids')
+        parser.add_argument('--limit', type=int, help='Stop after this many documents')
+        parser.add_argument('--concurrency', type=int, default=4, help='Documents analyzed at once')
+        parser.add_argument('--batch-size', type=int, default=50, help='Documents per transaction and checkpoint')
+        parser.add_argument('--checkpoint',
+                            help='Checkpoint file (default: .reanalyze-<prompt hash>.json)')
+        parser.add_argument('--restart', action='store_true', help='Ignore an existing checkpoint')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Estimate tokens and cost without calling the model')
+
+    def handle(self, *args, **options):
+        documents = self.select(options)
+        prompt_version = hashlib.sha256(services.CONTRACT_PROMPT.encode('utf-8')).hexdigest()[:12]
+        if options['dry_run']:
+            self.estimate(documents, options)
+            return
+
+        checkpoint_path = options['checkpoint'] or f'.reanalyze-{prompt_version}.json'
+        state = {'prompt_version': prompt_version, 'last_id': 0, 'analyzed': 0, 'failed': 0,
+                 'failed_ids': []}
+        if os.path.exists(checkpoint_path) and not options['restart']:
+            with open(checkpoint_path) as f:
+                state.update(json.load(f))
+            if state['prompt_version'] != prompt_version:
+                raise CommandError(f'{checkpoint_path} was written for another prompt version; use --restart')
+            self.stdout.write(f'Resuming after document {state["last_id"]} ({state["analyzed"]} analyzed so far)')
+
+        if not options['restart']:
+            # The checkpoint is written after each batch commits, so after a
+            # crash it can lag behind the stored results
+            documents = documents.exclude(analysis__prompt_version=prompt_version)
+        batch_size = max(1, options['batch_size'])
+        limit = options['limit']
+
+        started = time.monotonic()
+        done = 0
+        with ThreadPoolExecutor(max_workers=max(1, options['concurrency'])) as executor:
+            while limit is None or done < limit:
+                # Keyset pagination rather than one long cursor, so no read
+                # stays open while results are written
+                size = batch_size if limit is None else min(batch_size, limit - done)
+                batch = list(documents.filter(pk__gt=state['last_id']).only('id', 'content')[:size])
+                if not batch:
+                    break
+                results = list(executor.map(self.analyze, batch))
+                analyses = [Analysis(document_id=doc_id, result=result, prompt_version=prompt_version)
+                            for doc_id, result, error in results if error is None]
+                # A batch's results are stored all or nothing; documents stored
+                # before a crash are skipped on resume even if the checkpoint
+                # below was never written
+                with transaction.atomic():
+                    Analysis.objects.bulk_create(analyses)
+                for doc_id, _, error in results:
+                    if error is not None:
+                        self.stderr.write(f'Document {doc_id}: {error}')
+                        state['failed_ids'].append(doc_id)
+                state['analyzed'] += len(analyses)
+                state['failed'] += len(results) - len(analyses)
+                state['last_id'] = batch[-1].id
+                self.write_checkpoint(checkpoint_path, state)
+
+                done += len(batch)
+                elapsed = time.monotonic() - started
+                self.stdout.write(
+                    f'{state["analyzed"]} analyzed, {state["failed"]} failed (last id {state["last_id"]}) '
+                    f'| {done / elapsed:.2f} docs/s'
+                )
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Done: {state["analyzed"]} analyzed, {state["failed"]} failed'
+            + (f' (ids in {checkpoint_path})' if state['failed'] else '')
+        ))
+
+    def select(self, options):
+        documents = Document.objects.order_by('pk')
+        if options['user']:
+            key = 'user_id' if options['user'].isdigit() else 'user__email'
+            documents = documents.filter(**{key: options['user']})
+        if options['since']:
+            documents = documents.filter(upload_date__gte=parse_date(options['since']))
+        if options['until']:
+            documents = documents.filter(upload_date__lt=parse_date(options['until']))
+        if options['status']:
+            documents = documents.filter(status=options['status'])
+        if options['ids']:
+            try:
+                documents = documents.filter(pk__in=[int(i) for i in options['ids'].split(',') if i.strip()])
+            except ValueError:
+                raise CommandError('--ids must be comma-separated integers')
+        return documents
+
+    def analyze(self, document):
+        """
+        ``(document id, report, error)`` for one document.
+        """
+        requests = services.build_requests(preflight.prepare(document.content))
+        for attempt in range(1, MAX_ATTEMPTS + 1):
+            try:
+                # Offline runs are metered without a user, so they don't use up anyone's quota
+                return document.id, services.run_requests(requests), None
+            except (admission.AdmissionRejected, llm.CircuitOpenError) as e:
+                if attempt == MAX_ATTEMPTS:
+                    return document.id, None, str(e)
+                time.sleep(e.retry_after)
+            except Exception as e:
+                return document.id, None, f'{type(e).__name__}: {e}'
+
+    def estimate(self, documents, options):
+        if options['limit']:
+            documents = documents[:options['limit']]
+        totals = {}
+        count = 0
+        for document in documents.only('id', 'content').iterator(chunk_size=500):
+            count += 1
+            for _, decision in services.build_requests(preflight.prepare(document.content)):
+                route = totals.setdefault(decision.route.name, {
+                    'model': decision.model, 'calls': 0, 'prompt_tokens': 0, 'max_tokens': decision.route.max_tokens,
+                })
+                route['calls'] += 1
+                route['prompt_tokens'] += decision.input_tokens
+
+        self.stdout.write(f'{count} documents would be analyzed')
+        total_cost, priced = 0.0, True
+        for name, route in totals.items():
+            # Expect completions like past ones on this route, else half the budget
+            per_call = usage.average_completion_tokens(name) or route['max_tokens'] // 2
+            completion_tokens = per_call * route['calls']
+            cost = usage.cost_of(route['model'], route['prompt_tokens'], completion_tokens)
+            if cost is None:
+                priced = False
+            else:
+                total_cost += cost
+            self.stdout.write(
+                f'  {name} ({route["model"]}): {route["calls"]} calls, {route["prompt_tokens"]} prompt tokens, '
+                f'~{completion_tokens} completion tokens, '
+                + (f'~${cost:.2f}' if cost is not None else 'no price configured')
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f'Estimated cost: ~${total_cost:.2f}' + ('' if priced else ' (excluding unpriced models)')
+        ))
+
+    def write_checkpoint(self, path, state):
+        temporary = f'{path}.tmp'
+        with open(temporary, 'w') as f:
+            json.dump(state, f)
+        os.replace(temporary, path)
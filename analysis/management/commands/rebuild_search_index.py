@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from analysis import search
+
+
+class Command(BaseCommand):
+    help = 'Recreate the full-text search indexes for documents and analyses'
+
+    def handle(self, *args, **options):
+        search.rebuild()
+        self.stdout.write(self.style.SUCCESS('Search indexes rebuilt'))
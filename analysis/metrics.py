@@ -0,0 +1,151 @@
+"""
+In-process metrics.
+
+Histograms keep cumulative bucket counts, a sum and a count, the same shape
+Prometheus uses, so they can be exported without conversion. Values are per
+worker process.
+"""
+import bisect
+import threading
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+TOKEN_BUCKETS = (64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384, 32768, 65536, 131072)
+
+
+class Histogram:
+    """
+    Thread-safe fixed-bucket histogram.
+    """
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        with self._lock:
+            self._counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._sum += value
+            self._count += 1
+
+    def snapshot(self):
+        """
+        ``{'buckets': [(upper bound, cumulative count), ...], 'sum', 'count'}``;
+        the last bound is ``'+Inf'``.
+        """
+        with self._lock:
+            counts, total, count = list(self._counts), self._sum, self._count
+        cumulative, running = [], 0
+        for bound, bucket_count in zip(self.buckets + ('+Inf',), counts):
+            running += bucket_count
+            cumulative.append((bound, running))
+        return {'buckets': cumulative, 'sum': total, 'count': count}
+
+    def quantile(self, q):
+        """
+        Estimate a quantile from the buckets (upper bound of the bucket it falls in).
+        """
+        snapshot = self.snapshot()
+        if not snapshot['count']:
+            return None
+        target = q * snapshot['count']
+        for bound, cumulative in snapshot['buckets']:
+            if cumulative >= target:
+                return bound
+        return '+Inf'
+
+
+class Gauge:
+    """
+    A value that goes up and down, e.g. a queue depth.
+    """
+
+    def __init__(self):
+        self._value = 0.0
+        self._lock = threading.Lock()
+
+    def set(self, value):
+        with self._lock:
+            self._value = value
+
+    def inc(self, amount=1):
+        with self._lock:
+            self._value += amount
+
+    def dec(self, amount=1):
+        self.inc(-amount)
+
+    @property
+    def value(self):
+        return self._value
+
+
+_registry = {}
+_registry_lock = threading.Lock()
+
+
+def _get(name, labels, factory):
+    key = (name, tuple(sorted((labels or {}).items())))
+    with _registry_lock:
+        if key not in _registry:
+            _registry[key] = factory()
+        return _registry[key]
+
+
+def histogram(name, labels=None, buckets=LATENCY_BUCKETS):
+    """
+    Get or create the histogram for ``name`` and a label set.
+    """
+    return _get(name, labels, lambda: Histogram(buckets))
+
+
+def gauge(name, labels=None):
+    """
+    Get or create the gauge for ``name`` and a label set.
+    """
+    return _get(name, labels, Gauge)
+
+
+def collect(name):
+    """
+    ``[(labels, histogram), ...]`` for every label set of ``name``.
+    """
+    with _registry_lock:
+        return [(dict(labels), metric) for (metric_name, labels), metric in _registry.items()
+                if metric_name == name]
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _label_text(labels, **extra):
+    items = list(labels.items()) + list(extra.items())
+    if not items:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in items) + '}'
+
+
+def render():
+    """
+    Every metric in the Prometheus text exposition format.
+    """
+    with _registry_lock:
+        entries = sorted(_registry.items(), key=lambda entry: entry[0])
+    lines, typed = [], set()
+    for (name, labels), metric in entries:
+        labels = dict(labels)
+        if name not in typed:
+            typed.add(name)
+            lines.append(f'# TYPE {name} {"histogram" if isinstance(metric, Histogram) else "gauge"}')
+        if isinstance(metric, Histogram):
+            snapshot = metric.snapshot()
+            for bound, cumulative in snapshot['buckets']:
+                lines.append(f'{name}_bucket{_label_text(labels, le=bound)} {cumulative}')
+            lines.append(f'{name}_sum{_label_text(labels)} {snapshot["sum"]}')
+            lines.append(f'{name}_count{_label_text(labels)} {snapshot["count"]}')
+        else:
+            lines.append(f'{name}{_label_text(labels)} {metric.value}')
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,252 @@
+"""
+Request timing, tracing and response compression middleware.
+
+Times every request and the stages recorded inside it (``analysis.timing``),
+then:
+
+* adds a ``Server-Timing`` header (when ``SERVER_TIMING`` is on), which
+  browser dev tools show next to the request,
+* logs one JSON line per request to the ``analysis.timing`` logger,
+* feeds the per-view latency and query-count histograms and the in-flight
+  gauge exported at ``/metrics``.
+
+``TracingMiddleware`` runs each request inside the root span of its trace
+(``analysis.tracing``); list it before ``TimingMiddleware`` so the timing
+log carries the trace id.
+
+``CompressionMiddleware`` gzip/brotli-encodes API responses above
+``API_COMPRESSION['MIN_SIZE']`` for clients that accept it; list it after
+``TimingMiddleware`` so the time spent shows up as the ``compress`` stage.
+
+``StaticFilesMiddleware`` is WhiteNoise's middleware made async-capable.
+WhiteNoise's own is sync-only, so under ASGI Django would run everything
+below it, async views included, through a thread.
+
+All of them work under WSGI and ASGI, and under ASGI run on the event loop:
+``TimingMiddleware`` switches to an async ``process_view``, which Django
+would otherwise run through ``sync_to_async``. Django's own middleware
+(sessions, CSRF, auth, ...) still calls its ``process_request`` and
+``process_response`` hooks through ``sync_to_async`` under ASGI, a short
+hop to the sync thread per hook; the async view itself stays on the loop.
+"""
+import json
+import logging
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from whitenoise.middleware import WhiteNoiseMiddleware
+
+from . import compression, metrics, timing, tracing
+
+logger = logging.getLogger('analysis.timing')
+
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+
+def view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unresolved'
+    return match.view_name or match._func_path
+
+
+class TimingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+            self.process_view = self.aprocess_view
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        timings, token = timing.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            self.leave(request)
+            timing.finish(token)
+        return self.finish(request, response, timings)
+
+    async def __acall__(self, request):
+        timings, token = timing.start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            self.leave(request)
+            timing.finish(token)
+        return self.finish(request, response, timings)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        self.enter(request)
+
+    async def aprocess_view(self, request, view_func, view_args, view_kwargs):
+        self.enter(request)
+
+    def enter(self, request):
+        request._timing_view = view_name(request)
+        metrics.gauge('http_requests_in_flight', {'view': request._timing_view}).inc()
+
+    def leave(self, request):
+        if hasattr(request, '_timing_view'):
+            metrics.gauge('http_requests_in_flight', {'view': request._timing_view}).dec()
+
+    def finish(self, request, response, timings):
+        view = getattr(request, '_timing_view', None) or view_name(request)
+        elapsed = timings.elapsed()
+        queries = timings.stages.get('db', (0.0, 0))[1]
+        metrics.histogram('http_request_duration_seconds', {
+            'view': view, 'method': request.method, 'status': str(response.status_code),
+        }).observe(elapsed)
+        metrics.histogram('http_request_db_queries', {'view': view}, QUERY_BUCKETS).observe(queries)
+
+        if getattr(settings, 'SERVER_TIMING', True):
+            response['Server-Timing'] = timings.server_timing()
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(json.dumps({
+                'method': request.method,
+                'path': request.path,
+                'view': view,
+                'status': response.status_code,
+                'duration_ms': round(elapsed * 1000, 1),
+                'queries': queries,
+                'trace_id': tracing.current_trace_id(),
+                'stages': {
+                    name: {'ms': round(seconds * 1000, 1), 'calls': calls}
+                    for name, (seconds, calls) in timings.stages.items()
+                },
+            }))
+        return response
+
+
+class TracingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        root, token = self.start(request)
+        try:
+            response = self.get_response(request)
+        except BaseException as e:
+            root.fail(e)
+            root.end()
+            raise
+        finally:
+            tracing.deactivate(token)
+        return self.finish(request, response, root)
+
+    async def __acall__(self, request):
+        root, token = self.start(request)
+        try:
+            response = await self.get_response(request)
+        except BaseException as e:
+            root.fail(e)
+            root.end()
+            raise
+        finally:
+            tracing.deactivate(token)
+        return self.finish(request, response, root)
+
+    def start(self, request):
+        root = tracing.start_trace(
+            f'{request.method} {request.path}', request.headers.get('traceparent'),
+            **{'http.request.method': request.method, 'url.path': request.path},
+        )
+        return root, tracing.activate(root)
+
+    def finish(self, request, response, root):
+        match = getattr(request, 'resolver_match', None)
+        if match is not None:
+            # Name by route, not path, so spans of one endpoint group together
+            root.name = f'{request.method} /{match.route}'
+            root.set(**{'http.route': match.route})
+        root.set(**{'http.response.status_code': response.status_code})
+        if response.status_code >= 500:
+            root.status = (tracing.STATUS_ERROR, f'HTTP {response.status_code}')
+        root.end()
+        return response
+
+
+class CompressionMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.config = getattr(settings, 'API_COMPRESSION', {})
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self.compress(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return self.compress(request, await self.get_response(request))
+
+    def compressible(self, request, response):
+        if response.streaming or response.has_header('Content-Encoding'):
+            return False
+        if not request.path.startswith(tuple(self.config.get('PATHS', ('/api/',)))):
+            return False
+        content_type = response.get('Content-Type', '').split(';')[0].strip()
+        return content_type in self.config.get('CONTENT_TYPES', ('application/json',))
+
+    def compress(self, request, response):
+        if not self.compressible(request, response):
+            return response
+        patch_vary_headers(response, ('Accept-Encoding',))
+        if len(response.content) < self.config.get('MIN_SIZE', 1024):
+            return response
+        encoding = compression.negotiate(request.headers.get('Accept-Encoding'))
+        if encoding == 'identity':
+            return response
+        with timing.stage('compress', encoding=encoding, size=len(response.content)):
+            compressed = compression.compress(response.content, encoding, self.config.get('LEVELS', {}).get(encoding))
+        if len(compressed) >= len(response.content):
+            return response
+        response.content = compressed
+        response['Content-Length'] = str(len(compressed))
+        response['Content-Encoding'] = encoding
+        # The encoded body is a different representation of the same resource
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        return response
+
+
+class StaticFilesMiddleware(WhiteNoiseMiddleware):
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response=None, *args, **kwargs):
+        super().__init__(get_response, *args, **kwargs)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        # Only static files, which touch the disk, leave the event loop
+        if self.autorefresh:
+            static_file = await sync_to_async(self.find_file)(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is not None:
+            return await sync_to_async(self.serve)(static_file, request)
+        return await self.get_response(request)
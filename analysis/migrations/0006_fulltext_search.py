@@ -0,0 +1,90 @@
+from django.db import migrations
+
+
+# Each index is an external-content FTS5 table reading from a view over the base
+# table. The view adds an ``owner`` column ("u<user_id>") so per-user scoping is
+# resolved inside the FTS index instead of by filtering every match afterwards.
+SQLITE_INDEXES = [
+    {
+        'table': 'analysis_document',
+        'columns': ['title', 'content'],
+    },
+    {
+        'table': 'analysis_documentanalysis',
+        'columns': ['content', 'analysis_result'],
+    },
+]
+
+
+def _sqlite_statements(table, columns):
+    fts = f'{table}_fts'
+    source = f'{table}_fts_source'
+    cols = ', '.join(columns)
+    new_values = ', '.join(f'new.{col}' for col in columns)
+    old_values = ', '.join(f'old.{col}' for col in columns)
+    return [
+        f"CREATE VIEW {source} AS SELECT id, {cols}, 'u' || user_id AS owner FROM {table}",
+        f"CREATE VIRTUAL TABLE {fts} USING fts5({cols}, owner, content='{source}', "
+        f"content_rowid='id', tokenize='porter unicode61')",
+        f"CREATE TRIGGER {fts}_ai AFTER INSERT ON {table} BEGIN "
+        f"INSERT INTO {fts}(rowid, {cols}, owner) VALUES (new.id, {new_values}, 'u' || new.user_id); END",
+        f"CREATE TRIGGER {fts}_ad AFTER DELETE ON {table} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, {cols}, owner) VALUES ('delete', old.id, {old_values}, 'u' || old.user_id); END",
+        f"CREATE TRIGGER {fts}_au AFTER UPDATE ON {table} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, {cols}, owner) VALUES ('delete', old.id, {old_values}, 'u' || old.user_id); "
+        f"INSERT INTO {fts}(rowid, {cols}, owner) VALUES (new.id, {new_values}, 'u' || new.user_id); END",
+        f"INSERT INTO {fts}({fts}) VALUES ('rebuild')",
+    ]
+
+
+def _sqlite_drop_statements(table):
+    fts = f'{table}_fts'
+    return [
+        f'DROP TRIGGER IF EXISTS {fts}_ai',
+        f'DROP TRIGGER IF EXISTS {fts}_ad',
+        f'DROP TRIGGER IF EXISTS {fts}_au',
+        f'DROP TABLE IF EXISTS {fts}',
+        f'DROP VIEW IF EXISTS {table}_fts_source',
+    ]
+
+
+# PostgreSQL keeps expression GIN indexes up to date by itself.
+POSTGRES_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS analysis_document_fts ON analysis_document USING GIN "
+    "(to_tsvector('english', coalesce(title, '') || ' ' || coalesce(content, '')))",
+    "CREATE INDEX IF NOT EXISTS analysis_documentanalysis_fts ON analysis_documentanalysis USING GIN "
+    "(to_tsvector('english', coalesce(content, '') || ' ' || coalesce(analysis_result, '')))",
+]
+
+
+def create_search_indexes(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        for index in SQLITE_INDEXES:
+            for statement in _sqlite_statements(index['table'], index['columns']):
+                schema_editor.execute(statement)
+    elif vendor == 'postgresql':
+        for statement in POSTGRES_INDEXES:
+            schema_editor.execute(statement)
+
+
+def drop_search_indexes(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        for index in SQLITE_INDEXES:
+            for statement in _sqlite_drop_statements(index['table']):
+                schema_editor.execute(statement)
+    elif vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS analysis_document_fts')
+        schema_editor.execute('DROP INDEX IF EXISTS analysis_documentanalysis_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analysis', '0005_report_steps_report_type'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
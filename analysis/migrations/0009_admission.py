@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:57
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analysis', '0008_analysisflight'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AdmissionPool',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='AdmissionTicket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('pool', models.CharField(max_length=50)),
+                ('state', models.CharField(choices=[('waiting', 'Waiting'), ('running', 'Running')], default='waiting', max_length=10)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('expires_at', models.DateTimeField(db_index=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['pool', 'state'], name='analysis_ad_pool_1c03ee_idx')],
+            },
+        ),
+    ]
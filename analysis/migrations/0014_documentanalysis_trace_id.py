@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analysis', '0013_document_content_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='documentanalysis',
+            name='trace_id',
+            field=models.CharField(blank=True, db_index=True, max_length=32, null=True),
+        ),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:32
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+def deliver_existing(apps, schema_editor):
+    # Until now every notification was shown to everyone, and written for
+    # admins; report updates go to the report's author
+    Notification = apps.get_model('analysis', 'Notification')
+    NotificationDelivery = apps.get_model('analysis', 'NotificationDelivery')
+    NotificationCounter = apps.get_model('analysis', 'NotificationCounter')
+    User = apps.get_model('analysis', 'User')
+    admins = list(User.objects.filter(is_staff=True, is_active=True).values_list('id', flat=True))
+    deliveries = []
+    for notification in Notification.objects.select_related('report').iterator():
+        if notification.type == 'report_update' and notification.report and notification.report.user_id:
+            recipients = [notification.report.user_id]
+        else:
+            recipients = admins
+        deliveries.extend(
+            NotificationDelivery(notification=notification, user_id=user_id, is_read=notification.is_read)
+            for user_id in recipients
+        )
+    NotificationDelivery.objects.bulk_create(deliveries, batch_size=1000, ignore_conflicts=True)
+    counts = NotificationDelivery.objects.values('user').annotate(unread=Count('id', filter=Q(is_read=False)))
+    NotificationCounter.objects.bulk_create(
+        [NotificationCounter(user_id=row['user'], unread=row['unread']) for row in counts], batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analysis', '0015_resourceversion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NotificationCounter',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='notification_counter', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('unread', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='NotificationDelivery',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('is_read', models.BooleanField(default=False)),
+                ('read_at', models.DateTimeField(blank=True, null=True)),
+                ('notification', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='deliveries', to='analysis.notification')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='notification_inbox', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'is_read', '-notification'], name='analysis_no_user_id_a07578_idx')],
+                'unique_together': {('user', 'notification')},
+            },
+        ),
+        migrations.RunPython(deliver_existing, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 18:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analysis', '0016_notification_inbox'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='documentanalysis',
+            name='latency',
+            field=models.FloatField(blank=True, null=True),
+        ),
+    ]
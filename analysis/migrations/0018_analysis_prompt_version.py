@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 18:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analysis', '0017_documentanalysis_latency'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='analysis',
+            name='prompt_version',
+            field=models.CharField(blank=True, db_index=True, max_length=12, null=True),
+        ),
+    ]
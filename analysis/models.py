@@ -42,9 +42,14 @@ class User(AbstractBaseUser):
     is_staff = models.BooleanField(default=False)
     # Boolean field to check if user is superuser
     is_superuser = models.BooleanField(default=False)
+    # LLM tokens allowed per quota window; overrides the account type's quota when set
+    token_quota = models.PositiveIntegerField(null=True, blank=True)
 
     # Use UserManager for creating users and superusers
     objects = UserManager()
+    # Set on users built from token claims (analysis.authentication), whose
+    # loaded fields may be older than the database row
+    from_claims = False
 
     # Use email as the unique identifier for authentication
     USERNAME_FIELD = 'email'
@@ -55,6 +60,13 @@ class User(AbstractBaseUser):
     def __str__(self):
         return self.email
 
+    # A user built from token claims only saves the fields it names, so stale
+    # claim values never overwrite a change made elsewhere
+    def save(self, *args, **kwargs):
+        if self.from_claims and kwargs.get('update_fields') is None:
+            raise ValueError('A user built from token claims must be saved with update_fields')
+        super().save(*args, **kwargs)
+
     # Permissions checking for superuser
     def has_perm(self, perm, obj=None):
         return self.is_superuser
@@ -72,6 +84,8 @@ class Document(models.Model):
     upload_date = models.DateTimeField(auto_now_add=True)
     # Status of the document with choices
     status = models.CharField(max_length=20, default='pending')
+    # SHA-256 of the uploaded file, used to skip duplicates on import
+    content_hash = models.CharField(max_length=64, null=True, blank=True, db_index=True)
 
     # ForeignKey linking to User; one-to-many relationship
     user = models.ForeignKey(User, on_delete=models.CASCADE)
@@ -87,6 +101,8 @@ class Analysis(models.Model):
     result = models.TextField()
     # Date and time when the analysis was performed
     created_at = models.DateTimeField(auto_now_add=True)
+    # Hash of the CONTRACT_PROMPT that produced the result (set by the reanalyze command)
+    prompt_version = models.CharField(max_length=12, null=True, blank=True, db_index=True)
 
     # Return a formatted string representation
     def __str__(self):
@@ -101,6 +117,10 @@ class DocumentAnalysis(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     # ForeignKey linking to User; one-to-many relationship
     user = models.ForeignKey(User, on_delete=models.CASCADE)
+    # Id of the trace that produced the analysis (see analysis.tracing)
+    trace_id = models.CharField(max_length=32, null=True, blank=True, db_index=True)
+    # Seconds from submission to the stored result (see analysis.usage.latency_percentiles)
+    latency = models.FloatField(null=True, blank=True)
 
     # Return a formatted string representation
     def __str__(self):
@@ -155,6 +175,7 @@ class Notification(models.Model):
     title = models.CharField(max_length=255)
     message = models.TextField()
     report = models.ForeignKey(Report, on_delete=models.CASCADE, null=True, blank=True)
+    # Shared by all readers; read state is now per recipient, on NotificationDelivery
     is_read = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
     
@@ -162,4 +183,217 @@ class Notification(models.Model):
         ordering = ['-created_at']
     
     def __str__(self):
-        return f"{self.type} - {self.title}"
\ No newline at end of file
+        return f"{self.type} - {self.title}"
+
+
+class NotificationDelivery(models.Model):
+    # One recipient's copy of a notification; rows are bulk-inserted when it is sent
+    notification = models.ForeignKey(Notification, on_delete=models.CASCADE, related_name='deliveries')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='notification_inbox')
+    is_read = models.BooleanField(default=False)
+    read_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        unique_together = ('user', 'notification')
+        # The inbox and unread queries: a user's rows, newest first
+        indexes = [models.Index(fields=['user', 'is_read', '-notification'])]
+
+    def __str__(self):
+        return f"{self.notification_id} -> {self.user_id}"
+
+
+class NotificationCounter(models.Model):
+    # Unread inbox rows of a user, kept in step by analysis.notifications
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='notification_counter')
+    unread = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.user_id} - {self.unread} unread"
+
+class Clause(models.Model):
+    RISK_CHOICES = [
+        ('low', 'Low'),
+        ('medium', 'Medium'),
+        ('high', 'High'),
+        ('unknown', 'Unknown'),
+    ]
+
+    # Analysis the clause was extracted from
+    analysis = models.ForeignKey(DocumentAnalysis, on_delete=models.CASCADE, related_name='clauses')
+    # Owner of the analysis, copied here so the similarity index can scope by user
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    # Position of the clause within the analysis report
+    position = models.PositiveIntegerField()
+    # Verbatim clause text quoted in the report
+    text = models.TextField()
+    # Risk level and rationale given for the clause
+    risk_level = models.CharField(max_length=10, choices=RISK_CHOICES, default='unknown')
+    risk_assessment = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['analysis', 'position']
+
+    def __str__(self):
+        return f"Clause {self.position} of analysis {self.analysis_id}"
+
+
+class AnalysisFlight(models.Model):
+    STATUS_CHOICES = [
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+
+    # Hash of the prompt input; identical analyses share one flight
+    key = models.CharField(max_length=64, unique=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='running')
+    # Output of the leader's LLM call, served to every waiting request
+    result = models.TextField(blank=True)
+    error = models.TextField(blank=True)
+    started_at = models.DateTimeField(default=timezone.now)
+    finished_at = models.DateTimeField(null=True, blank=True, db_index=True)
+
+    def __str__(self):
+        return f"{self.key[:12]} - {self.status}"
+
+
+class AdmissionPool(models.Model):
+    # Name of a concurrency pool ('llm', 'extraction'); its row is locked while slots are handed out
+    name = models.CharField(max_length=50, unique=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return self.name
+
+
+class AdmissionTicket(models.Model):
+    STATE_CHOICES = [
+        ('waiting', 'Waiting'),
+        ('running', 'Running'),
+    ]
+
+    pool = models.CharField(max_length=50)
+    state = models.CharField(max_length=10, choices=STATE_CHOICES, default='waiting')
+    created_at = models.DateTimeField(default=timezone.now)
+    # Tickets of crashed processes are ignored and purged after this
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['pool', 'state'])]
+
+    def __str__(self):
+        return f"{self.pool} #{self.pk} - {self.state}"
+
+
+class LLMUsage(models.Model):
+    # User the call was made for; null for calls made by management commands
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='llm_usage')
+    model = models.CharField(max_length=100)
+    route = models.CharField(max_length=50, blank=True)
+    prompt_tokens = models.PositiveIntegerField(default=0)
+    completion_tokens = models.PositiveIntegerField(default=0)
+    # Seconds spent waiting on the model, retries included
+    latency = models.FloatField()
+    created_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['user', 'created_at'])]
+
+    def __str__(self):
+        return f"{self.model} - {self.prompt_tokens + self.completion_tokens} tokens"
+
+
+class UsageCounter(models.Model):
+    # Per-user token totals in one-minute buckets, summed for quota checks
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='usage_counters')
+    window_start = models.DateTimeField()
+    tokens = models.PositiveBigIntegerField(default=0)
+    requests = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('user', 'window_start')
+
+    def __str__(self):
+        return f"{self.user_id} @ {self.window_start:%Y-%m-%d %H:%M} - {self.tokens}"
+
+
+class IdempotencyRecord(models.Model):
+    STATUS_CHOICES = [
+        ('processing', 'Processing'),
+        ('done', 'Done'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='idempotency_records')
+    # Client-supplied Idempotency-Key header, scoped to the user and endpoint
+    key = models.CharField(max_length=255)
+    path = models.CharField(max_length=255)
+    # Hash of the request body; a reused key with a different body is rejected
+    fingerprint = models.CharField(max_length=64)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='processing')
+    # Stored response replayed for duplicate requests
+    response_status = models.PositiveSmallIntegerField(null=True, blank=True)
+    response_body = models.TextField(blank=True)
+    created_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    class Meta:
+        unique_together = ('user', 'key', 'path')
+
+    def __str__(self):
+        return f"{self.path} {self.key} - {self.status}"
+
+
+class AnalysisBatch(models.Model):
+    STATUS_CHOICES = [
+        ('running', 'Running'),
+        ('done', 'Done'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='analysis_batches')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='running')
+    # Progress counters, updated as each item finishes
+    total = models.PositiveIntegerField(default=0)
+    completed = models.PositiveIntegerField(default=0)
+    failed = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Batch {self.pk} - {self.completed + self.failed}/{self.total}"
+
+
+class AnalysisBatchItem(models.Model):
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+
+    batch = models.ForeignKey(AnalysisBatch, on_delete=models.CASCADE, related_name='items')
+    # Existing document to analyze, or the document created from an uploaded archive member
+    document = models.ForeignKey(Document, on_delete=models.SET_NULL, null=True, blank=True)
+    # Requested document id or archive member name, for reporting failures
+    source = models.CharField(max_length=255)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    analysis = models.ForeignKey(DocumentAnalysis, on_delete=models.SET_NULL, null=True, blank=True)
+    error = models.TextField(blank=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['batch', 'pk']
+
+    def __str__(self):
+        return f"{self.source} - {self.status}"
+
+
+class ResourceVersion(models.Model):
+    # Scope and owner of a cached resource, e.g. 'documents:12'; see analysis.versions
+    key = models.CharField(max_length=100, unique=True)
+    # Bumped on every write to the resource; part of its ETag
+    version = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"{self.key} v{self.version}"
@@ -0,0 +1,323 @@
+"""
+Per-user notification inbox and push over Server-Sent Events.
+
+A notification is written once (``Notification``) and delivered to each of
+its recipients with one bulk insert into ``NotificationDelivery``, each
+user's inbox. ``NotificationCounter`` keeps every user's unread count, moved
+by the same transactions that deliver and mark notifications read, so the
+unread badge is a primary key lookup however long the inbox grows. New
+reports go to the admins, report status changes to the report's author.
+
+``/api/notifications/stream/`` (``async_views.notification_stream``) keeps
+an ``text/event-stream`` response open and sends each new delivery to its
+recipient as it happens, with the recipient's unread count, instead of
+clients polling ``get_notifications``. Reconnecting clients send
+``Last-Event-ID`` (browsers' ``EventSource`` does this itself) and are first
+sent what they missed.
+
+A connection is an asyncio queue and a suspended generator, with no thread,
+so one ASGI worker holds thousands of idle ones. Per process, one ``Hub``
+task reads new deliveries and routes them to their recipients' queues: it
+is woken at once by notifications sent from this process, and otherwise
+polls every ``NOTIFICATION_STREAM['POLL_INTERVAL']`` seconds for those sent
+by other workers, one query per poll however many clients are connected.
+Delivery ids skipped by a read may belong to transactions still in flight,
+so they are looked for again on later polls for ``LATE_COMMIT_WINDOW``
+seconds. A client too slow to keep up is disconnected and catches up when
+it reconnects.
+
+Needs the ASGI server (``legalbackend.asgi``); under WSGI each connection
+would hold a worker thread.
+"""
+import asyncio
+import json
+import logging
+import time
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.db.models.functions import Greatest
+from django.utils import timezone
+from rest_framework.utils.encoders import JSONEncoder
+
+from . import metrics, versions
+from .models import Notification, NotificationCounter, NotificationDelivery, User
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'POLL_INTERVAL': 1.0,
+    # Comment lines at this interval keep proxies from closing idle streams
+    'HEARTBEAT': 20.0,
+    'QUEUE_SIZE': 100,
+    'BACKLOG': 100,
+    'RETRY_MS': 5000,
+    # How long an id skipped by a read may still show up, committed late
+    'LATE_COMMIT_WINDOW': 30.0,
+}
+# Most skipped ids kept, should ids jump (a large rolled-back insert)
+MAX_GAPS = 1000
+
+
+def config(name):
+    return getattr(settings, 'NOTIFICATION_STREAM', {}).get(name, DEFAULTS[name])
+
+
+def delivery_data(delivery):
+    notification = delivery.notification
+    return {
+        'id': notification.id,
+        'type': notification.type,
+        'title': notification.title,
+        'message': notification.message,
+        'report_id': notification.report_id,
+        'is_read': delivery.is_read,
+        'created_at': notification.created_at,
+    }
+
+
+def event(delivery, unread):
+    """
+    ``(id, bytes)`` of the SSE event for ``delivery``, ids being notification ids.
+    """
+    data = json.dumps(dict(delivery_data(delivery), unread=unread), cls=JSONEncoder)
+    notification_id = delivery.notification_id
+    return notification_id, f'id: {notification_id}\nevent: notification\ndata: {data}\n\n'.encode('utf-8')
+
+
+def admin_ids():
+    return list(User.objects.filter(is_staff=True, is_active=True).values_list('id', flat=True))
+
+
+def _add_unread(user_ids, amount):
+    NotificationCounter.objects.filter(user_id__in=user_ids).update(unread=Greatest(F('unread') + amount, 0))
+    versions.bump_many('notifications', user_ids)
+
+
+def notify(recipients, type, title, message, report=None):
+    """
+    Create a notification and deliver it to the ``recipients`` user ids.
+    """
+    recipients = sorted(set(recipients))
+    with transaction.atomic():
+        notification = Notification.objects.create(type=type, title=title, message=message, report=report)
+        NotificationDelivery.objects.bulk_create(
+            [NotificationDelivery(notification=notification, user_id=user_id) for user_id in recipients]
+        )
+        # Counters of first-time recipients are created at zero, then all move together
+        NotificationCounter.objects.bulk_create(
+            [NotificationCounter(user_id=user_id) for user_id in recipients], ignore_conflicts=True
+        )
+        _add_unread(recipients, 1)
+        # Streams in this process get it now, others on their next poll
+        transaction.on_commit(hub.wake)
+    return notification
+
+
+def report_created(report):
+    return notify(
+        admin_ids(), 'new_report', report.title,
+        f"New {report.type} report: {report.title} (Priority: {report.priority})", report=report,
+    )
+
+
+def report_status_changed(report):
+    """
+    Tell the report's author about its new status.
+    """
+    if report.user_id is None:
+        return None
+    return notify(
+        [report.user_id], 'report_update', report.title,
+        f"Report '{report.title}' is now {report.get_status_display().lower()}", report=report,
+    )
+
+
+def inbox(user, unread_only=False):
+    deliveries = NotificationDelivery.objects.filter(user=user).select_related('notification')
+    if unread_only:
+        deliveries = deliveries.filter(is_read=False)
+    return deliveries.order_by('-notification_id')
+
+
+def unread_count(user):
+    return NotificationCounter.objects.filter(user=user).values_list('unread', flat=True).first() or 0
+
+
+def remove_unread(user_id):
+    """
+    Account for an unread delivery deleted outside ``mark_read``.
+    """
+    _add_unread([user_id], -1)
+
+
+def mark_read(user, notification_ids=None):
+    """
+    Mark ``notification_ids`` (all if None) read in ``user``'s inbox;
+    returns how many were unread.
+    """
+    with transaction.atomic():
+        unread = NotificationDelivery.objects.filter(user=user, is_read=False)
+        if notification_ids is not None:
+            unread = unread.filter(notification_id__in=notification_ids)
+        marked = unread.update(is_read=True, read_at=timezone.now())
+        if marked:
+            _add_unread([user.pk], -marked)
+    return marked
+
+
+class Hub:
+    """
+    Routes new deliveries to the streams open in this process.
+    """
+
+    def __init__(self):
+        self.subscribers = {}
+        self.connections = 0
+        self.last_id = None
+        # Skipped delivery ids not seen yet -> when they were skipped
+        self.gaps = {}
+        self.loop = None
+        self.task = None
+        self.wakeup = None
+
+    async def subscribe(self, user_id):
+        """
+        A queue receiving ``(id, event bytes)`` for every notification
+        delivered to ``user_id`` from now on, or None when the client fell
+        behind and must reconnect.
+        """
+        loop = asyncio.get_running_loop()
+        if self.loop is not loop:
+            self.loop, self.wakeup, self.task = loop, asyncio.Event(), None
+            self.subscribers, self.connections = {}, 0
+        start = self.task is None or self.task.done()
+        if start:
+            # Start from now: anything older is the backlog of the clients
+            # that missed it. Read before the queue is registered, so a
+            # notification created in between is published to it.
+            latest = await NotificationDelivery.objects.order_by('-id').values_list('id', flat=True).afirst()
+            # Another stream may have started the hub while we waited
+            start = self.task is None or self.task.done()
+            if start:
+                self.last_id, self.gaps = latest or 0, {}
+        queue = asyncio.Queue(maxsize=config('QUEUE_SIZE'))
+        self.subscribers.setdefault(user_id, set()).add(queue)
+        self.connections += 1
+        metrics.gauge('notification_streams').set(self.connections)
+        if start:
+            self.task = loop.create_task(self._run())
+        return queue
+
+    def unsubscribe(self, user_id, queue):
+        queues = self.subscribers.get(user_id)
+        if queues is None or queue not in queues:
+            return
+        queues.discard(queue)
+        if not queues:
+            del self.subscribers[user_id]
+        self.connections -= 1
+        metrics.gauge('notification_streams').set(self.connections)
+
+    def wake(self):
+        """
+        Check for new deliveries now; safe to call from any thread.
+        """
+        loop, wakeup = self.loop, self.wakeup
+        if loop is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(wakeup.set)
+
+    async def _run(self):
+        while self.subscribers:
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), config('POLL_INTERVAL'))
+            except asyncio.TimeoutError:
+                pass
+            self.wakeup.clear()
+            try:
+                await self._publish()
+            except Exception:
+                logger.exception('Could not read new notifications')
+
+    def _advance(self, deliveries):
+        """
+        Move past ``deliveries``, remembering the ids skipped on the way.
+        """
+        now = time.monotonic()
+        seen = {delivery.id for delivery in deliveries}
+        for delivery_id in seen:
+            self.gaps.pop(delivery_id, None)
+        newest = max(seen, default=self.last_id)
+        if newest > self.last_id:
+            skipped = range(max(self.last_id + 1, newest - MAX_GAPS), newest)
+            self.gaps.update((delivery_id, now) for delivery_id in skipped if delivery_id not in seen)
+            self.last_id = newest
+        window = config('LATE_COMMIT_WINDOW')
+        self.gaps = {delivery_id: at for delivery_id, at in self.gaps.items() if now - at < window}
+
+    async def _publish(self):
+        query = Q(id__gt=self.last_id)
+        if self.gaps:
+            query |= Q(id__in=list(self.gaps))
+        new = NotificationDelivery.objects.filter(query).select_related('notification').order_by('id')
+        deliveries = [delivery async for delivery in new]
+        self._advance(deliveries)
+        if not deliveries:
+            return
+        listening = {delivery.user_id for delivery in deliveries if delivery.user_id in self.subscribers}
+        counters = NotificationCounter.objects.filter(user_id__in=listening).values_list('user_id', 'unread')
+        unread = {user_id: count async for user_id, count in counters}
+        for delivery in deliveries:
+            if delivery.user_id not in listening:
+                continue
+            item = event(delivery, unread.get(delivery.user_id, 0))
+            for queue in list(self.subscribers.get(delivery.user_id, ())):
+                try:
+                    queue.put_nowait(item)
+                except asyncio.QueueFull:
+                    # Too far behind: end its stream, the client resumes from Last-Event-ID
+                    self.unsubscribe(delivery.user_id, queue)
+                    while not queue.empty():
+                        queue.get_nowait()
+                    queue.put_nowait(None)
+
+
+hub = Hub()
+
+
+async def backlog(user, last_event_id):
+    """
+    Events for ``user``'s notifications after ``last_event_id``, oldest first.
+    """
+    unread = await NotificationCounter.objects.filter(user=user).values_list('unread', flat=True).afirst() or 0
+    missed = inbox(user).filter(notification_id__gt=last_event_id)[:config('BACKLOG')]
+    return [event(delivery, unread) async for delivery in missed][::-1]
+
+
+async def stream(user, last_event_id=None):
+    """
+    The body of one SSE connection of ``user``.
+    """
+    queue = await hub.subscribe(user.pk)
+    try:
+        yield f'retry: {config("RETRY_MS")}\n\n'.encode('utf-8')
+        sent = set()
+        if last_event_id is not None:
+            for notification_id, data in await backlog(user, last_event_id):
+                sent.add(notification_id)
+                yield data
+        while True:
+            try:
+                item = await asyncio.wait_for(queue.get(), config('HEARTBEAT'))
+            except asyncio.TimeoutError:
+                yield b': keepalive\n\n'
+                continue
+            if item is None:
+                return
+            notification_id, data = item
+            # Already sent from the backlog; late commits can arrive out of id order
+            if notification_id not in sent:
+                yield data
+    finally:
+        hub.unsubscribe(user.pk, queue)
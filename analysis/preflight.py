@@ -0,0 +1,200 @@
+"""
+Pre-flight compaction of contract text before it is sent to the model.
+
+Text extracted from PDFs and scans carries a lot of tokens the model does not
+need: running headers and footers on every page, page numbers, words
+hyphenated across line breaks, whitespace runs and paragraphs repeated
+verbatim. ``prepare`` strips those, counts the tokens saved, and splits a
+contract that is still over ``ANALYSIS_TOKEN_BUDGET`` into chunks that are
+analyzed separately instead of being truncated.
+"""
+import logging
+import re
+from collections import Counter
+from dataclasses import dataclass, field
+
+from django.conf import settings
+
+from . import metrics
+from .tokens import count_tokens
+
+logger = logging.getLogger(__name__)
+
+# "Page 3", "Page 3 of 10", "3 of 10", "3/10"; a bare number may be a sum or a term
+PAGE_NUMBER_RE = re.compile(
+    r'^[-–\s]*(?:page\s*\d{1,4}(?:\s*(?:of|/)\s*\d{1,4})?|\d{1,4}\s*(?:of|/)\s*\d{1,4})[-–\s]*$', re.IGNORECASE
+)
+HYPHENATION_RE = re.compile(r'(\w)-\n[ \t]*(\w)')
+SPACE_RUN_RE = re.compile(r'[ \t ]+')
+BLANK_RUN_RE = re.compile(r'\n{3,}')
+DIGITS_RE = re.compile(r'\d+')
+SENTENCE_END_RE = re.compile(r'(?<=[.;:])\s+')
+
+# A short line at the edge of this many pages is page furniture
+FURNITURE_MIN_REPEATS = 3
+FURNITURE_MAX_LENGTH = 100
+# How many lines at the top and bottom of a page can be headers or footers
+FURNITURE_EDGE_LINES = 3
+
+
+@dataclass
+class PreflightResult:
+    text: str
+    original_tokens: int
+    tokens: int
+    chunks: list = field(default_factory=list)
+    # Tokens of each chunk, so later steps need not count them again
+    chunk_tokens: list = field(default_factory=list)
+
+    @property
+    def tokens_saved(self):
+        return self.original_tokens - self.tokens
+
+    @property
+    def chunked(self):
+        return len(self.chunks) > 1
+
+    def report(self):
+        return {
+            'original_tokens': self.original_tokens,
+            'tokens': self.tokens,
+            'tokens_saved': self.tokens_saved,
+            'chunks': len(self.chunks),
+        }
+
+
+def _edges(page):
+    """
+    Indexes of the top and bottom non-blank lines of a page, and of the
+    outermost one at each end.
+    """
+    filled = [index for index, line in enumerate(page) if line]
+    return set(filled[:FURNITURE_EDGE_LINES] + filled[-FURNITURE_EDGE_LINES:]), set(filled[:1] + filled[-1:])
+
+
+def _keys(page):
+    """
+    ``(index, key)`` of the lines of a page that could be furniture: any
+    edge line as it is, and the outermost lines with digits ignored, where
+    running page numbers go.
+    """
+    edges, outer = _edges(page)
+    for index in sorted(edges):
+        line = page[index]
+        if len(line) > FURNITURE_MAX_LENGTH:
+            continue
+        yield index, line.lower()
+        if index in outer and DIGITS_RE.search(line):
+            yield index, DIGITS_RE.sub('#', line.lower())
+
+
+def _furniture(pages):
+    """
+    Keys of lines that repeat at page edges like running headers or footers.
+    """
+    if len(pages) < 2:
+        # Without page breaks a repeated line cannot be told from a heading
+        return set()
+    seen = Counter()
+    for page in pages:
+        # One vote per page, so repeated body text is left to paragraph dedup
+        seen.update({key for _, key in _keys(page)})
+    threshold = max(FURNITURE_MIN_REPEATS, len(pages) // 2)
+    return {key for key, count in seen.items() if count >= threshold}
+
+
+def compact(text):
+    """
+    Strip page furniture, hyphenation, whitespace runs and duplicate paragraphs.
+
+    Furniture is only looked for between form feeds, which ``prepare`` puts
+    between the pages of an extracted PDF.
+    """
+    text = text.replace('\r\n', '\n').replace('\r', '\n')
+    text = HYPHENATION_RE.sub(r'\1\2', text)
+    pages = [
+        [SPACE_RUN_RE.sub(' ', line).strip() for line in page.split('\n')]
+        for page in text.split('\f')
+    ]
+    furniture = _furniture(pages)
+    kept = []
+    for page in pages:
+        dropped = {index for index, key in _keys(page) if key in furniture} if furniture else ()
+        kept.extend(
+            line for index, line in enumerate(page)
+            if index not in dropped and not PAGE_NUMBER_RE.match(line)
+        )
+    paragraphs, seen = [], set()
+    for paragraph in BLANK_RUN_RE.sub('\n\n', '\n'.join(kept)).split('\n\n'):
+        paragraph = paragraph.strip()
+        key = ' '.join(paragraph.lower().split())
+        if not key or key in seen:
+            continue
+        seen.add(key)
+        paragraphs.append(paragraph)
+    # Never hand the model an empty contract because everything looked like furniture
+    return '\n\n'.join(paragraphs) or ' '.join(text.split())
+
+
+def _pieces(paragraph, budget):
+    """
+    ``(piece, tokens)`` of a paragraph, split at sentence ends, then words,
+    if it is over ``budget`` tokens.
+    """
+    tokens = count_tokens(paragraph)
+    if tokens <= budget:
+        return [(paragraph, tokens)]
+    pieces = []
+    for sentence in SENTENCE_END_RE.split(paragraph):
+        tokens = count_tokens(sentence)
+        if tokens <= budget:
+            pieces.append((sentence, tokens))
+            continue
+        words = sentence.split(' ')
+        step = max(1, len(words) * budget // tokens)
+        for i in range(0, len(words), step):
+            piece = ' '.join(words[i:i + step])
+            pieces.append((piece, count_tokens(piece)))
+    return pieces
+
+
+def split_chunks(text, budget):
+    """
+    Split ``text`` into chunks of at most ``budget`` tokens on paragraph
+    boundaries; returns the chunks and their token counts.
+    """
+    chunks, chunk_tokens, current, current_tokens = [], [], [], 0
+    for paragraph in text.split('\n\n'):
+        for piece, piece_tokens in _pieces(paragraph, budget):
+            if current and current_tokens + piece_tokens > budget:
+                chunks.append('\n\n'.join(current))
+                chunk_tokens.append(current_tokens)
+                current, current_tokens = [], 0
+            current.append(piece)
+            current_tokens += piece_tokens
+    if current:
+        chunks.append('\n\n'.join(current))
+        chunk_tokens.append(current_tokens)
+    return chunks, chunk_tokens
+
+
+def prepare(text, pages=None):
+    """
+    Compact ``text`` and split it into chunks that fit the token budget.
+
+    ``pages`` are the pages ``text`` was extracted from, if known; stored
+    text keeps no page breaks.
+    """
+    budget = getattr(settings, 'ANALYSIS_TOKEN_BUDGET', 24000)
+    compacted = compact('\f'.join(pages) if pages else text)
+    result = PreflightResult(text=compacted, original_tokens=count_tokens(text), tokens=count_tokens(compacted))
+    if result.tokens > budget:
+        result.chunks, result.chunk_tokens = split_chunks(compacted, budget)
+    else:
+        result.chunks, result.chunk_tokens = [compacted], [result.tokens]
+    metrics.histogram('preflight_tokens_saved', buckets=metrics.TOKEN_BUCKETS).observe(max(result.tokens_saved, 0))
+    logger.info(
+        'Preflight: %s -> %s tokens (saved %s), %s chunk(s)',
+        result.original_tokens, result.tokens, result.tokens_saved, len(result.chunks),
+    )
+    return result
@@ -0,0 +1,149 @@
+"""
+Model routing for contract analyses.
+
+Each request is routed from its input size, counted once in pre-flight, and
+a keyword guess at the contract type. Routes are configured in
+``settings.LLM_ROUTES`` and tried in order; the first route whose limits the
+request fits is used, and the last route catches the rest. By default short
+contracts of a type the fine-tuned model was trained on go to it, and long
+or unrecognised ones to a larger model; ``LLM_LARGE_ROUTE=False`` keeps
+everything on the fine-tuned model. Pre-flight chunks contracts to the
+budget of the largest route, so an over-budget contract reaches the large
+model in parts rather than overflowing the fine-tuned one.
+
+Every call is recorded in per-route latency and token histograms (see
+``metrics``) so the thresholds can be tuned from real traffic.
+"""
+import logging
+import re
+from dataclasses import dataclass
+
+from django.conf import settings
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+# Phrases that identify a contract type; the type with the most hits wins
+CONTRACT_TYPE_KEYWORDS = {
+    'employment': ['employee', 'employer', 'employment', 'salary', 'remuneration', 'probation',
+                   'annual leave', 'overtime', 'nssa', 'labour act'],
+    'lease': ['lease', 'landlord', 'tenant', 'lessor', 'lessee', 'rental', 'premises'],
+    'sale': ['purchase price', 'buyer', 'seller', 'goods', 'delivery', 'title shall pass'],
+    'services': ['service provider', 'services', 'deliverables', 'service level', 'contractor'],
+    'nda': ['confidential information', 'disclosing party', 'receiving party', 'non-disclosure'],
+    'loan': ['borrower', 'lender', 'principal amount', 'repayment', 'interest rate', 'security'],
+}
+# Fewer hits than this and the contract counts as 'other'
+MIN_TYPE_HITS = 2
+
+
+@dataclass
+class Route:
+    name: str
+    model: str
+    max_input_tokens: int
+    max_tokens: int
+    context_window: int
+    contract_types: tuple = ()  # Empty: any type
+
+
+@dataclass
+class RouteDecision:
+    route: Route
+    contract_type: str
+    input_tokens: int
+    max_tokens: int
+
+    @property
+    def model(self):
+        return self.route.model
+
+
+def classify_contract(text):
+    """
+    Best-guess contract type of ``text``, or 'other'.
+    """
+    lowered = text.lower()
+    scores = {
+        contract_type: sum(len(re.findall(r'\b' + re.escape(phrase) + r'\b', lowered)) for phrase in phrases)
+        for contract_type, phrases in CONTRACT_TYPE_KEYWORDS.items()
+    }
+    contract_type, hits = max(scores.items(), key=lambda item: item[1])
+    return contract_type if hits >= MIN_TYPE_HITS else 'other'
+
+
+def get_routes():
+    return [
+        Route(
+            name=config['NAME'],
+            model=config['MODEL'],
+            max_input_tokens=config['MAX_INPUT_TOKENS'],
+            max_tokens=config['MAX_TOKENS'],
+            context_window=config['CONTEXT_WINDOW'],
+            contract_types=tuple(config.get('CONTRACT_TYPES') or ()),
+        )
+        for config in settings.LLM_ROUTES
+    ]
+
+
+def choose_route(text, input_tokens):
+    """
+    Pick a route for a prompt of ``input_tokens`` tokens about the contract ``text``.
+
+    The completion budget is the route's ``max_tokens``, reduced if needed
+    so prompt and completion fit the model's context window.
+    """
+    routes = get_routes()
+    contract_type = classify_contract(text)
+    route = routes[-1]
+    for candidate in routes:
+        if candidate.contract_types and contract_type not in candidate.contract_types:
+            continue
+        if input_tokens <= candidate.max_input_tokens:
+            route = candidate
+            break
+    max_tokens = max(1, min(route.max_tokens, route.context_window - input_tokens))
+    return RouteDecision(route=route, contract_type=contract_type, input_tokens=input_tokens,
+                         max_tokens=max_tokens)
+
+
+def record(decision, result):
+    """
+    Record an LLM call made for ``decision`` in the route histograms.
+    """
+    labels = {'route': decision.route.name}
+    metrics.histogram('llm_route_latency_seconds', labels).observe(result.latency)
+    metrics.histogram('llm_route_prompt_tokens', labels, metrics.TOKEN_BUCKETS).observe(
+        result.prompt_tokens or decision.input_tokens
+    )
+    metrics.histogram('llm_route_completion_tokens', labels, metrics.TOKEN_BUCKETS).observe(
+        result.completion_tokens or 0
+    )
+    logger.info(
+        'LLM route %s (%s): type=%s input_tokens=%s completion_tokens=%s latency=%.2fs',
+        decision.route.name, decision.model, decision.contract_type,
+        result.prompt_tokens or decision.input_tokens, result.completion_tokens, result.latency,
+    )
+
+
+def route_stats():
+    """
+    Routing table and per-route histograms, for the admin stats endpoint.
+    """
+    stats = {route.name: {
+        'model': route.model,
+        'max_input_tokens': route.max_input_tokens,
+        'max_tokens': route.max_tokens,
+        'contract_types': list(route.contract_types),
+    } for route in get_routes()}
+    for name in ('llm_route_latency_seconds', 'llm_route_prompt_tokens', 'llm_route_completion_tokens'):
+        for labels, histogram in metrics.collect(name):
+            entry = stats.setdefault(labels['route'], {})
+            snapshot = histogram.snapshot()
+            entry[name] = {
+                **snapshot,
+                'p50': histogram.quantile(0.5),
+                'p95': histogram.quantile(0.95),
+            }
+    return stats
@@ -0,0 +1,161 @@
+"""
+Full-text search over documents and analyses.
+
+SQLite uses the FTS5 tables created in migration 0006, which are kept up to
+date by triggers on insert, update and delete. PostgreSQL uses the GIN
+expression indexes from the same migration. Other backends fall back to
+``icontains`` so the API keeps working, just without ranking.
+
+SQLite migrations that rebuild ``analysis_document`` or
+``analysis_documentanalysis`` (Django's table remake) drop the triggers, so run
+``manage.py rebuild_search_index`` after them.
+"""
+import re
+from importlib import import_module
+
+from django.db import connection
+
+from .models import Document, DocumentAnalysis
+
+# Searchable sources: table, indexed columns and bm25 column weights. The
+# trailing 0.0 weight is the ``owner`` column, which must never affect ranking.
+SOURCES = {
+    'documents': {
+        'model': Document,
+        'table': 'analysis_document',
+        'columns': ['title', 'content'],
+        'weights': (5.0, 1.0, 0.0),
+    },
+    'analyses': {
+        'model': DocumentAnalysis,
+        'table': 'analysis_documentanalysis',
+        'columns': ['content', 'analysis_result'],
+        'weights': (1.0, 2.0, 0.0),
+    },
+}
+
+MAX_TERMS = 16
+SNIPPET_TOKENS = 24
+TERM_RE = re.compile(r'"([^"]+)"|(\w+)', re.UNICODE)
+
+
+def parse_terms(query):
+    """
+    Split a user query into plain terms and quoted phrases.
+    """
+    terms = []
+    for phrase, word in TERM_RE.findall(query or ''):
+        term = (phrase or word).strip()
+        if term:
+            terms.append(term)
+    return terms[:MAX_TERMS]
+
+
+def _fts5_match(terms, columns, user_id):
+    # Every term is quoted so user input can never be parsed as FTS5 syntax.
+    quoted = ' '.join('"{}"'.format(term.replace('"', '""')) for term in terms)
+    expression = '{%s} : (%s)' % (' '.join(columns), quoted)
+    if user_id is not None:
+        expression = f'owner : "u{int(user_id)}" AND {expression}'
+    return expression
+
+
+def _search_sqlite(source, terms, user_id, limit, offset):
+    table = source['table']
+    fts = f'{table}_fts'
+    weights = ', '.join(str(w) for w in source['weights'])
+    sql = (
+        f"SELECT {fts}.rowid, bm25({fts}, {weights}) AS rank, "
+        f"snippet({fts}, -1, '[', ']', '...', {SNIPPET_TOKENS}) "
+        f"FROM {fts} WHERE {fts} MATCH %s ORDER BY rank LIMIT %s OFFSET %s"
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [_fts5_match(terms, source['columns'], user_id), limit, offset])
+        rows = cursor.fetchall()
+    # bm25() is lower-is-better; flip it so callers always sort descending.
+    return [(row_id, -rank, snippet) for row_id, rank, snippet in rows]
+
+
+def _indexed_vector(source):
+    """
+    The ``tsvector`` of a source, written exactly as the GIN index expression
+    of migration 0006 so the planner can use the index.
+    """
+    from django.contrib.postgres.search import SearchVectorField
+    from django.db.models.expressions import RawSQL
+
+    first, second = source['columns']
+    return RawSQL(
+        f"to_tsvector('english', coalesce({first}, '') || ' ' || coalesce({second}, ''))", [],
+        output_field=SearchVectorField(),
+    )
+
+
+def _search_postgresql(source, terms, user_id, limit, offset):
+    from django.contrib.postgres.search import SearchHeadline, SearchQuery, SearchRank
+
+    second = source['columns'][1]
+    search_query = SearchQuery(' '.join(terms), search_type='plain', config='english')
+    vector = _indexed_vector(source)
+    queryset = source['model'].objects.annotate(search=vector).filter(search=search_query)
+    if user_id is not None:
+        queryset = queryset.filter(user_id=user_id)
+    queryset = queryset.annotate(
+        rank=SearchRank(vector, search_query),
+        snippet=SearchHeadline(
+            second, search_query, config='english',
+            start_sel='[', stop_sel=']', max_words=SNIPPET_TOKENS, min_words=SNIPPET_TOKENS // 2,
+        ),
+    ).order_by('-rank')
+    rows = queryset.values_list('id', 'rank', 'snippet')[offset:offset + limit]
+    return list(rows)
+
+
+def _search_fallback(source, terms, user_id, limit, offset):
+    from django.db.models import Q
+
+    queryset = source['model'].objects.all()
+    if user_id is not None:
+        queryset = queryset.filter(user_id=user_id)
+    for term in terms:
+        condition = Q()
+        for column in source['columns']:
+            condition |= Q(**{f'{column}__icontains': term})
+        queryset = queryset.filter(condition)
+    ids = queryset.order_by('-id').values_list('id', flat=True)[offset:offset + limit]
+    return [(row_id, 0.0, '') for row_id in ids]
+
+
+def search(kind, query, user_id=None, limit=20, offset=0):
+    """
+    Run a ranked search against one source ('documents' or 'analyses').
+
+    Returns a list of ``(id, score, snippet)`` tuples, best match first. Pass
+    ``user_id=None`` to search across every user (admin only).
+    """
+    source = SOURCES[kind]
+    terms = parse_terms(query)
+    if not terms:
+        return []
+    if connection.vendor == 'sqlite':
+        return _search_sqlite(source, terms, user_id, limit, offset)
+    if connection.vendor == 'postgresql':
+        return _search_postgresql(source, terms, user_id, limit, offset)
+    return _search_fallback(source, terms, user_id, limit, offset)
+
+
+def matching_ids(kind, query, user_id=None, limit=1000):
+    """
+    Return just the ids of the best matches, e.g. to narrow an admin queryset.
+    """
+    return [row_id for row_id, _, _ in search(kind, query, user_id=user_id, limit=limit)]
+
+
+def rebuild():
+    """
+    Recreate the search indexes, their triggers and their contents.
+    """
+    migration = import_module('analysis.migrations.0006_fulltext_search')
+    with connection.schema_editor() as schema_editor:
+        migration.drop_search_indexes(None, schema_editor)
+        migration.create_search_indexes(None, schema_editor)
@@ -0,0 +1,323 @@
+"""
+Contract analysis pipeline shared by the API views and management commands.
+"""
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+from asgiref.sync import sync_to_async
+
+from . import admission, clauses, coalesce, llm, preflight, routing, timing, tracing, usage
+from .models import DocumentAnalysis
+from .tokens import count_tokens
+
+# Contract prompt template
+CONTRACT_PROMPT = """
+You are LECUA, the Legal Extraction & Compliance Understanding Assistant specializing in Zimbabwean contract law. Analyze the contract text provided and produce a structured **Legal Officer Report**. Use clear numbered headings and sub‑sections, and avoid using asterisks in the report and provide a full report based on the following template:
+
+---REPORT---
+
+1. Parties Identification
+   1.1 First Party
+       • Name: [Name]
+       • Role: [Role]
+   1.2 Second Party
+       • Name: [Name]
+       • Role: [Role]
+
+2. Clause Extraction and Analysis
+For each of the following categories and add a number, include and write every clause in the contract that falls under it. For each clause, provide and if not available do not display it:
+   i. Extracted Text (verbatim): "[Extract Contract text]"
+   ii. Legal Basis: [Act Name] [Chapter] §[Section]
+   iii. Requirements Summary: [Plain‑language explanation]
+   iv. Risk Assessment: [Low/Medium/High] – [Rationale]
+   **Categories to cover**:
+- Commencement & Duration
+
+- Position & Duties
+- Remuneration Structure
+- Working Hours & Overtime
+- Leave Entitlement
+- Termination Conditions
+- NSSA & NEC Clauses
+- Training & Indigenisation
+- Governing Law
+
+
+3. Statutory Compliance Mapping
+For each statute cited in the contract:
+   • Act: [Act Name] [Chapter]
+   • Compliance Status: [Compliant/Partial/Non‑compliant]
+
+4. Risk Log
+List each identified risk as a bullet point:
+   - [Clause Name] – 
+   [Risk Type] – Severity (1–5): [Score] – Mitigation: [Actionable advice]
+
+5. Contract Summary
+   5.1 Purpose of Contract: [One‑sentence overview]
+   5.2 Key Obligations and Timeline:
+       • [Party A]: [Obligation] by [Date]
+       • [Party B]: [Obligation] by [Date]
+   5.3 Critical Dates:
+       • Effective Date: [Date]
+       • Review Period: [Start Date] to [End Date]
+       • Termination Window: [Start Date] to [End Date]
+
+6. Compliance Checklist
+Indicate ✓ for compliant and ✗ for non‑compliant.
+   • Stamp Duties Act [Chapter 23:09]
+   • Income Tax Act [Chapter 23:06] (PAYE)
+   • Data Protection Act [Chapter 11:12]
+   • VAT Act [Chapter 23:12]
+   • Consumer Protection Act [Chapter 14:44]
+
+7. Summary
+Provide a comprehensive paragraph summarizing the entire contract. The summary must include the following with dates and numbers stated in the contract:
+The purpose of the contract (e.g., nature of employment or agreement)
+The start date and duration or end date of the contract
+The obligations and responsibilities of each party involved
+The critical contractual dates (e.g., probation period end, salary payment schedule, renewal or termination conditions)
+Any key terms or conditions that define the rights, duties, and expectations of the parties
+The paragraph should be detailed, specific, and based directly on the content of the contract, avoiding vague or general statements.
+
+---END OF REPORT---
+Contract Text:
+{text}
+"""
+
+
+@lru_cache(maxsize=1)
+def prompt_tokens():
+    """
+    Tokens of the contract prompt around the contract text.
+    """
+    return count_tokens(CONTRACT_PROMPT.format(text=''))
+
+
+def build_request(text, tokens=None):
+    """
+    Messages for the contract prompt and the route chosen for them.
+
+    ``tokens`` is the token count of ``text`` if already known; the prompt
+    around it is counted once per process.
+    """
+    if tokens is None:
+        tokens = count_tokens(text)
+    prompt = CONTRACT_PROMPT.format(text=text)
+    return [{"role": "user", "content": prompt}], routing.choose_route(text, prompt_tokens() + tokens)
+
+
+def llm_span_attributes(decision):
+    # OpenTelemetry GenAI semantic convention names
+    return {
+        'gen_ai.system': 'openai',
+        'gen_ai.request.model': decision.model,
+        'gen_ai.request.max_tokens': decision.max_tokens,
+        'llm.route': decision.route.name,
+    }
+
+
+def record_llm_span(span, result):
+    if span is not None:
+        span.set(**{
+            'gen_ai.response.model': result.model,
+            'gen_ai.usage.input_tokens': result.prompt_tokens,
+            'gen_ai.usage.output_tokens': result.completion_tokens,
+            'llm.attempts': result.attempts,
+        })
+
+
+def send_request(request, user=None, reservation=None):
+    """
+    Send a ``build_request`` request to its routed model and return the report.
+
+    The call's tokens and latency are metered against ``user``, drawing on
+    ``reservation`` if the tokens were reserved up front.
+    """
+    messages, decision = request
+    with admission.admit('llm'), timing.stage('llm', **llm_span_attributes(decision)) as span:
+        result = llm.get_client().complete(
+            model=decision.model,
+            messages=messages,
+            temperature=1,
+            max_tokens=decision.max_tokens,
+            top_p=1
+        )
+        record_llm_span(span, result)
+    routing.record(decision, result)
+    usage.record_usage(user, decision, result, reservation)
+    return result.text
+
+
+async def asend_request(request, user=None, reservation=None):
+    """
+    Async ``send_request``; holds no thread while the model works.
+    """
+    messages, decision = request
+    async with admission.aadmit('llm'):
+        with timing.stage('llm', **llm_span_attributes(decision)) as span:
+            result = await llm.get_client().acomplete(
+                model=decision.model,
+                messages=messages,
+                temperature=1,
+                max_tokens=decision.max_tokens,
+                top_p=1
+            )
+            record_llm_span(span, result)
+    routing.record(decision, result)
+    await sync_to_async(usage.record_usage)(user, decision, result, reservation)
+    return result.text
+
+
+def run_contract_prompt(text, user=None):
+    """
+    Send the contract prompt for ``text`` to the routed model and return the report.
+
+    The call's tokens and latency are metered against ``user``.
+    """
+    return send_request(build_request(text), user)
+
+
+async def arun_contract_prompt(text, user=None):
+    """
+    Async ``run_contract_prompt``; holds no thread while the model works.
+    """
+    return await asend_request(build_request(text), user)
+
+
+def chunk_label(number, count):
+    """
+    Heading of a chunk of an over-budget contract, so each report says which part it covers.
+    """
+    return f'(Part {number} of {count} of a longer contract)\n\n'
+
+
+def build_requests(prepared):
+    """
+    ``build_request`` for each chunk of a ``preflight.prepare`` result,
+    labelled if there are several, reusing its token counts.
+    """
+    chunks = prepared.chunks
+    if len(chunks) == 1:
+        return [build_request(chunks[0], prepared.chunk_tokens[0])]
+    requests = []
+    for number, (chunk, tokens) in enumerate(zip(chunks, prepared.chunk_tokens), 1):
+        label = chunk_label(number, len(chunks))
+        requests.append(build_request(label + chunk, count_tokens(label) + tokens))
+    return requests
+
+
+def estimate_tokens(requests):
+    """
+    Most tokens ``requests`` can use: their whole prompts plus their completion budgets.
+    """
+    return sum(decision.input_tokens + decision.max_tokens for _, decision in requests)
+
+
+def merge_reports(reports):
+    """
+    Join the per-chunk reports of a chunked analysis in document order.
+    """
+    if len(reports) == 1:
+        return reports[0]
+    return '\n\n'.join(
+        f'===== PART {i} OF {len(reports)} =====\n{report.strip()}' for i, report in enumerate(reports, 1)
+    )
+
+
+def run_requests(requests, user=None, reservation=None):
+    """
+    Send the ``build_requests`` of a contract, in parallel when there are
+    several, and merge the reports.
+    """
+    if len(requests) == 1:
+        return send_request(requests[0], user, reservation)
+    with ThreadPoolExecutor(max_workers=min(len(requests), 4)) as executor:
+        # Chunk calls count towards the timings of the request that made them
+        send = timing.run_in_context(lambda request: send_request(request, user, reservation))
+        return merge_reports(list(executor.map(send, requests)))
+
+
+async def arun_requests(requests, user=None, reservation=None):
+    """
+    Async ``run_requests``.
+    """
+    return merge_reports(await asyncio.gather(
+        *(asend_request(request, user, reservation) for request in requests)
+    ))
+
+
+def save_analysis(user, text, analysis_result, latency=None):
+    """
+    Store an analysis, ``latency`` seconds after it was submitted, and index its clauses.
+    """
+    with timing.stage('save'):
+        analysis = DocumentAnalysis.objects.create(
+            content=text,
+            analysis_result=analysis_result,
+            user=user,
+            trace_id=tracing.current_trace_id(),
+            latency=latency
+        )
+        # Make the extracted clauses available to similar-clause lookups
+        clauses.index_analysis(analysis)
+    return analysis
+
+
+def analyze_contract(user, text, pages=None):
+    """
+    Analyze ``text`` for ``user`` and store the result as a DocumentAnalysis.
+
+    The text is compacted (and chunked if still over budget) before it is
+    sent; the original is what gets stored. ``pages`` are the extracted
+    pages of ``text``, when it was just extracted, for pre-flight. Identical texts submitted at the
+    same time share a single model call. The returned analysis carries the
+    pre-flight token report as ``analysis.preflight``.
+
+    The estimated tokens are reserved from the user's quota before any call
+    is made. Raises ``usage.QuotaExceeded`` if the user is out of tokens, and
+    ``usage.RequestTooLarge`` if the analysis could use more than their whole
+    quota.
+    """
+    started = time.monotonic()
+    with timing.stage('preflight'):
+        prepared = preflight.prepare(text, pages)
+        requests = build_requests(prepared)
+    reservation = usage.reserve(user, estimate_tokens(requests))
+    key = coalesce.make_key(CONTRACT_PROMPT, *prepared.chunks)
+    try:
+        analysis_result, _ = coalesce.single_flight(key, lambda: run_requests(requests, user, reservation))
+    finally:
+        usage.release(reservation)
+    analysis = save_analysis(user, text, analysis_result, time.monotonic() - started)
+    analysis.preflight = prepared.report()
+    return analysis
+
+
+async def aanalyze_contract(user, text):
+    """
+    Async ``analyze_contract`` for the ASGI views.
+    """
+    started = time.monotonic()
+    with timing.stage('preflight'):
+        prepared = preflight.prepare(text)
+        requests = build_requests(prepared)
+    reservation = await sync_to_async(usage.reserve)(user, estimate_tokens(requests))
+    key = coalesce.make_key(CONTRACT_PROMPT, *prepared.chunks)
+    try:
+        analysis_result, _ = await coalesce.single_flight_async(
+            key, lambda: arun_requests(requests, user, reservation)
+        )
+    finally:
+        # Hand back the unused tokens even if the client went away
+        await asyncio.shield(sync_to_async(usage.release)(reservation))
+    # One hop to the ORM thread for the insert and the clause indexing. The
+    # tokens are paid for by now, so keep the result even if the client has
+    # gone; a disconnect before this point cancels the model call instead.
+    analysis = await asyncio.shield(
+        sync_to_async(save_analysis)(user, text, analysis_result, time.monotonic() - started)
+    )
+    analysis.preflight = prepared.report()
+    return analysis
@@ -0,0 +1,76 @@
+import time
+
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import authentication, notifications, timing, versions
+from .models import Clause, Document, DocumentAnalysis, NotificationDelivery, User
+
+
+@receiver(post_delete, sender=Clause)
+def remove_clause_from_index(sender, instance, **kwargs):
+    # Imported lazily so loading the signal handlers does not touch the index
+    from .clauses import get_index
+    get_index().remove([instance.pk])
+
+
+@receiver([post_save, post_delete], sender=Document)
+def bump_documents_version(sender, instance, **kwargs):
+    versions.bump('documents', instance.user_id)
+
+
+@receiver([post_save, post_delete], sender=DocumentAnalysis)
+def bump_analyses_version(sender, instance, **kwargs):
+    versions.bump('analyses', instance.user_id)
+
+
+@receiver(post_save, sender=User)
+def bump_profile_version(sender, instance, **kwargs):
+    versions.bump('profile', instance.pk)
+    # Other processes see the bump on their next poll; this one stops
+    # trusting the user's token claims at once
+    authentication.user_states.invalidate(instance.pk)
+
+
+@receiver(post_delete, sender=User)
+def forget_user_versions(sender, instance, **kwargs):
+    # Sent after the user's documents and analyses, whose deletion bumped them
+    versions.forget_user(instance.pk)
+    authentication.user_states.invalidate(instance.pk)
+
+
+@receiver(post_delete, sender=NotificationDelivery)
+def forget_delivery(sender, instance, **kwargs):
+    # Deleted with its notification, e.g. when the report is deleted
+    if not instance.is_read:
+        notifications.remove_unread(instance.user_id)
+
+
+@receiver(connection_created)
+def tune_sqlite_connection(sender, connection, **kwargs):
+    # WAL lets readers run alongside the single writer, and NORMAL sync drops
+    # the per-commit fsync that otherwise bounds write throughput. WAL sticks
+    # to the file, hence SQLITE_WAL.
+    if connection.vendor == 'sqlite' and getattr(settings, 'SQLITE_WAL', False):
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode=WAL')
+            cursor.execute('PRAGMA synchronous=NORMAL')
+
+
+def _timed_query(execute, sql, params, many, context):
+    # Timed without a span each: a request runs dozens of queries
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timing.record('db', time.perf_counter() - started)
+
+
+@receiver(connection_created)
+def time_queries(sender, connection, **kwargs):
+    # Every ORM query counts towards the "db" stage of the request running it.
+    # The wrapper list outlives reconnects of the same connection object.
+    if _timed_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_timed_query)
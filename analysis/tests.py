@@ -0,0 +1,838 @@
+import asyncio
+import glob
+import gzip
+import hashlib
+import io
+import json
+import os
+import tempfile
+import time
+import uuid
+import zipfile
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from importlib import import_module
+from types import SimpleNamespace
+from unittest import mock
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.test import AsyncRequestFactory, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from django.utils.http import http_date
+from rest_framework.renderers import JSONRenderer
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from . import (
+    admission, async_views, batches, clauses, coalesce, extraction, llm, metrics, notifications, preflight, routing, search,
+    services, tracing, usage,
+)
+from .authentication import add_claims, build_user, user_states
+from .clause_index import ClauseIndex
+from .models import (
+    AdmissionTicket, Analysis, AnalysisFlight, Document, DocumentAnalysis, IdempotencyRecord, LLMUsage, Notification,
+    User,
+)
+from .renderers import ORJSONRenderer
+
+
+def make_user(email, **fields):
+    return User.objects.create_user(email=email, username=email.split('@')[0], password='Secret!12345', **fields)
+
+
+def auth_header(user):
+    return 'Bearer ' + str(add_claims(RefreshToken.for_user(user), user).access_token)
+
+
+class SearchTests(TestCase):
+
+    def setUp(self):
+        self.user = make_user('searcher@example.com')
+        self.other = make_user('other@example.com')
+        self.titled = Document.objects.create(
+            user=self.user, title='Termination agreement', content='Either party may end this contract.'
+        )
+        self.body = Document.objects.create(
+            user=self.user, title='Lease', content='Termination requires thirty days written notice.'
+        )
+        Document.objects.create(user=self.other, title='Termination letter', content='Termination notice.')
+
+    def test_search_is_scoped_and_ranked(self):
+        hits = search.search('documents', 'termination', user_id=self.user.pk)
+        # A title hit outranks a body hit; the other user's document is not found
+        self.assertEqual([row_id for row_id, _, _ in hits], [self.titled.pk, self.body.pk])
+
+    def test_phrases_match_as_phrases(self):
+        self.assertEqual(search.matching_ids('documents', '"written notice"', user_id=self.user.pk), [self.body.pk])
+        self.assertEqual(search.matching_ids('documents', '"notice written"', user_id=self.user.pk), [])
+
+    def test_query_syntax_is_not_interpreted(self):
+        self.assertEqual(search.search('documents', 'termination OR NOT * owner:u2', user_id=self.user.pk), [])
+
+    def test_view_returns_snippets(self):
+        response = self.client.get(
+            '/api/search/', {'q': 'notice', 'type': 'documents'}, HTTP_AUTHORIZATION=auth_header(self.user)
+        )
+        self.assertEqual(response.status_code, 200)
+        (hit,) = response.json()['documents']
+        self.assertEqual(hit['id'], self.body.pk)
+        self.assertIn('[notice]', hit['snippet'])
+
+    def test_postgresql_vector_is_the_indexed_expression(self):
+        migration = import_module('analysis.migrations.0006_fulltext_search')
+        for source, index in zip(search.SOURCES.values(), migration.POSTGRES_INDEXES):
+            self.assertIn(f'({search._indexed_vector(source).sql})', index)
+
+
+class ClauseIndexTests(TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.index = ClauseIndex(directory.name)
+        self.index.add([1, 2, 3], [10, 10, 20], [
+            'The employee may terminate this agreement on thirty days written notice.',
+            'Rent is payable monthly in advance to the landlord.',
+            'Either party may terminate the agreement on thirty days notice.',
+        ])
+
+    def test_most_similar_clause_first(self):
+        hits = self.index.query('terminate on thirty days notice', k=3)
+        self.assertEqual({clause_id for clause_id, _ in hits[:2]}, {1, 3})
+        self.assertEqual(hits[-1][0], 2)
+        self.assertGreater(hits[0][1], hits[-1][1])
+
+    def test_query_is_scoped_to_the_owner(self):
+        hits = self.index.query('terminate on thirty days notice', k=3, owner=20)
+        self.assertEqual([clause_id for clause_id, _ in hits], [3])
+
+    def test_removed_clauses_stop_matching_and_are_compacted(self):
+        self.index.remove([1])
+        self.assertNotIn(1, [clause_id for clause_id, _ in self.index.query('terminate', k=3)])
+        self.assertEqual(self.index.compact(), 1)
+        self.assertEqual(len(self.index), 2)
+
+    def test_clauses_are_extracted_from_reports(self):
+        report = (
+            'i. Extracted Text (verbatim): "Rent is due   monthly."\n'
+            'iv. Risk Assessment: Low risk, standard term.\n'
+            'i. Extracted Text (verbatim): "Notice must be in writing."\n'
+        )
+        self.assertEqual(clauses.extract_clauses(report), [
+            ('Rent is due monthly.', 'low', 'Low risk, standard term.'),
+            ('Notice must be in writing.', 'unknown', ''),
+        ])
+
+
+class CoalesceTests(TestCase):
+
+    def test_waiters_take_over_after_a_transient_leader_failure(self):
+        key = coalesce.make_key('transient')
+
+        def rejected():
+            raise admission.AdmissionRejected('llm', 5)
+
+        with self.assertRaises(admission.AdmissionRejected):
+            coalesce.single_flight(key, rejected)
+        self.assertIsNone(coalesce._outcome(coalesce._poll(key)))
+        self.assertEqual(coalesce.single_flight(key, lambda: 'report'), ('report', False))
+
+    def test_waiters_share_a_rejected_request(self):
+        key = coalesce.make_key('rejected')
+
+        def bad_request():
+            raise llm.StubBackendError(400)
+
+        with self.assertRaises(llm.StubBackendError):
+            coalesce.single_flight(key, bad_request)
+        self.assertEqual(AnalysisFlight.objects.get(key=key).status, 'failed')
+        with self.assertRaises(coalesce.CoalescedAnalysisError):
+            coalesce._outcome(coalesce._poll(key))
+
+    def test_shared_failure_is_a_bad_gateway(self):
+        user = make_user('waiter@example.com')
+        error = coalesce.CoalescedAnalysisError('Injected stub failure (400)')
+        with mock.patch('analysis.services.analyze_contract', side_effect=error), \
+                mock.patch('analysis.services.aanalyze_contract', side_effect=error):
+            response = self.client.post(
+                '/api/analyze-text/', {'text': 'A contract.'}, content_type='application/json',
+                HTTP_AUTHORIZATION=auth_header(user),
+            )
+        self.assertEqual(response.status_code, 502)
+
+
+class FailingBackend:
+
+    def __init__(self, error):
+        self.error = error
+
+    def complete(self, model, messages, **params):
+        raise self.error
+
+    async def acomplete(self, model, messages, **params):
+        raise self.error
+
+
+class FlakyBackend:
+
+    def __init__(self, failures):
+        self.failures = failures
+
+    def complete(self, model, messages, **params):
+        if self.failures:
+            self.failures -= 1
+            raise llm.StubBackendError(503)
+        return llm.LLMResult(text='report', model=model)
+
+
+class CircuitBreakerTests(TestCase):
+
+    def half_open_client(self, error):
+        breaker = llm.CircuitBreaker(failure_threshold=1, reset_timeout=0)
+        breaker.record_failure()
+        return llm.LLMClient(FailingBackend(error), max_retries=0, breaker=breaker), breaker
+
+    def test_cancelled_trial_leaves_the_circuit_half_open(self):
+        client, breaker = self.half_open_client(asyncio.CancelledError())
+        with self.assertRaises(asyncio.CancelledError):
+            asyncio.run(client.acomplete('model', []))
+        self.assertEqual(breaker.state, 'half_open')
+        # The next call is let through as a new trial
+        breaker.before_call()
+
+    def test_interrupted_sync_trial_leaves_the_circuit_half_open(self):
+        client, breaker = self.half_open_client(KeyboardInterrupt())
+        with self.assertRaises(KeyboardInterrupt):
+            client.complete('model', [])
+        self.assertEqual(breaker.state, 'half_open')
+        breaker.before_call()
+
+    def test_rejected_request_does_not_close_the_circuit(self):
+        client, breaker = self.half_open_client(llm.StubBackendError(400))
+        with self.assertRaises(llm.StubBackendError):
+            client.complete('model', [])
+        self.assertEqual(breaker.state, 'half_open')
+
+    def test_transient_errors_are_retried(self):
+        client = llm.LLMClient(FlakyBackend(failures=2), max_retries=3, backoff_base=0)
+        result = client.complete('model', [])
+        self.assertEqual((result.text, result.attempts), ('report', 3))
+        self.assertEqual(client.breaker.state, 'closed')
+
+    def test_circuit_opens_after_repeated_outages(self):
+        client = llm.LLMClient(FlakyBackend(failures=10), max_retries=0,
+                               breaker=llm.CircuitBreaker(failure_threshold=2, reset_timeout=60))
+        for _ in range(2):
+            with self.assertRaises(llm.StubBackendError):
+                client.complete('model', [])
+        with self.assertRaises(llm.CircuitOpenError):
+            client.complete('model', [])
+        self.assertEqual(client.backend.failures, 8)
+
+
+class AsyncAnalyzeViewTests(TestCase):
+
+    def setUp(self):
+        self.authorization = auth_header(make_user('async@example.com'))
+        self.factory = AsyncRequestFactory()
+
+    async def post(self, body):
+        request = self.factory.post(
+            '/api/analyze-text/', body, content_type='application/json', headers={'Authorization': self.authorization}
+        )
+        return await async_views.analyze_text(request)
+
+    async def test_body_without_an_object_is_a_bad_request(self):
+        for body in ('["text"]', '"text"', '3'):
+            response = await self.post(body)
+            self.assertEqual(response.status_code, 400, body)
+
+    async def test_text_is_analyzed(self):
+        analysis = mock.Mock(analysis_result='report', preflight={'chunks': 1})
+        with mock.patch('analysis.services.aanalyze_contract', mock.AsyncMock(return_value=analysis)) as analyze:
+            response = await self.post({'text': 'A contract.'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(analyze.await_args.args[1], 'A contract.')
+
+    async def test_api_key_errors_are_explained(self):
+        error = ValueError('Incorrect API key provided')
+        with mock.patch('analysis.services.aanalyze_contract', mock.AsyncMock(side_effect=error)):
+            response = await self.post({'text': 'A contract.'})
+        self.assertEqual(response.status_code, 500)
+        self.assertIn('Invalid or missing OpenAI API key', response.content.decode())
+
+
+FAST_ROUTE = {
+    'NAME': 'fast', 'MODEL': 'ft:gpt-3.5-turbo-0125:test', 'MAX_INPUT_TOKENS': 6000, 'MAX_TOKENS': 2048,
+    'CONTEXT_WINDOW': 16385, 'CONTRACT_TYPES': ['employment', 'lease'],
+}
+LARGE_ROUTE = {'NAME': 'large', 'MODEL': 'gpt-4o', 'MAX_INPUT_TOKENS': 120000, 'MAX_TOKENS': 4096, 'CONTEXT_WINDOW': 128000}
+EMPLOYMENT = 'The employer pays the employee a monthly salary and annual leave of 22 days.'
+
+
+@override_settings(LLM_ROUTES=[FAST_ROUTE, LARGE_ROUTE])
+class RoutingTests(TestCase):
+
+    def test_short_contract_of_a_trained_type_takes_the_fast_route(self):
+        decision = routing.choose_route(EMPLOYMENT, 1000)
+        self.assertEqual((decision.route.name, decision.contract_type), ('fast', 'employment'))
+        self.assertEqual(decision.max_tokens, 2048)
+
+    def test_unrecognised_contract_takes_the_large_route(self):
+        decision = routing.choose_route('The parties agree as follows.', 1000)
+        self.assertEqual((decision.route.name, decision.contract_type), ('large', 'other'))
+
+    def test_long_contract_takes_the_large_route(self):
+        self.assertEqual(routing.choose_route(EMPLOYMENT, 6001).route.name, 'large')
+
+    def test_completion_budget_fits_the_context_window(self):
+        self.assertEqual(routing.choose_route(EMPLOYMENT, 126000).max_tokens, 2000)
+
+    @override_settings(LLM_ROUTES=[dict(FAST_ROUTE, CONTRACT_TYPES=[])])
+    def test_single_route_takes_everything(self):
+        self.assertEqual(routing.choose_route('The parties agree as follows.', 50000).route.name, 'fast')
+
+    def test_requests_count_the_prompt_and_chunk_labels(self):
+        prepared = preflight.PreflightResult(text='', original_tokens=0, tokens=0,
+                                             chunks=[EMPLOYMENT, EMPLOYMENT], chunk_tokens=[100, 100])
+        requests = services.build_requests(prepared)
+        for number, (messages, decision) in enumerate(requests, 1):
+            self.assertIn(f'(Part {number} of 2', messages[0]['content'])
+            self.assertGreater(decision.input_tokens, 100 + services.prompt_tokens())
+        self.assertEqual(services.estimate_tokens(requests),
+                         sum(decision.input_tokens + decision.max_tokens for _, decision in requests))
+
+
+class PreflightTests(TestCase):
+
+    def test_unpaginated_text_keeps_headings_and_numbers(self):
+        text = (
+            'EMPLOYMENT AGREEMENT\n\nClause 1 Term\nThe term is 12 months.\n\n'
+            'Clause 2 Salary\n12\n\n3 of 4 parties agree.\n\nClause 3 Leave\nLeave is 22 days.'
+        )
+        self.assertEqual(preflight.compact(text), text)
+
+    def test_page_furniture_is_stripped_from_paginated_text(self):
+        pages = [
+            f'ACME Holdings Confidential\nClause {i} Heading\nThe body of clause {i}.\nPage {i} of 4'
+            for i in range(1, 5)
+        ]
+        compacted = preflight.compact('\f'.join(pages))
+        self.assertNotIn('ACME Holdings Confidential', compacted)
+        self.assertNotIn('Page 1 of 4', compacted)
+        for i in range(1, 5):
+            self.assertIn(f'Clause {i} Heading', compacted)
+            self.assertIn(f'The body of clause {i}.', compacted)
+
+    def test_extracted_pages_are_used_but_not_stored(self):
+        pages = [f'ACME Holdings Confidential\nClause {i} Heading\nPage {i} of 4\n' for i in range(1, 5)]
+        reader = mock.Mock(pages=[mock.Mock(extract_text=mock.Mock(return_value=page)) for page in pages])
+        with mock.patch('PyPDF2.PdfReader', return_value=reader):
+            stored = extraction.process_uploaded_file(ContentFile(b'%PDF-1.4', name='contract.pdf'))
+        self.assertEqual(stored, ''.join(pages))
+        self.assertNotIn('ACME', preflight.prepare(stored, pages).text)
+        # Without the pages, a repeated line may be a heading and is kept
+        self.assertIn('ACME', preflight.prepare(stored).text)
+
+
+@override_settings(ADMISSION_CONTROL=True, ADMISSION_POOLS={
+    'test': {'LIMIT': 1, 'MAX_QUEUE': 2, 'WAIT_TIMEOUT': 0, 'LEASE': 300},
+})
+class AdmissionTests(TestCase):
+
+    def test_jobs_over_the_limit_wait_their_turn(self):
+        running = admission._enqueue('test')
+        first, second = admission._enqueue('test'), admission._enqueue('test')
+        self.assertEqual([running.state, first.state, second.state], ['running', 'waiting', 'waiting'])
+        self.assertFalse(admission._try_promote(first))
+        admission._release(running, None)
+        # Arrival order: the second waiter cannot jump the first
+        self.assertFalse(admission._try_promote(second))
+        self.assertTrue(admission._try_promote(first))
+        self.assertEqual(admission.queue_depth('test'), (1, 1))
+
+    def test_full_queue_is_rejected(self):
+        for _ in range(3):
+            admission._enqueue('test')
+        with self.assertRaises(admission.AdmissionRejected) as rejected:
+            admission._enqueue('test')
+        self.assertGreaterEqual(rejected.exception.retry_after, 1)
+
+    def test_wait_timeout_rejects_and_gives_the_ticket_back(self):
+        admission._enqueue('test')
+        with self.assertRaises(admission.AdmissionRejected):
+            with admission.admit('test'):
+                pass
+        self.assertEqual(admission.queue_depth('test'), (0, 1))
+
+    def test_expired_lease_frees_its_slot(self):
+        stale = admission._enqueue('test')
+        AdmissionTicket.objects.filter(pk=stale.pk).update(expires_at=stale.created_at)
+        with admission.admit('test'):
+            self.assertEqual(admission.queue_depth('test'), (0, 1))
+        self.assertEqual(admission.queue_depth('test'), (0, 0))
+
+
+def fake_call(prompt_tokens, completion_tokens):
+    decision = SimpleNamespace(model='gpt-4o', input_tokens=prompt_tokens, route=SimpleNamespace(name='large'))
+    result = llm.LLMResult(
+        text='report', model='gpt-4o', prompt_tokens=prompt_tokens, completion_tokens=completion_tokens, latency=0.5
+    )
+    return decision, result
+
+
+class QuotaTests(TestCase):
+
+    def setUp(self):
+        self.user = make_user('metered@example.com', token_quota=1000)
+
+    def test_analysis_larger_than_the_whole_quota_is_rejected(self):
+        user = make_user('small@example.com', token_quota=100)
+        response = self.client.post(
+            '/api/analyze-text/', {'text': 'The employer pays the employee a salary.'},
+            content_type='application/json', HTTP_AUTHORIZATION=auth_header(user),
+        )
+        self.assertEqual(response.status_code, 413)
+        self.assertNotIn('Retry-After', response)
+
+    def test_reservations_count_against_the_quota(self):
+        reservation = usage.reserve(self.user, 600)
+        with self.assertRaises(usage.QuotaExceeded) as raised:
+            usage.reserve(self.user, 600)
+        self.assertEqual(raised.exception.used, 600)
+        # The refused hold was rolled back
+        self.assertEqual(usage.tokens_used(self.user), 600)
+        usage.release(reservation)
+        self.assertEqual(usage.tokens_used(self.user), 0)
+        usage.reserve(self.user, 600)
+
+    def test_calls_draw_on_the_reservation(self):
+        reservation = usage.reserve(self.user, 500)
+        usage.record_usage(self.user, *fake_call(200, 100), reservation)
+        self.assertEqual(usage.tokens_used(self.user), 500)
+        usage.record_usage(self.user, *fake_call(200, 100), reservation)
+        self.assertEqual(usage.tokens_used(self.user), 600)
+        usage.release(reservation)
+        self.assertEqual(usage.tokens_used(self.user), 600)
+
+    def test_analysis_settles_to_actual_usage_and_records_its_latency(self):
+        self.user.token_quota = 10000
+        self.user.save()
+        since = timezone.now()
+        client = llm.LLMClient(llm.StubBackend())
+        with mock.patch('analysis.llm.get_client', return_value=client):
+            analysis = services.analyze_contract(self.user, 'The employer pays the employee a salary.')
+        self.assertIsNotNone(analysis.latency)
+        (call,) = LLMUsage.objects.filter(user=self.user)
+        self.assertEqual(usage.tokens_used(self.user), call.prompt_tokens + call.completion_tokens)
+        latency = usage.latency_percentiles(since)
+        self.assertEqual(latency['analyses']['count'], 1)
+        self.assertEqual(latency['llm_calls']['overall']['count'], 1)
+
+
+class IdempotencyTests(TestCase):
+
+    def setUp(self):
+        self.user = make_user('retrier@example.com')
+        self.authorization = auth_header(self.user)
+        self.analysis = mock.Mock(analysis_result='report', preflight={'chunks': 1})
+
+    def post(self, text, key='key-1'):
+        return self.client.post(
+            '/api/analyze-text/', {'text': text}, content_type='application/json',
+            HTTP_AUTHORIZATION=self.authorization, HTTP_IDEMPOTENCY_KEY=key,
+        )
+
+    def test_repeat_replays_the_stored_response(self):
+        with mock.patch('analysis.services.aanalyze_contract', mock.AsyncMock(return_value=self.analysis)) as analyze:
+            first = self.post('A contract.')
+            second = self.post('A contract.')
+        self.assertEqual(analyze.call_count, 1)
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.assertEqual(second.json(), first.json())
+
+    def test_key_reused_for_another_body_is_rejected(self):
+        with mock.patch('analysis.services.aanalyze_contract', mock.AsyncMock(return_value=self.analysis)):
+            self.post('A contract.')
+            self.assertEqual(self.post('Another contract.').status_code, 422)
+
+    def test_repeat_while_processing_is_a_conflict(self):
+        IdempotencyRecord.objects.create(
+            user=self.user, key='key-1', path='/api/analyze-text/',
+            fingerprint=hashlib.sha256(b'{"text": "A contract."}').hexdigest(),
+        )
+        response = self.post('A contract.')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response['Retry-After'], '1')
+
+    def test_transient_failures_are_not_replayed(self):
+        with mock.patch('analysis.services.aanalyze_contract', mock.AsyncMock(side_effect=llm.CircuitOpenError(5))):
+            self.assertEqual(self.post('A contract.').status_code, 503)
+        with mock.patch('analysis.services.aanalyze_contract', mock.AsyncMock(return_value=self.analysis)):
+            response = self.post('A contract.')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('Idempotent-Replayed', response)
+
+    async def test_disconnect_cancels_the_analysis_and_frees_the_key(self):
+        started, cancelled = asyncio.Event(), asyncio.Event()
+
+        async def analyze(user, text):
+            started.set()
+            try:
+                await asyncio.sleep(60)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        request = AsyncRequestFactory().post(
+            '/api/analyze-text/', {'text': 'A contract.'}, content_type='application/json',
+            headers={'Authorization': self.authorization, 'Idempotency-Key': 'key-1'},
+        )
+        with mock.patch('analysis.services.aanalyze_contract', analyze):
+            task = asyncio.create_task(async_views.analyze_text(request))
+            await started.wait()
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+        self.assertTrue(cancelled.is_set())
+        self.assertFalse(await IdempotencyRecord.objects.filter(user=self.user).aexists())
+
+
+def zip_upload(files):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as zf:
+        for name, content in files.items():
+            zf.writestr(name, content)
+    buffer.seek(0)
+    return buffer
+
+
+class ArchiveTests(TestCase):
+
+    def spooled(self):
+        return set(glob.glob(os.path.join(tempfile.gettempdir(), 'analysis-batch-*')))
+
+    @override_settings(BATCH_MAX_ARCHIVE_SIZE=1000)
+    def test_archive_over_the_unpacked_size_cap_is_rejected(self):
+        before = self.spooled()
+        # Compresses to a few hundred bytes, unpacks to 1200
+        upload = zip_upload({'a.txt': 'a' * 600, 'b.txt': 'b' * 600})
+        with self.assertRaises(batches.BatchError):
+            batches.read_archive(upload)
+        self.assertEqual(self.spooled(), before)
+
+    @override_settings(BATCH_MAX_ARCHIVE_SIZE=1000)
+    def test_archive_under_the_cap_is_read_lazily(self):
+        archive = batches.read_archive(zip_upload({'a.txt': 'first', 'b.txt': 'second'}))
+        try:
+            self.assertEqual(sorted(archive.names), ['a.txt', 'b.txt'])
+            self.assertEqual(archive.read('b.txt'), b'second')
+        finally:
+            archive.close()
+        self.assertFalse(os.path.exists(archive.path))
+
+
+class ImportContractsTests(TestCase):
+
+    def import_for(self, user, directory, restart=True):
+        out = io.StringIO()
+        checkpoint = os.path.join(directory, '.checkpoint.json')
+        call_command('import_contracts', directory, user=str(user.pk), workers=1, checkpoint=checkpoint,
+                     restart=restart, stdout=out, stderr=io.StringIO())
+        return out.getvalue()
+
+    def test_duplicates_are_per_user(self):
+        first, second = make_user('first@example.com'), make_user('second@example.com')
+        with tempfile.TemporaryDirectory() as directory:
+            for name in ('a', 'b'):
+                with open(os.path.join(directory, f'{name}.txt'), 'w') as f:
+                    f.write(f'Contract {name} between the parties.')
+            self.import_for(first, directory)
+            self.import_for(second, directory)
+            self.assertIn('0 imported, 2 duplicates', self.import_for(second, directory))
+        self.assertEqual(Document.objects.filter(user=first).count(), 2)
+        self.assertEqual(Document.objects.filter(user=second).count(), 2)
+
+
+class ReanalyzeTests(TransactionTestCase):
+    # The command analyzes on worker threads, which need to see committed rows
+
+    def test_resume_skips_documents_stored_before_the_checkpoint(self):
+        user = make_user('owner@example.com')
+        first, second = (
+            Document.objects.create(user=user, title=name, content=f'Contract {name} between the parties.')
+            for name in ('a', 'b')
+        )
+        prompt_version = hashlib.sha256(services.CONTRACT_PROMPT.encode('utf-8')).hexdigest()[:12]
+        # The first batch was stored, then the run died before writing its checkpoint
+        Analysis.objects.create(document=first, result='report', prompt_version=prompt_version)
+        client = llm.LLMClient(llm.StubBackend())
+        with tempfile.TemporaryDirectory() as directory, mock.patch('analysis.llm.get_client', return_value=client):
+            call_command('reanalyze', batch_size=1, checkpoint=os.path.join(directory, 'checkpoint.json'),
+                         stdout=io.StringIO(), stderr=io.StringIO())
+        self.assertEqual(Analysis.objects.filter(document=first).count(), 1)
+        self.assertEqual(Analysis.objects.filter(document=second, prompt_version=prompt_version).count(), 1)
+        self.assertEqual(LLMUsage.objects.count(), 1)
+
+
+class ExportTests(TestCase):
+
+    def setUp(self):
+        admin = make_user('admin@example.com', is_staff=True)
+        self.authorization = auth_header(admin)
+        for number in range(5):
+            Document.objects.create(user=admin, title=f'Contract {number}', content='Terms.')
+
+    def test_formulas_are_escaped_in_csv(self):
+        Document.objects.filter(title='Contract 0').update(title='=HYPERLINK("http://example.com")')
+        Document.objects.filter(title='Contract 1').update(title='-2+3')
+        response = self.client.get('/api/admin/export/documents/', HTTP_AUTHORIZATION=self.authorization)
+        content = b''.join(response.streaming_content).decode()
+        self.assertIn('"\'=HYPERLINK(""http://example.com"")"', content)
+        self.assertIn(",'-2+3,", content)
+
+    @mock.patch('analysis.exports.BATCH_LINES', 2)
+    async def test_export_streams_under_asgi(self):
+        response = await self.async_client.get(
+            '/api/admin/export/documents/', {'as': 'ndjson'}, headers={'Authorization': self.authorization}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.is_async)
+        chunks = [chunk async for chunk in response.streaming_content]
+        self.assertEqual(len(chunks), 3)
+        self.assertEqual(b''.join(chunks).count(b'\n'), 5)
+
+
+class TimingTests(TestCase):
+
+    def test_response_carries_server_timing_with_query_stage(self):
+        user = make_user('timed@example.com')
+        response = self.client.get('/api/analyses/', HTTP_AUTHORIZATION=auth_header(user))
+        self.assertEqual(response.status_code, 200)
+        stages = [part.split(';')[0] for part in response['Server-Timing'].split(', ')]
+        self.assertIn('db', stages)
+        self.assertEqual(stages[-1], 'total')
+        in_flight = metrics.gauge('http_requests_in_flight', {'view': 'get_analysis_history'})
+        self.assertEqual(in_flight.value, 0)
+
+    @override_settings(METRICS_TOKEN=None, DEBUG=False)
+    def test_metrics_are_closed_without_a_token(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+
+    @override_settings(METRICS_TOKEN='scrape-secret')
+    def test_metrics_need_the_bearer_token(self):
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer wrong').status_code, 401)
+        self.client.get('/api/analyses/')
+        response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer scrape-secret')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(
+            'http_request_duration_seconds_count{method="GET",status="401",view="get_analysis_history"}',
+            response.content.decode(),
+        )
+
+
+UPSTREAM_TRACE = '0af7651916cd43dd8448eb211c80319c'
+# The low 64 bits of the trace id fall outside a 0.5 sample rate
+UPSTREAM_SAMPLED = f'00-{UPSTREAM_TRACE}-b7ad6b7169203331-01'
+
+
+class TracingTests(TestCase):
+
+    @override_settings(TRACING={'SAMPLE_RATE': 0.5, 'FILE': 'traces.jsonl'})
+    def test_upstream_sampled_flag_is_ignored_by_default(self):
+        root = tracing.start_trace('request', UPSTREAM_SAMPLED)
+        self.assertEqual((root.trace_id, root.parent_id), (UPSTREAM_TRACE, 'b7ad6b7169203331'))
+        self.assertFalse(root.sampled)
+
+    @override_settings(TRACING={'SAMPLE_RATE': 0.5, 'FILE': 'traces.jsonl', 'TRUST_UPSTREAM_SAMPLING': True})
+    def test_trusted_upstream_decides_sampling(self):
+        self.assertTrue(tracing.start_trace('request', UPSTREAM_SAMPLED).sampled)
+
+    @override_settings(TRACING={'SAMPLE_RATE': 1.0, 'TRUST_UPSTREAM_SAMPLING': True})
+    def test_nothing_is_sampled_without_an_exporter(self):
+        self.assertFalse(tracing.start_trace('request').sampled)
+        self.assertFalse(tracing.start_trace('request', UPSTREAM_SAMPLED).sampled)
+
+    def test_trace_file_is_rotated_past_its_cap(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'traces.jsonl')
+            exporter = tracing.Exporter({'FILE': path, 'FILE_MAX_BYTES': 10})
+            for _ in range(3):
+                exporter.write({'resourceSpans': []})
+            with open(path) as current, open(f'{path}.1') as previous:
+                self.assertEqual((len(current.readlines()), len(previous.readlines())), (1, 1))
+
+
+class FrontendShellTests(TestCase):
+
+    def setUp(self):
+        self.path = os.path.join(self.enterContext(tempfile.TemporaryDirectory()), 'index.html')
+        self.write('<!doctype html><html><body><div id="root"></div></body></html>' * 20)
+        self.enterContext(override_settings(FRONTEND_INDEX=self.path))
+
+    def write(self, html):
+        with open(self.path, 'w') as f:
+            f.write(html)
+
+    def test_shell_is_served_precompressed_with_validators(self):
+        response = self.client.get('/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertTrue(response['ETag'].endswith('-gzip"'))
+        self.assertEqual(response['Cache-Control'], settings.FRONTEND_CACHE_CONTROL)
+        with open(self.path, 'rb') as f:
+            self.assertEqual(gzip.decompress(response.content), f.read())
+
+    def test_revalidation_is_answered_with_304_until_the_shell_changes(self):
+        etag = self.client.get('/')['ETag']
+        self.assertEqual(self.client.get('/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        # Any encoding of the same version matches
+        self.assertEqual(
+            self.client.get('/', HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH=etag).status_code, 304
+        )
+        self.write('<!doctype html><html><body>new build</body></html>')
+        response = self.client.get('/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'new build', response.content)
+        self.assertNotEqual(response['ETag'], etag)
+
+
+class APIResponseTests(TestCase):
+
+    def test_orjson_renders_what_the_stock_renderer_does(self):
+        data = {
+            'created_at': timezone.now(), 'day': date(2026, 1, 31), 'amount': Decimal('1.10'), 'id': uuid.uuid4(),
+            'text': 'line\u2028separator', 'counts': {1: 2}, 'naive': datetime(2026, 1, 1, 1, 1, 1, 5),
+        }
+        self.assertEqual(ORJSONRenderer().render(data), JSONRenderer().render(data))
+
+    def test_large_api_responses_are_compressed(self):
+        user = make_user('reader@example.com')
+        for _ in range(5):
+            DocumentAnalysis.objects.create(user=user, content='Terms. ' * 100, analysis_result='Report. ' * 100)
+        response = self.client.get('/api/analyses/', HTTP_AUTHORIZATION=auth_header(user), HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual(len(json.loads(gzip.decompress(response.content))), 5)
+
+    def test_small_api_responses_are_not_compressed(self):
+        user = make_user('reader@example.com')
+        response = self.client.get('/api/analyses/', HTTP_AUTHORIZATION=auth_header(user), HTTP_ACCEPT_ENCODING='gzip')
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(response.json(), [])
+
+
+class ConditionalGetTests(TestCase):
+
+    def setUp(self):
+        self.user = make_user('cached@example.com')
+        self.authorization = auth_header(self.user)
+
+    def get(self, **headers):
+        return self.client.get('/api/analyses/', HTTP_AUTHORIZATION=self.authorization, **headers)
+
+    def test_matching_etag_is_not_modified_until_a_write(self):
+        etag = self.get()['ETag']
+        self.assertEqual(self.get(HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        DocumentAnalysis.objects.create(user=self.user, content='Terms.', analysis_result='Report.')
+        response = self.get(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), 1)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_modification_dates_are_not_used_as_validators(self):
+        response = self.get()
+        self.assertFalse(response.has_header('Last-Modified'))
+        # A write in the same second as the last read must not be answered with 304
+        DocumentAnalysis.objects.create(user=self.user, content='Terms.', analysis_result='Report.')
+        response = self.get(HTTP_IF_MODIFIED_SINCE=http_date(time.time() + 60))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), 1)
+
+
+class ClaimsUserTests(TestCase):
+
+    def test_claims_user_only_saves_named_fields(self):
+        user = make_user('claims@example.com')
+        User.objects.filter(pk=user.pk).update(is_staff=True)
+        claimed = build_user(user.pk, {
+            'email': user.email, 'username': user.username, 'account_type': 'user',
+            'is_active': True, 'is_staff': False, 'token_quota': None,
+        })
+        with self.assertRaises(ValueError):
+            claimed.save()
+        claimed.set_password('Another!12345')
+        claimed.save(update_fields=['password'])
+        user.refresh_from_db()
+        self.assertTrue(user.is_staff)
+        self.assertTrue(user.check_password('Another!12345'))
+
+    def tearDown(self):
+        user_states.clear()
+
+
+@override_settings(NOTIFICATION_STREAM={'POLL_INTERVAL': 0.01})
+class HubTests(TestCase):
+
+    async def test_restarted_hub_does_not_replay_old_notifications(self):
+        user = await sync_to_async(make_user)('listener@example.com')
+        await sync_to_async(notifications.notify)([user.pk], 'system', 'Old', 'sent before the restart')
+        hub = notifications.Hub()
+        # Left over from a run that stopped long ago
+        hub.last_id = 0
+        queue = await hub.subscribe(user.pk)
+        try:
+            await asyncio.sleep(0.1)
+            self.assertTrue(queue.empty())
+            new = await sync_to_async(notifications.notify)([user.pk], 'system', 'New', 'sent after it')
+            notification_id, _ = await asyncio.wait_for(queue.get(), 2)
+            self.assertEqual(notification_id, new.pk)
+            self.assertTrue(queue.empty())
+        finally:
+            hub.unsubscribe(user.pk, queue)
+            await asyncio.wait_for(hub.task, 1)
+
+    async def test_notification_created_while_the_hub_starts_is_delivered(self):
+        user = await sync_to_async(make_user)('early@example.com')
+        hub = notifications.Hub()
+        queue = await hub.subscribe(user.pk)
+        try:
+            # Queued for the ORM thread ahead of anything the hub reads
+            new = await sync_to_async(notifications.notify)([user.pk], 'system', 'Early', 'sent right away')
+            notification_id, _ = await asyncio.wait_for(queue.get(), 2)
+            self.assertEqual(notification_id, new.pk)
+        finally:
+            hub.unsubscribe(user.pk, queue)
+            await asyncio.wait_for(hub.task, 1)
+
+    def test_ids_skipped_by_a_read_are_looked_for_again(self):
+        hub = notifications.Hub()
+        hub.last_id = 5
+        hub._advance([SimpleNamespace(id=8)])
+        self.assertEqual(set(hub.gaps), {6, 7})
+        hub._advance([SimpleNamespace(id=7)])
+        self.assertEqual(set(hub.gaps), {6})
+        self.assertEqual(hub.last_id, 8)
+
+
+class InboxTests(TestCase):
+
+    def inbox_ids(self, user):
+        return [delivery.notification_id for delivery in notifications.inbox(user)]
+
+    def test_newest_notification_first(self):
+        user = make_user('reader@example.com')
+        first = notifications.notify([user.pk], 'system', 'First', 'first')
+        second = notifications.notify([user.pk], 'system', 'Second', 'second')
+        Notification.objects.filter(pk=first.pk).update(created_at=second.created_at - timedelta(hours=1))
+        self.assertEqual(self.inbox_ids(user), [second.pk, first.pk])
+
+    def test_order_does_not_follow_timestamps(self):
+        user = make_user('clock@example.com')
+        first = notifications.notify([user.pk], 'system', 'First', 'first')
+        second = notifications.notify([user.pk], 'system', 'Second', 'second')
+        # A clock step back must not reorder the inbox
+        Notification.objects.filter(pk=second.pk).update(created_at=first.created_at - timedelta(days=1))
+        self.assertEqual(self.inbox_ids(user), [second.pk, first.pk])
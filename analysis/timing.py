@@ -0,0 +1,101 @@
+"""
+Per-request stage timing.
+
+``stage(name)`` times a block of work (upload parsing, extraction, OCR, the
+model call, ...). Every stage feeds the ``stage_duration_seconds``
+histogram; inside a request the time is also added to that request's
+``RequestTimings``, which ``analysis.middleware.TimingMiddleware`` turns into
+a ``Server-Timing`` header and a structured log line, and recorded as a span
+of the current trace (``analysis.tracing``).
+
+The current request is tracked in a context variable, so stages inside
+``sync_to_async`` calls and asyncio tasks are attributed to the request that
+started them. Threads from a plain executor start without it; use
+``run_in_context`` to carry it over. Needs no Django setup.
+"""
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+from . import metrics, tracing
+
+_current = contextvars.ContextVar('request_timings', default=None)
+
+
+class RequestTimings:
+    """
+    Total seconds and call count per stage for one request.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages = {}
+        self._lock = threading.Lock()
+
+    def add(self, name, seconds, count=1):
+        with self._lock:
+            total, calls = self.stages.get(name, (0.0, 0))
+            self.stages[name] = (total + seconds, calls + count)
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def server_timing(self):
+        """
+        ``Server-Timing`` header value, in milliseconds per stage plus the total.
+        """
+        with self._lock:
+            stages = dict(self.stages)
+        parts = [f'{name};dur={seconds * 1000:.1f};desc="{calls}x"' for name, (seconds, calls) in stages.items()]
+        parts.append(f'total;dur={self.elapsed() * 1000:.1f}')
+        return ', '.join(parts)
+
+
+def start():
+    """
+    Begin timing a request; returns the token for ``finish``.
+    """
+    timings = RequestTimings()
+    return timings, _current.set(timings)
+
+
+def finish(token):
+    _current.reset(token)
+
+
+def current():
+    """
+    Timings of the request being served, or None outside a request.
+    """
+    return _current.get()
+
+
+def record(name, seconds):
+    metrics.histogram('stage_duration_seconds', {'stage': name}).observe(seconds)
+    timings = _current.get()
+    if timings is not None:
+        timings.add(name, seconds)
+
+
+@contextmanager
+def stage(name, **attributes):
+    """
+    Time the enclosed block as stage ``name``. Inside a trace the block is
+    also a span with ``attributes``; it is yielded (None outside a trace).
+    """
+    started = time.perf_counter()
+    try:
+        with tracing.span(name, **attributes) as span:
+            yield span
+    finally:
+        record(name, time.perf_counter() - started)
+
+
+def run_in_context(function):
+    """
+    Wrap ``function`` to run in a copy of the caller's context, for
+    executor threads whose stages belong to the current request.
+    """
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.copy().run(function, *args, **kwargs)
@@ -0,0 +1,309 @@
+"""
+Lightweight span tracing, exported as OpenTelemetry (OTLP/JSON).
+
+``TracingMiddleware`` opens a root span per request, continuing the trace of
+an incoming W3C ``traceparent`` header. Work inside it opens child spans
+with ``span(name)``; every ``timing.stage`` is also a span, and the
+extractors and the LLM layer add per-page and per-chunk spans, so a trace
+shows an upload fanning out into pages and OCR, or an analysis into its
+model calls. Outside a trace ``span`` is a no-op, so code shared with
+management commands and worker processes costs nothing there.
+
+Sampling is decided once per trace: ``TRACING['SAMPLE_RATE']`` of trace
+ids are kept (ratio-based on the id, so every service sampling the same
+trace agrees). The sampled flag of an upstream ``traceparent`` is only
+followed with ``TRACING['TRUST_UPSTREAM_SAMPLING']``, for deployments where
+only our own services can reach us; otherwise any client could have every
+one of its requests traced. Unsampled traces still get an id, which is
+stored on the analyses they create, but record no spans.
+
+Finished spans of sampled traces are queued and written by a background
+thread in batches: POSTed to an OTLP/HTTP collector at
+``TRACING['OTLP_ENDPOINT']``, or appended to ``TRACING['FILE']`` as one
+OTLP/JSON export request per line (the OpenTelemetry file exporter format),
+rotated to ``<FILE>.1`` past ``TRACING['FILE_MAX_BYTES']``. With neither
+set nothing is sampled. When the queue is full spans are dropped rather than
+slowing requests down.
+"""
+import atexit
+import contextvars
+import json
+import logging
+import os
+import queue
+import re
+import threading
+import time
+import urllib.request
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# OTLP span kinds and status codes
+KIND_INTERNAL, KIND_SERVER, KIND_CLIENT = 1, 2, 3
+STATUS_OK, STATUS_ERROR = 1, 2
+
+TRACEPARENT = re.compile(r'^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$')
+
+_current = contextvars.ContextVar('current_span', default=None)
+
+
+def _config():
+    from django.conf import settings
+    return getattr(settings, 'TRACING', {})
+
+
+class Span:
+    """
+    One timed operation of a trace.
+    """
+
+    def __init__(self, name, trace_id, parent_id=None, sampled=True, kind=KIND_INTERNAL, attributes=None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.sampled = sampled
+        self.kind = kind
+        self.attributes = dict(attributes or {})
+        self.status = None
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+
+    def set(self, **attributes):
+        if self.sampled:
+            self.attributes.update(attributes)
+
+    def fail(self, error):
+        self.status = (STATUS_ERROR, f'{type(error).__name__}: {error}')
+
+    def end(self):
+        self.end_ns = time.time_ns()
+        if self.sampled:
+            get_exporter().enqueue(self)
+
+    @property
+    def traceparent(self):
+        return f'00-{self.trace_id}-{self.span_id}-{"01" if self.sampled else "00"}'
+
+    def to_otlp(self):
+        span = {
+            'traceId': self.trace_id,
+            'spanId': self.span_id,
+            'name': self.name,
+            'kind': self.kind,
+            'startTimeUnixNano': str(self.start_ns),
+            'endTimeUnixNano': str(self.end_ns),
+            'attributes': [_attribute(key, value) for key, value in self.attributes.items() if value is not None],
+        }
+        if self.parent_id:
+            span['parentSpanId'] = self.parent_id
+        if self.status:
+            span['status'] = {'code': self.status[0], 'message': self.status[1]}
+        return span
+
+
+def _attribute(key, value):
+    if isinstance(value, bool):
+        typed = {'boolValue': value}
+    elif isinstance(value, int):
+        typed = {'intValue': str(value)}
+    elif isinstance(value, float):
+        typed = {'doubleValue': value}
+    else:
+        typed = {'stringValue': str(value)}
+    return {'key': key, 'value': typed}
+
+
+def exporting():
+    """
+    Whether spans have somewhere to go.
+    """
+    config = _config()
+    return bool(config.get('OTLP_ENDPOINT') or config.get('FILE'))
+
+
+def should_sample(trace_id):
+    rate = _config().get('SAMPLE_RATE', 0.0)
+    if rate <= 0 or not exporting():
+        return False
+    # TraceIdRatioBased: the low 64 bits of the id against the rate
+    return int(trace_id[16:], 16) < rate * 2 ** 64
+
+
+def start_trace(name, traceparent=None, kind=KIND_SERVER, **attributes):
+    """
+    Root span of a new trace, or of the trace in ``traceparent`` if valid.
+    Activate it with ``activate`` and close it with ``Span.end``.
+    """
+    match = TRACEPARENT.match(traceparent or '')
+    if match and match.group(1) != '0' * 32:
+        trace_id, parent_id, flags = match.groups()
+        if _config().get('TRUST_UPSTREAM_SAMPLING', False):
+            sampled = bool(int(flags, 16) & 1) and exporting()
+        else:
+            sampled = should_sample(trace_id)
+    else:
+        trace_id, parent_id = os.urandom(16).hex(), None
+        sampled = should_sample(trace_id)
+    return Span(name, trace_id, parent_id, sampled, kind, attributes)
+
+
+def activate(span):
+    return _current.set(span)
+
+
+def deactivate(token):
+    _current.reset(token)
+
+
+def current_span():
+    return _current.get()
+
+
+def current_trace_id():
+    """
+    Id of the trace being recorded, or None outside a trace.
+    """
+    span = _current.get()
+    return span.trace_id if span is not None else None
+
+
+@contextmanager
+def span(name, kind=KIND_INTERNAL, **attributes):
+    """
+    Child span of the current span for the enclosed block; yields the span
+    (or None outside a sampled trace) so attributes can be added as they
+    are known.
+    """
+    parent = _current.get()
+    if parent is None or not parent.sampled:
+        yield None
+        return
+    child = Span(name, parent.trace_id, parent.span_id, True, kind, attributes)
+    token = _current.set(child)
+    try:
+        yield child
+    except BaseException as e:
+        child.fail(e)
+        raise
+    finally:
+        _current.reset(token)
+        child.end()
+
+
+def add_span(name, seconds, **attributes):
+    """
+    Record a child span for work that just finished and took ``seconds``,
+    e.g. a wait measured elsewhere.
+    """
+    parent = _current.get()
+    if parent is None or not parent.sampled:
+        return
+    child = Span(name, parent.trace_id, parent.span_id, True, KIND_INTERNAL, attributes)
+    child.start_ns = time.time_ns() - int(seconds * 1e9)
+    child.end()
+
+
+@contextmanager
+def trace(name, **attributes):
+    """
+    Run the enclosed block as the root span of a new trace, e.g. one batch
+    item or one management command document.
+    """
+    root = start_trace(name, kind=KIND_INTERNAL, **attributes)
+    token = activate(root)
+    try:
+        yield root
+    except BaseException as e:
+        root.fail(e)
+        raise
+    finally:
+        deactivate(token)
+        root.end()
+
+
+class Exporter:
+    """
+    Batches finished spans and writes them from a background thread.
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self.queue = queue.Queue(maxsize=config.get('MAX_QUEUE', 10000))
+        self.dropped = 0
+        self._thread = threading.Thread(target=self._run, name='trace-exporter', daemon=True)
+        self._thread.start()
+        atexit.register(self.flush)
+
+    def enqueue(self, span):
+        try:
+            self.queue.put_nowait(span)
+        except queue.Full:
+            self.dropped += 1
+
+    def _drain(self):
+        spans = []
+        while len(spans) < self.config.get('BATCH_SIZE', 512):
+            try:
+                spans.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return spans
+
+    def _run(self):
+        interval = self.config.get('EXPORT_INTERVAL', 5.0)
+        while True:
+            time.sleep(interval)
+            self.flush()
+
+    def flush(self):
+        spans = self._drain()
+        while spans:
+            try:
+                self.write(self.payload(spans))
+            except Exception as e:
+                logger.warning('Dropped %d spans: %s', len(spans), e)
+            spans = self._drain()
+
+    def payload(self, spans):
+        return {'resourceSpans': [{
+            'resource': {'attributes': [
+                _attribute('service.name', self.config.get('SERVICE_NAME', 'lecua-backend')),
+                _attribute('process.pid', os.getpid()),
+            ]},
+            'scopeSpans': [{
+                'scope': {'name': __name__},
+                'spans': [span.to_otlp() for span in spans],
+            }],
+        }]}
+
+    def write(self, payload):
+        endpoint = self.config.get('OTLP_ENDPOINT')
+        if endpoint:
+            request = urllib.request.Request(
+                endpoint, data=json.dumps(payload).encode('utf-8'),
+                headers={'Content-Type': 'application/json'}, method='POST',
+            )
+            with urllib.request.urlopen(request, timeout=self.config.get('OTLP_TIMEOUT', 5.0)):
+                pass
+        else:
+            path = self.config['FILE']
+            max_bytes = self.config.get('FILE_MAX_BYTES')
+            if max_bytes and os.path.exists(path) and os.path.getsize(path) >= max_bytes:
+                # Keep one previous file, so traces use at most twice the cap
+                os.replace(path, f'{path}.1')
+            with open(path, 'a') as f:
+                f.write(json.dumps(payload) + '\n')
+
+
+_exporter = None
+_exporter_lock = threading.Lock()
+
+
+def get_exporter():
+    global _exporter
+    with _exporter_lock:
+        if _exporter is None:
+            _exporter = Exporter(_config())
+        return _exporter
@@ -1,13 +1,21 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import async_views, views
+
+# LLM-bound endpoints use the native async views unless disabled in settings
+analyze_text = async_views.analyze_text if settings.ASYNC_LLM_VIEWS else views.analyze_text
 
 urlpatterns = [
     path('user/', views.user_view, name='user'),
-    path('analyze-text/', views.analyze_text, name='analyze_text'),
+    path('analyze-text/', analyze_text, name='analyze_text'),
     path('documents/upload/', views.upload_document, name='upload_document'),
     path('documents/', views.get_user_documents, name='get_user_documents'),
     path('documents/<int:document_id>/', views.get_document_content, name='get_document_content'),
     path('analyses/', views.get_analysis_history, name='get_analysis_history'),
+    path('analyses/batch/', views.create_analysis_batch, name='create_analysis_batch'),
+    path('analyses/batch/<int:batch_id>/', views.get_analysis_batch, name='get_analysis_batch'),
+    path('search/', views.search_content, name='search_content'),
+    path('clauses/similar/', views.find_similar_clauses, name='find_similar_clauses'),
     path('token/', views.EmailTokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('register/', views.RegisterView.as_view(), name='register'),
     path('admin/dashboard/', views.admin_dashboard, name='admin_dashboard'),
@@ -18,7 +26,14 @@ urlpatterns = [
     path('admin/analytics/', views.admin_analytics, name='admin_analytics'),
     path('admin/database/', views.admin_database, name='admin_database'),
     path('admin/settings/', views.admin_settings, name='admin_settings'),
+    path('admin/llm-routes/', views.admin_llm_routes, name='admin_llm_routes'),
+    path('admin/admission/', views.admin_admission, name='admin_admission'),
+    path('admin/usage/', views.admin_usage, name='admin_usage'),
+    path('admin/export/<str:kind>/', views.admin_export, name='admin_export'),
     path('user/change-password/', views.change_password, name='change_password'),
     path('notifications/', views.create_notification, name='create_notification'),
     path('notifications/list/', views.get_notifications, name='get_notifications'),
+    path('notifications/stream/', async_views.notification_stream, name='notification_stream'),
+    path('notifications/unread-count/', views.get_unread_notification_count, name='get_unread_notification_count'),
+    path('notifications/mark-read/', views.mark_notifications_read, name='mark_notifications_read'),
 ] 
\ No newline at end of file
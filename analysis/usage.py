@@ -0,0 +1,273 @@
+"""
+LLM usage metering and per-user token quotas.
+
+Every model call is written to the ``LLMUsage`` ledger (tokens, latency,
+model, route) and added to the caller's ``UsageCounter`` row for the current
+minute. Quota checks sum the counter rows inside the sliding window, which is
+at most ``TOKEN_QUOTA_WINDOW / 60`` small rows per user, so they stay cheap no
+matter how large the ledger grows.
+
+An analysis reserves its estimated tokens before its first call: the hold is
+added to the counter and the window re-checked in one transaction, so
+concurrent analyses cannot all pass the check and overshoot the quota
+together. Calls draw their actual tokens from the reservation and whatever is
+left over is released at the end.
+
+A user's quota is ``User.token_quota`` if set, else ``TOKEN_QUOTAS`` for
+their account type; ``None`` means unlimited.
+"""
+import logging
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Avg, Count, F, Sum
+from django.utils import timezone
+
+from .models import DocumentAnalysis, LLMUsage, UsageCounter, User
+
+logger = logging.getLogger(__name__)
+
+
+class QuotaExceeded(Exception):
+    """
+    The user has used up their token quota for the current window.
+    """
+
+    def __init__(self, used, quota, retry_after):
+        super().__init__(f'Token quota exceeded ({used} of {quota} tokens used)')
+        self.used = used
+        self.quota = quota
+        self.retry_after = retry_after
+
+
+class RequestTooLarge(Exception):
+    """
+    A call needs more tokens than the user's whole quota, so waiting won't help.
+    """
+
+    def __init__(self, estimated, quota):
+        super().__init__(f'Request needs up to {estimated} tokens, more than the quota of {quota}')
+        self.estimated = estimated
+        self.quota = quota
+
+
+def window_seconds():
+    return getattr(settings, 'TOKEN_QUOTA_WINDOW', 3600)
+
+
+def quota_for(user):
+    """
+    Tokens ``user`` may use per window, or None for no limit.
+    """
+    if user.token_quota is not None:
+        return user.token_quota
+    quotas = getattr(settings, 'TOKEN_QUOTAS', {})
+    return quotas.get(user.account_type, quotas.get('user'))
+
+
+def _bucket(moment):
+    return moment.replace(second=0, microsecond=0)
+
+
+def tokens_used(user, now=None):
+    """
+    Tokens ``user`` has used within the quota window ending ``now``.
+    """
+    now = now or timezone.now()
+    since = _bucket(now - timedelta(seconds=window_seconds()))
+    return UsageCounter.objects.filter(user=user, window_start__gt=since).aggregate(
+        total=Sum('tokens')
+    )['total'] or 0
+
+
+class Reservation:
+    """
+    Tokens held against a user's quota for an analysis in progress.
+    """
+
+    def __init__(self, user, bucket, tokens):
+        self.user = user
+        self.bucket = bucket
+        self.remaining = tokens
+        self._lock = threading.Lock()
+
+    def draw(self, tokens):
+        """
+        Take up to ``tokens`` from the hold and return how many were taken.
+        """
+        with self._lock:
+            drawn = min(tokens, self.remaining)
+            self.remaining -= drawn
+            return drawn
+
+
+def _retry_after(user, now):
+    # Time until the oldest bucket in the window slides out
+    since = _bucket(now - timedelta(seconds=window_seconds()))
+    oldest = UsageCounter.objects.filter(user=user, window_start__gt=since).order_by('window_start').first()
+    if oldest is None:
+        return window_seconds()
+    return max(1, (oldest.window_start + timedelta(seconds=window_seconds() + 60) - now).total_seconds())
+
+
+def _add_to_bucket(user, now, tokens, requests):
+    bucket = _bucket(now)
+    counters = UsageCounter.objects.filter(user=user, window_start=bucket)
+    if counters.update(tokens=F('tokens') + tokens, requests=F('requests') + requests):
+        return
+    try:
+        with transaction.atomic():
+            UsageCounter.objects.create(user=user, window_start=bucket, tokens=tokens, requests=requests)
+    except IntegrityError:
+        # Another call created this minute's row first
+        counters.update(tokens=F('tokens') + tokens, requests=F('requests') + requests)
+        return
+    # First write of a new minute: drop the user's buckets that left the window
+    cutoff = _bucket(now - timedelta(seconds=window_seconds()))
+    UsageCounter.objects.filter(user=user, window_start__lte=cutoff).delete()
+
+
+def reserve(user, estimated_tokens):
+    """
+    Hold ``estimated_tokens`` of ``user``'s quota and return the ``Reservation``,
+    or None if they have no limit.
+
+    Raises ``QuotaExceeded`` if the hold does not fit in the window now, or
+    ``RequestTooLarge`` if it never could.
+    """
+    quota = quota_for(user)
+    if quota is None:
+        return None
+    if estimated_tokens > quota:
+        raise RequestTooLarge(estimated_tokens, quota)
+    now = timezone.now()
+    with transaction.atomic():
+        # Write before reading: the counter update takes the bucket's row
+        # lock (the database write lock on SQLite) and the user row lock
+        # covers holds landing in other minutes, so concurrent reservations
+        # for the same user check the window one after the other.
+        _add_to_bucket(user, now, estimated_tokens, 0)
+        list(User.objects.select_for_update().filter(pk=user.pk).values_list('pk', flat=True))
+        used = tokens_used(user, now)
+        if used > quota:
+            # Leaving the block with the error rolls the hold back
+            raise QuotaExceeded(used - estimated_tokens, quota, _retry_after(user, now))
+    return Reservation(user, _bucket(now), estimated_tokens)
+
+
+def release(reservation):
+    """
+    Return what is left of ``reservation`` to the user's quota.
+    """
+    if reservation is None:
+        return
+    tokens = reservation.draw(reservation.remaining)
+    if tokens:
+        UsageCounter.objects.filter(user=reservation.user, window_start=reservation.bucket).update(
+            tokens=F('tokens') - tokens
+        )
+
+
+def record_usage(user, decision, result, reservation=None):
+    """
+    Add an LLM call to the ledger and to the user's quota counter.
+
+    Tokens already held by ``reservation`` are drawn from it rather than
+    counted a second time.
+    """
+    now = timezone.now()
+    prompt_tokens = result.prompt_tokens or decision.input_tokens
+    completion_tokens = result.completion_tokens or 0
+    LLMUsage.objects.create(
+        user=user,
+        model=result.model or decision.model,
+        route=decision.route.name,
+        prompt_tokens=prompt_tokens,
+        completion_tokens=completion_tokens,
+        latency=result.latency,
+        created_at=now,
+    )
+    if user is None:
+        return
+    tokens = prompt_tokens + completion_tokens
+    if reservation is not None:
+        tokens -= reservation.draw(tokens)
+    _add_to_bucket(user, now, tokens, 1)
+
+
+def top_consumers(since, limit=10):
+    """
+    Users with the most tokens used since ``since``.
+    """
+    rows = (
+        LLMUsage.objects.filter(created_at__gte=since, user__isnull=False)
+        .values('user', 'user__username', 'user__email', 'user__account_type')
+        .annotate(
+            calls=Count('id'),
+            prompt=Sum('prompt_tokens'),
+            completion=Sum('completion_tokens'),
+            total=Sum(F('prompt_tokens') + F('completion_tokens')),
+        )
+        .order_by('-total')
+    )
+    return [{
+        'user_id': row['user'],
+        'username': row['user__username'],
+        'email': row['user__email'],
+        'account_type': row['user__account_type'],
+        'calls': row['calls'],
+        'prompt_tokens': row['prompt'],
+        'completion_tokens': row['completion'],
+        'total_tokens': row['total'],
+    } for row in rows[:limit]]
+
+
+def latency_percentiles(since, percentiles=(50, 95)):
+    """
+    Percentiles of analysis latency since ``since``, and of the LLM calls
+    behind them per route and overall.
+
+    Each percentile is fetched with an ORDER BY ... OFFSET query, so the
+    latencies are never loaded into Python.
+    """
+    def compute(queryset):
+        count = queryset.count()
+        values = {'count': count}
+        ordered = queryset.order_by('latency').values_list('latency', flat=True)
+        for pct in percentiles:
+            values[f'p{pct}_seconds'] = (
+                round(ordered[min(count - 1, int(pct / 100 * count))], 3) if count else None
+            )
+        return values
+
+    calls = LLMUsage.objects.filter(created_at__gte=since)
+    routes = calls.order_by().values_list('route', flat=True).distinct()
+    return {
+        'analyses': compute(DocumentAnalysis.objects.filter(created_at__gte=since, latency__isnull=False)),
+        'llm_calls': {
+            'overall': compute(calls),
+            'routes': {route or 'default': compute(calls.filter(route=route)) for route in routes},
+        },
+    }
+
+
+def cost_of(model, prompt_tokens, completion_tokens):
+    """
+    USD cost of a call from ``settings.LLM_PRICING``, or None if the model has no price.
+    """
+    pricing = getattr(settings, 'LLM_PRICING', {})
+    # Fine-tuned models ('ft:<base>:<org>:<name>:<id>') are priced as 'ft:<base>'
+    price = pricing.get(model) or pricing.get(':'.join(model.split(':')[:2]))
+    if price is None:
+        return None
+    return (prompt_tokens * price['INPUT'] + completion_tokens * price['OUTPUT']) / 1_000_000
+
+
+def average_completion_tokens(route):
+    """
+    Mean completion tokens of past calls on ``route``, or None without history.
+    """
+    average = LLMUsage.objects.filter(route=route).aggregate(average=Avg('completion_tokens'))['average']
+    return round(average) if average is not None else None
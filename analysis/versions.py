@@ -0,0 +1,113 @@
+"""
+Per-user version counters for conditional GETs of read-heavy endpoints.
+
+Each cached resource (a user's documents, analysis history, profile or
+notification inbox) has a ``ResourceVersion`` row that is bumped on every
+write to it: by the model signals in ``analysis.signals`` and explicitly by
+code that writes with ``QuerySet.update`` or ``bulk_create``, which send no
+signals. A bump inside a transaction commits with the write it describes.
+
+Views decorated with ``conditional(scope)`` send an ETag built from the
+counter and answer a matching ``If-None-Match`` with 304 after reading just
+that row, without running the view's queries or serializing anything. They
+send no Last-Modified: HTTP dates have one-second resolution, so
+``If-Modified-Since`` cannot tell apart writes within the same second and
+would answer a stale 304.
+"""
+import hashlib
+from functools import wraps
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+
+from .models import ResourceVersion
+
+# Scopes kept per user; anything else is global
+USER_SCOPES = ('documents', 'analyses', 'profile', 'notifications')
+
+
+def key(scope, user_id=None):
+    return f'{scope}:{user_id}' if user_id is not None else scope
+
+
+def bump(scope, user_id=None):
+    """
+    Record a change to ``scope`` (of ``user_id``, for per-user scopes).
+    """
+    resource = key(scope, user_id)
+    now = timezone.now()
+    if ResourceVersion.objects.filter(key=resource).update(version=F('version') + 1, updated_at=now):
+        return
+    try:
+        with transaction.atomic():
+            ResourceVersion.objects.create(key=resource, version=1, updated_at=now)
+    except IntegrityError:
+        # Created by a concurrent bump
+        ResourceVersion.objects.filter(key=resource).update(version=F('version') + 1, updated_at=now)
+
+
+def bump_many(scope, user_ids):
+    """
+    ``bump`` for many users of a per-user scope, in two queries.
+    """
+    keys = [key(scope, user_id) for user_id in user_ids]
+    now = timezone.now()
+    ResourceVersion.objects.bulk_create(
+        [ResourceVersion(key=resource, version=0, updated_at=now) for resource in keys], ignore_conflicts=True
+    )
+    ResourceVersion.objects.filter(key__in=keys).update(version=F('version') + 1, updated_at=now)
+
+
+def current(scope, user_id=None):
+    """
+    ``(version, updated_at)`` of a resource; ``(0, None)`` if never written
+    since counters were introduced.
+    """
+    row = ResourceVersion.objects.filter(key=key(scope, user_id)).values_list('version', 'updated_at').first()
+    return row or (0, None)
+
+
+def forget_user(user_id):
+    """
+    Drop a deleted user's counters. The profile counter is bumped instead,
+    so other processes learn of the deletion (``analysis.authentication``).
+    """
+    ResourceVersion.objects.filter(
+        key__in=[key(scope, user_id) for scope in USER_SCOPES if scope != 'profile']
+    ).delete()
+    bump('profile', user_id)
+
+
+def etag(request, resource, version):
+    # The negotiated format is part of the representation (JSON or the browsable API)
+    accept = request.headers.get('Accept', '')
+    digest = hashlib.sha1(f'{resource}\0{version}\0{accept}'.encode('utf-8')).hexdigest()[:20]
+    return f'W/"{digest}"'
+
+
+def conditional(scope):
+    """
+    Conditional GET support for a DRF view serving ``scope``; goes below
+    ``@api_view`` and ``@permission_classes`` so it runs for the
+    authenticated user.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+            user_id = request.user.pk if scope in USER_SCOPES else None
+            version, _ = current(scope, user_id)
+            tag = etag(request, key(scope, user_id), version)
+            response = get_conditional_response(request._request, etag=tag)
+            if response is None:
+                response = view(request, *args, **kwargs)
+            if response.status_code in (200, 304):
+                response['ETag'] = tag
+                # Per user, and checked on every use
+                patch_cache_control(response, private=True, no_cache=True)
+            return response
+        return wrapper
+    return decorator
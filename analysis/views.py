@@ -1,12 +1,7 @@
-from django.http import JsonResponse, HttpResponse
+from django.http import JsonResponse, HttpResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
-from openai import OpenAI
-from .models import User, Document, Analysis, DocumentAnalysis, Report, Notification
-import os
-import PyPDF2
-import docx
-from PIL import Image
-import pytesseract
+from .models import User, Document, Analysis, AnalysisBatch, DocumentAnalysis, Report
+import math
 from rest_framework.decorators import api_view, permission_classes, action
 from rest_framework.permissions import IsAuthenticated, AllowAny, IsAdminUser
 from rest_framework.response import Response
@@ -23,119 +18,14 @@ from datetime import timedelta
 from django.contrib.auth.password_validation import validate_password
 from django.core.exceptions import ValidationError
 from .serializers import ReportSerializer
+from .extraction import file_hash, process_uploaded_file
+from . import admission, authentication, batches, clauses, coalesce, exports, frontend, idempotency, llm, metrics, notifications, routing, search, services, timing, usage, versions
 from django.core.mail import send_mail
 
-# Initialize OpenAI client
-api_key = settings.OPENAI_API_KEY
-if not api_key:
-    raise ValueError("OPENAI_API_KEY is not set in settings")
-client = OpenAI(api_key=api_key)
-# Contract prompt template
-CONTRACT_PROMPT = """
-You are LECUA, the Legal Extraction & Compliance Understanding Assistant specializing in Zimbabwean contract law. Analyze the contract text provided and produce a structured **Legal Officer Report**. Use clear numbered headings and sub‑sections, and avoid using asterisks in the report and provide a full report based on the following template:
-
----REPORT---
-
-1. Parties Identification
-   1.1 First Party
-       • Name: [Name]
-       • Role: [Role]
-   1.2 Second Party
-       • Name: [Name]
-       • Role: [Role]
-
-2. Clause Extraction and Analysis
-For each of the following categories and add a number, include and write every clause in the contract that falls under it. For each clause, provide and if not available do not display it:
-   i. Extracted Text (verbatim): "[Extract Contract text]"
-   ii. Legal Basis: [Act Name] [Chapter] §[Section]
-   iii. Requirements Summary: [Plain‑language explanation]
-   iv. Risk Assessment: [Low/Medium/High] – [Rationale]
-   **Categories to cover**:
-- Commencement & Duration
-
-- Position & Duties
-- Remuneration Structure
-- Working Hours & Overtime
-- Leave Entitlement
-- Termination Conditions
-- NSSA & NEC Clauses
-- Training & Indigenisation
-- Governing Law
-
-
-3. Statutory Compliance Mapping
-For each statute cited in the contract:
-   • Act: [Act Name] [Chapter]
-   • Compliance Status: [Compliant/Partial/Non‑compliant]
-
-4. Risk Log
-List each identified risk as a bullet point:
-   - [Clause Name] – 
-   [Risk Type] – Severity (1–5): [Score] – Mitigation: [Actionable advice]
-
-5. Contract Summary
-   5.1 Purpose of Contract: [One‑sentence overview]
-   5.2 Key Obligations and Timeline:
-       • [Party A]: [Obligation] by [Date]
-       • [Party B]: [Obligation] by [Date]
-   5.3 Critical Dates:
-       • Effective Date: [Date]
-       • Review Period: [Start Date] to [End Date]
-       • Termination Window: [Start Date] to [End Date]
-
-6. Compliance Checklist
-Indicate ✓ for compliant and ✗ for non‑compliant.
-   • Stamp Duties Act [Chapter 23:09]
-   • Income Tax Act [Chapter 23:06] (PAYE)
-   • Data Protection Act [Chapter 11:12]
-   • VAT Act [Chapter 23:12]
-   • Consumer Protection Act [Chapter 14:44]
-
-7. Summary
-Provide a comprehensive paragraph summarizing the entire contract. The summary must include the following with dates and numbers stated in the contract:
-The purpose of the contract (e.g., nature of employment or agreement)
-The start date and duration or end date of the contract
-The obligations and responsibilities of each party involved
-The critical contractual dates (e.g., probation period end, salary payment schedule, renewal or termination conditions)
-Any key terms or conditions that define the rights, duties, and expectations of the parties
-The paragraph should be detailed, specific, and based directly on the content of the contract, avoiding vague or general statements.
-
----END OF REPORT---
-Contract Text:
-{text}
-"""
-# Utility functions for file processing
-def extract_text_from_pdf(file):
-    pdf_reader = PyPDF2.PdfReader(file)
-    text = ""
-    for page in pdf_reader.pages:
-        text += page.extract_text()
-    return text
-def extract_text_from_docx(file):
-    doc = docx.Document(file)
-    text = ""
-    for paragraph in doc.paragraphs:
-        text += paragraph.text + "\n"
-    return text
-def extract_text_from_image(file):
-    image = Image.open(file)
-    text = pytesseract.image_to_string(image)
-    return text
-def process_uploaded_file(file):
-    file_extension = file.name.lower().split('.')[-1]
-    if file_extension == 'pdf':
-        return extract_text_from_pdf(file)
-    elif file_extension in ['doc', 'docx']:
-        return extract_text_from_docx(file)
-    elif file_extension in ['png', 'jpg', 'jpeg']:
-        return extract_text_from_image(file)
-    elif file_extension == 'txt':
-        return file.read().decode('utf-8')
-    else:
-        raise ValueError(f"Unsupported file type: {file_extension}")
 # API endpoints
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@versions.conditional('profile')
 def user_view(request):
     """
     Return the current user's information.
@@ -150,6 +40,7 @@ def user_view(request):
     })
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
+@idempotency.idempotent
 def analyze_text(request):
     """
     Analyze the provided text using OpenAI and return the analysis result.
@@ -164,30 +55,47 @@ def analyze_text(request):
             }, status=status.HTTP_400_BAD_REQUEST)
         
         # Process the document content for analysis
-        response = client.chat.completions.create(
-            model="ft:gpt-3.5-turbo-0125:personal:legal-assistance:BFR7HUPE",
-            messages=[{
-                "role": "user",
-                "content": CONTRACT_PROMPT.format(text=text)
-            }],
-            temperature=1,
-            max_tokens=2048,
-            top_p=1
-        )
-        analysis_result = response.choices[0].message.content
-        # Save to database
-        DocumentAnalysis.objects.create(
-            content=text,
-            analysis_result=analysis_result,
-            user=request.user
-        )
+        analysis = services.analyze_contract(request.user, text)
+        analysis_result = analysis.analysis_result
         return Response({
             'result': analysis_result,
+            'preflight': analysis.preflight,
             'message': 'Analysis completed successfully'
         }, status=status.HTTP_200_OK)
+    except llm.CircuitOpenError as circuit_error:
+        response = Response({
+            'error': str(circuit_error),
+            'message': 'The analysis service is temporarily unavailable'
+        }, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        response['Retry-After'] = str(math.ceil(circuit_error.retry_after))
+        return response
+    except admission.AdmissionRejected as rejected:
+        response = Response({
+            'error': str(rejected),
+            'message': 'The analysis service is busy, please retry shortly'
+        }, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        response['Retry-After'] = str(math.ceil(rejected.retry_after))
+        return response
+    except usage.RequestTooLarge as too_large:
+        return Response({
+            'error': str(too_large),
+            'message': 'This contract is too large for your analysis quota'
+        }, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+    except usage.QuotaExceeded as quota_error:
+        response = Response({
+            'error': str(quota_error),
+            'message': 'You have used your analysis quota for now'
+        }, status=status.HTTP_429_TOO_MANY_REQUESTS)
+        response['Retry-After'] = str(math.ceil(quota_error.retry_after))
+        return response
+    except coalesce.CoalescedAnalysisError as shared_error:
+        return Response({
+            'error': str(shared_error),
+            'message': 'The analysis service could not analyze this text'
+        }, status=status.HTTP_502_BAD_GATEWAY)
     except Exception as openai_error:
         error_message = str(openai_error)
-        if "API key" in error_message.lower():
+        if "api key" in error_message.lower():
             error_message = "Invalid or missing OpenAI API key"
         elif "model" in error_message.lower():
             error_message = "Invalid model configuration"
@@ -202,19 +110,28 @@ def analyze_text(request):
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
+@idempotency.idempotent
 def upload_document(request):
     """
     Handle document upload and initial processing.
     """
     try:
-        if 'file' not in request.FILES:
+        # Reading request.FILES parses the multipart body
+        with timing.stage('upload'):
+            files = request.FILES
+        if 'file' not in files:
             return Response({'error': 'No file provided'}, status=status.HTTP_400_BAD_REQUEST)
-        file = request.FILES['file']
+        file = files['file']
         title = request.POST.get('title', file.name)
-        content = process_uploaded_file(file)
+        content_hash = file_hash(file.read())
+        file.seek(0)
+        # OCR and parsing are memory hungry; cap how many run at once
+        with admission.admit('extraction'):
+            content = process_uploaded_file(file)
         document = Document.objects.create(
             title=title,
             content=content,
+            content_hash=content_hash,
             user=request.user
         )
         return Response({
@@ -224,10 +141,15 @@ def upload_document(request):
             'status': document.status,
             'upload_date': document.upload_date
         }, status=status.HTTP_201_CREATED)
+    except admission.AdmissionRejected as rejected:
+        response = Response({'error': str(rejected)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        response['Retry-After'] = str(math.ceil(rejected.retry_after))
+        return response
     except Exception as e:
         return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@versions.conditional('documents')
 def get_user_documents(request):
     """
     Get all documents for the current user.
@@ -258,6 +180,7 @@ def get_document_content(request, document_id):
         return Response({'error': 'Document not found'}, status=status.HTTP_404_NOT_FOUND)
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@versions.conditional('analyses')
 def get_analysis_history(request):
     """
     Get all analyses for the current user.
@@ -269,9 +192,118 @@ def get_analysis_history(request):
         'analysis_result': analysis.analysis_result,
         'created_at': analysis.created_at
     } for analysis in analyses])
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+@idempotency.idempotent
+def create_analysis_batch(request):
+    """
+    Start analyzing several documents (document_ids) or a zip archive of contracts.
+    """
+    archive = request.FILES.get('archive')
+    if hasattr(request.data, 'getlist'):
+        raw_ids = request.data.getlist('document_ids')
+    else:
+        raw_ids = request.data.get('document_ids') or []
+    try:
+        if not isinstance(raw_ids, list):
+            raise TypeError
+        document_ids = [int(document_id) for document_id in raw_ids]
+    except (TypeError, ValueError):
+        return Response({'error': 'document_ids must be a list of integers'}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        archive = batches.read_archive(archive) if archive else None
+        batch = batches.create_batch(request.user, document_ids=document_ids, archive=archive)
+    except batches.BatchError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    return Response(batches.progress(batch, include_results=False), status=status.HTTP_202_ACCEPTED)
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_analysis_batch(request, batch_id):
+    """
+    Get the progress of a batch and the result or error of each item.
+    """
+    try:
+        batch = AnalysisBatch.objects.get(id=batch_id, user=request.user)
+    except AnalysisBatch.DoesNotExist:
+        return Response({'error': 'Batch not found'}, status=status.HTTP_404_NOT_FOUND)
+    batch = batches.expire_orphans(batch)
+    include_results = request.query_params.get('results', 'true').lower() != 'false'
+    return Response(batches.progress(batch, include_results=include_results))
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def search_content(request):
+    """
+    Full-text search over the current user's documents and analyses.
+    """
+    query = request.query_params.get('q', '').strip()
+    kind = request.query_params.get('type', 'all')
+    if not query:
+        return Response({'error': 'No search query provided'}, status=status.HTTP_400_BAD_REQUEST)
+    if kind not in ('all', 'documents', 'analyses'):
+        return Response({'error': 'Invalid search type'}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        limit = min(max(int(request.query_params.get('limit', 20)), 1), 100)
+        offset = max(int(request.query_params.get('offset', 0)), 0)
+    except ValueError:
+        return Response({'error': 'Invalid limit or offset'}, status=status.HTTP_400_BAD_REQUEST)
+
+    results = {'query': query}
+    if kind in ('all', 'documents'):
+        hits = search.search('documents', query, user_id=request.user.id, limit=limit, offset=offset)
+        documents = Document.objects.only('id', 'title', 'status', 'upload_date').in_bulk(
+            [row_id for row_id, _, _ in hits]
+        )
+        results['documents'] = [{
+            'id': row_id,
+            'title': documents[row_id].title,
+            'status': documents[row_id].status,
+            'upload_date': documents[row_id].upload_date,
+            'score': score,
+            'snippet': snippet,
+        } for row_id, score, snippet in hits if row_id in documents]
+    if kind in ('all', 'analyses'):
+        hits = search.search('analyses', query, user_id=request.user.id, limit=limit, offset=offset)
+        analyses = DocumentAnalysis.objects.only('id', 'created_at').in_bulk(
+            [row_id for row_id, _, _ in hits]
+        )
+        results['analyses'] = [{
+            'id': row_id,
+            'created_at': analyses[row_id].created_at,
+            'score': score,
+            'snippet': snippet,
+        } for row_id, score, snippet in hits if row_id in analyses]
+    return Response(results)
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def find_similar_clauses(request):
+    """
+    Find previously analysed clauses similar to the given clause text.
+    """
+    text = request.data.get('text')
+    if not text:
+        return Response({'error': 'No clause text provided'}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        k = min(max(int(request.data.get('k', 10)), 1), 50)
+    except (TypeError, ValueError):
+        return Response({'error': 'Invalid k'}, status=status.HTTP_400_BAD_REQUEST)
+    # Staff can compare against every user's analyses
+    user_id = None if request.user.is_staff else request.user.id
+    matches = clauses.similar_clauses(text, k=k, user_id=user_id)
+    return Response([{
+        'id': clause.id,
+        'text': clause.text,
+        'risk_level': clause.risk_level,
+        'risk_assessment': clause.risk_assessment,
+        'analysis_id': clause.analysis_id,
+        'analysed_at': clause.analysis.created_at,
+        'score': round(score, 4),
+    } for clause, score in matches])
 # Authentication and registration views
 class EmailTokenObtainPairSerializer(TokenObtainPairSerializer):
     username_field = 'email'
+    @classmethod
+    def get_token(cls, user):
+        return authentication.add_claims(super().get_token(user), user)
     def validate(self, attrs):
         data = super().validate(attrs)
         user = self.user
@@ -303,7 +335,7 @@ class RegisterView(APIView):
                 password=password,
                 account_type=account_type
             )
-            refresh = RefreshToken.for_user(user_obj)
+            refresh = authentication.add_claims(RefreshToken.for_user(user_obj), user_obj)
             return Response({
                 'refresh': str(refresh),
                 'access': str(refresh.access_token),
@@ -316,6 +348,20 @@ class RegisterView(APIView):
             }, status=status.HTTP_201_CREATED)
         except Exception as e:
             return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+def metrics_view(request):
+    """
+    Prometheus metrics of this worker process (bearer METRICS_TOKEN; without
+    one, only in DEBUG)
+    """
+    token = getattr(settings, 'METRICS_TOKEN', None)
+    if not token and not settings.DEBUG:
+        # Per-view traffic is not for the public
+        return HttpResponse('Metrics are disabled; set METRICS_TOKEN', status=status.HTTP_403_FORBIDDEN,
+                            content_type='text/plain')
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        return HttpResponse('Unauthorized', status=status.HTTP_401_UNAUTHORIZED, content_type='text/plain')
+    admission.update_gauges()
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
 class FrontendAppView(APIView):
     """
     Serves the frontend application.
@@ -323,13 +369,23 @@ class FrontendAppView(APIView):
     permission_classes = [AllowAny]
     def get(self, request):
         try:
-            with open(os.path.join(settings.BASE_DIR, 'frontend', 'dist', 'index.html'), 'r') as f:
-                return HttpResponse(f.read())
+            shell = frontend.get_shell()
         except FileNotFoundError:
             return HttpResponse(
                 "Frontend application not found. Please build the frontend first.",
                 status=status.HTTP_404_NOT_FOUND
             )
+        encoding = shell.negotiate(request.headers.get('Accept-Encoding'))
+        if shell.matches(request.headers.get('If-None-Match')):
+            response = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = HttpResponse(shell.bodies[encoding], content_type='text/html; charset=utf-8')
+            if encoding != 'identity':
+                response['Content-Encoding'] = encoding
+        response['ETag'] = shell.etag(encoding)
+        response['Cache-Control'] = settings.FRONTEND_CACHE_CONTROL
+        response['Vary'] = 'Accept-Encoding'
+        return response
 @api_view(['GET'])
 @permission_classes([IsAuthenticated, IsAdminUser])
 def admin_dashboard(request):
@@ -475,11 +531,14 @@ def admin_report_detail(request, report_id):
     
     elif request.method == 'PATCH':
         data = request.data
+        status_changed = 'status' in data and data['status'] != report.status
         if 'status' in data:
             report.status = data['status']
         if 'priority' in data:
             report.priority = data['priority']
         report.save()
+        if status_changed:
+            notifications.report_status_changed(report)
         return Response({'message': 'Report updated successfully'})
 
 @api_view(['GET'])
@@ -559,7 +618,7 @@ def change_password(request):
 
         # Set new password
         user.set_password(new_password)
-        user.save()
+        user.save(update_fields=['password'])
 
         return Response(
             {'message': 'Password changed successfully'},
@@ -583,12 +642,13 @@ def create_notification(request):
         report_id = request.data.get('report_id')
         priority = request.data.get('priority')
 
-        # Create notification
-        notification = Notification.objects.create(
+        # Deliver the notification to the admins
+        notification = notifications.notify(
+            notifications.admin_ids(),
             type=notification_type,
             title=title,
             message=f"New {notification_type} report: {title} (Priority: {priority})",
-            report_id=report_id if report_id else None
+            report=Report.objects.filter(id=report_id).first() if report_id else None
         )
 
         return Response({
@@ -606,26 +666,46 @@ def create_notification(request):
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@versions.conditional('notifications')
 def get_notifications(request):
     """
-    Get all notifications for the current user.
+    Get the current user's notifications, newest first (?unread=true for unread only).
     """
     try:
-        notifications = Notification.objects.all().order_by('-created_at')
-        return Response([{
-            'id': notification.id,
-            'type': notification.type,
-            'title': notification.title,
-            'message': notification.message,
-            'is_read': notification.is_read,
-            'created_at': notification.created_at
-        } for notification in notifications])
+        unread_only = request.query_params.get('unread') in ('1', 'true')
+        return Response([
+            notifications.delivery_data(delivery)
+            for delivery in notifications.inbox(request.user, unread_only=unread_only)
+        ])
     except Exception as e:
         return Response(
             {'message': str(e)},
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
         )
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@versions.conditional('notifications')
+def get_unread_notification_count(request):
+    """
+    Get the current user's unread notification count, for the badge.
+    """
+    return Response({'unread': notifications.unread_count(request.user)})
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def mark_notifications_read(request):
+    """
+    Mark the notifications in ids, or all of them if all is true, as read.
+    """
+    ids = request.data.get('ids')
+    if request.data.get('all') is True:
+        ids = None
+    elif not isinstance(ids, list) or not all(isinstance(notification_id, int) for notification_id in ids):
+        return Response({'error': 'Provide ids (a list of notification ids) or all: true'}, status=status.HTTP_400_BAD_REQUEST)
+    marked = notifications.mark_read(request.user, ids)
+    return Response({'marked': marked, 'unread': notifications.unread_count(request.user)})
+
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def create_report(request):
@@ -657,14 +737,9 @@ def create_report(request):
             status='pending'
         )
 
-        # Create notification for admins
+        # Deliver a notification to every admin
         try:
-            Notification.objects.create(
-                type='new_report',
-                title=title,
-                message=f"New {report_type} report: {title} (Priority: {priority})",
-                report=report
-            )
+            notifications.report_created(report)
         except Exception as notify_error:
             print(f"Failed to create notification: {notify_error}")
             # Continue even if notification fails
@@ -733,6 +808,7 @@ class ReportViewSet(viewsets.ModelViewSet):
             
         report.status = new_status
         report.save()
+        notifications.report_status_changed(report)
         
         # Notify user about status update
         if report.user and report.user.email:
@@ -826,4 +902,66 @@ def admin_settings(request):
             # For now, we'll just return success
             return Response({'success': True, 'message': 'Settings updated successfully'})
         except Exception as e:
-            return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
\ No newline at end of file
+            return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def admin_llm_routes(request):
+    """
+    Get the model routing table with per-route latency and token histograms
+    """
+    return Response(routing.route_stats())
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def admin_admission(request):
+    """
+    Get the concurrency limits and queue depth of the admission pools
+    """
+    return Response(admission.pool_stats())
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def admin_usage(request):
+    """
+    Get the top LLM token consumers and analysis latency percentiles
+    """
+    try:
+        hours = max(1, int(request.query_params.get('hours', 24)))
+        limit = max(1, min(int(request.query_params.get('limit', 10)), 100))
+    except ValueError:
+        return Response({'error': 'hours and limit must be integers'}, status=status.HTTP_400_BAD_REQUEST)
+    since = timezone.now() - timedelta(hours=hours)
+    return Response({
+        'hours': hours,
+        'top_consumers': usage.top_consumers(since, limit),
+        'latency': usage.latency_percentiles(since),
+    })
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def admin_export(request, kind):
+    """
+    Stream documents, analyses, reports or users as CSV or NDJSON
+    (?as=csv|ndjson, optional ?since= and ?until= dates)
+    """
+    export_format = request.query_params.get('as', 'csv')
+    try:
+        since = request.query_params.get('since')
+        until = request.query_params.get('until')
+        # Under ASGI a sync iterator would be read into memory before sending
+        export = exports.astream if hasattr(request, 'scope') else exports.stream
+        chunks, content_type = export(
+            kind, export_format,
+            since=exports.parse_bound(since, 'since') if since else None,
+            until=exports.parse_bound(until, 'until') if until else None,
+        )
+    except exports.ExportError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    response = StreamingHttpResponse(chunks, content_type=content_type)
+    filename = f'{kind}-{timezone.now():%Y%m%d-%H%M%S}.{export_format}'
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
@@ -0,0 +1,172 @@
+"""
+Concurrency benchmark for the analyze endpoint under a single uvicorn worker.
+
+Starts ``legalbackend.asgi`` with the stub LLM backend (so every analysis
+waits ``--latency`` seconds upstream, like a real OpenAI call) against a
+scratch SQLite database, fires ``--concurrency`` simultaneous analyses with
+distinct texts, and reports wall time, throughput, latency percentiles and
+the server's peak thread count and RSS.
+Run both modes to compare the async view with the sync DRF view:
+
+    python benchmarks/async_analyze.py --concurrency 200 --latency 2 --modes async,sync
+
+Requires ``uvicorn`` and ``httpx``.
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))] if ordered else None
+
+
+def prepare(workdir, latency):
+    """
+    Migrate a scratch database and return (env, access token).
+    """
+    env = dict(
+        os.environ,
+        DJANGO_SETTINGS_MODULE='legalbackend.settings',
+        SQLITE_PATH=os.path.join(workdir, 'db.sqlite3'),
+        SQLITE_WAL='True',
+        CLAUSE_INDEX_DIR=os.path.join(workdir, 'clause_index'),
+        LLM_BACKEND='stub',
+        LLM_STUB_LATENCY=str(latency),
+        DEBUG='True',
+    )
+    subprocess.run([sys.executable, 'manage.py', 'migrate', '-v', '0'], cwd=ROOT, env=env, check=True)
+    script = (
+        'import django; django.setup()\n'
+        'from analysis.models import User\n'
+        'from rest_framework_simplejwt.tokens import RefreshToken\n'
+        "user = User.objects.create_user(email='bench@example.com', username='bench', password='bench')\n"
+        'print(str(RefreshToken.for_user(user).access_token))\n'
+    )
+    output = subprocess.run([sys.executable, '-c', script], cwd=ROOT, env=env, check=True,
+                            capture_output=True, text=True).stdout
+    return env, output.strip().splitlines()[-1]
+
+
+def start_server(env, port, async_views):
+    server_env = dict(env, ASYNC_LLM_VIEWS='True' if async_views else 'False')
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', 'legalbackend.asgi:application',
+         '--host', '127.0.0.1', '--port', str(port), '--workers', '1', '--log-level', 'warning'],
+        cwd=ROOT, env=server_env,
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=0.5):
+                return process
+        except OSError:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError('uvicorn did not start')
+
+
+def process_stats(pid):
+    """
+    Current thread count and RSS (MiB) of a process, from /proc (Linux only).
+    """
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            fields = dict(line.split(':', 1) for line in f if ':' in line)
+    except OSError:
+        return None, None
+    return int(fields['Threads']), int(fields['VmRSS'].split()[0]) / 1024
+
+
+async def sample_server(pid, peaks, stop):
+    while not stop.is_set():
+        threads, rss = process_stats(pid)
+        if threads is not None:
+            peaks['peak_threads'] = max(peaks.get('peak_threads', 0), threads)
+            peaks['peak_rss_mib'] = round(max(peaks.get('peak_rss_mib', 0), rss), 1)
+        await asyncio.sleep(0.05)
+
+
+async def fire(port, token, concurrency, timeout, server_pid):
+    import httpx
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=f'http://127.0.0.1:{port}', limits=limits, timeout=timeout) as client:
+        async def one(i):
+            started = time.perf_counter()
+            try:
+                response = await client.post(
+                    '/api/analyze-text/',
+                    json={'text': f'Contract {i}: the employee shall give thirty days notice.'},
+                    headers={'Authorization': f'Bearer {token}'},
+                )
+                ok = response.status_code == 200
+            except httpx.HTTPError:
+                ok = False
+            return ok, time.perf_counter() - started
+
+        peaks, stop = {}, asyncio.Event()
+        sampler = asyncio.create_task(sample_server(server_pid, peaks, stop))
+        started = time.perf_counter()
+        results = await asyncio.gather(*(one(i) for i in range(concurrency)))
+        wall = time.perf_counter() - started
+        stop.set()
+        await sampler
+    latencies = [latency for ok, latency in results if ok]
+    return {
+        **peaks,
+        'requests': concurrency,
+        'succeeded': len(latencies),
+        'failed': concurrency - len(latencies),
+        'wall_seconds': round(wall, 2),
+        'throughput_rps': round(len(latencies) / wall, 2) if wall else None,
+        'p50_seconds': round(percentile(latencies, 50), 3) if latencies else None,
+        'p95_seconds': round(percentile(latencies, 95), 3) if latencies else None,
+        'p99_seconds': round(percentile(latencies, 99), 3) if latencies else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--concurrency', type=int, default=200)
+    parser.add_argument('--latency', type=float, default=2.0, help='Simulated upstream latency (s)')
+    parser.add_argument('--modes', default='async', help='Comma-separated: async, sync')
+    parser.add_argument('--timeout', type=float, default=600.0)
+    parser.add_argument('--json', help='Write results to this file')
+    args = parser.parse_args()
+
+    results = {'concurrency': args.concurrency, 'upstream_latency_seconds': args.latency}
+    with tempfile.TemporaryDirectory(prefix='async-analyze-bench-') as workdir:
+        env, token = prepare(workdir, args.latency)
+        for mode in args.modes.split(','):
+            port = free_port()
+            server = start_server(env, port, async_views=(mode == 'async'))
+            try:
+                results[mode] = asyncio.run(fire(port, token, args.concurrency, args.timeout, server.pid))
+            finally:
+                server.terminate()
+                server.wait(timeout=10)
+
+    print(json.dumps(results, indent=2))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+"""
+Latency benchmark for the similar-clause index.
+
+Builds an index of synthetic clauses (``--clauses``, default 1M) in a scratch
+directory and reports embedding throughput, top-k query latency with and
+without owner scoping, and compaction time. Only real text is embedded for a
+sample; the bulk of the rows are random unit vectors appended directly, which
+exercises the same memory-mapped scan as production data.
+
+    python benchmarks/clause_index.py --clauses 1000000 --json results.json
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from analysis.clause_index import ClauseIndex  # noqa: E402
+from corpus import synthetic_clause  # noqa: E402
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--clauses', type=int, default=1_000_000)
+    parser.add_argument('--embedded', type=int, default=20_000, help='Clauses embedded from text')
+    parser.add_argument('--dimensions', type=int, default=256)
+    parser.add_argument('--owners', type=int, default=500)
+    parser.add_argument('--queries', type=int, default=50)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--dir', help='Index directory (default: a temporary directory)')
+    parser.add_argument('--json', help='Write results to this file')
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    np_rng = np.random.default_rng(42)
+    directory = args.dir or tempfile.mkdtemp(prefix='clause-index-bench-')
+    results = {'clauses': args.clauses, 'dimensions': args.dimensions, 'k': args.k}
+    try:
+        index = ClauseIndex(directory, args.dimensions)
+        index.clear()
+
+        embedded = min(args.embedded, args.clauses)
+        texts = [synthetic_clause(rng) for _ in range(embedded)]
+        started = time.perf_counter()
+        for start in range(0, embedded, 1000):
+            batch = texts[start:start + 1000]
+            ids = list(range(start, start + len(batch)))
+            index.add(ids, [i % args.owners for i in ids], batch)
+        elapsed = time.perf_counter() - started
+        results['embed_add_per_second'] = round(embedded / elapsed, 1)
+
+        started = time.perf_counter()
+        batch_rows = 100_000
+        for start in range(embedded, args.clauses, batch_rows):
+            count = min(batch_rows, args.clauses - start)
+            vectors = np_rng.standard_normal((count, args.dimensions), dtype=np.float32)
+            vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+            ids = np.arange(start, start + count)
+            index.append_vectors(ids, ids % args.owners, vectors)
+        results['bulk_append_seconds'] = round(time.perf_counter() - started, 2)
+        results['index_bytes'] = os.path.getsize(os.path.join(directory, 'clauses.bin'))
+
+        for label, owner in (('query', None), ('query_scoped', 7)):
+            index.query(texts[0], k=args.k, owner=owner)  # warm the page cache
+            latencies = []
+            for _ in range(args.queries):
+                started = time.perf_counter()
+                index.query(rng.choice(texts), k=args.k, owner=owner)
+                latencies.append((time.perf_counter() - started) * 1000)
+            results[label] = {
+                'p50_ms': round(percentile(latencies, 50), 2),
+                'p95_ms': round(percentile(latencies, 95), 2),
+                'p99_ms': round(percentile(latencies, 99), 2),
+                'mean_ms': round(statistics.fmean(latencies), 2),
+            }
+
+        index.remove(list(range(0, args.clauses, 100)))
+        started = time.perf_counter()
+        dropped = index.compact()
+        results['compact_seconds'] = round(time.perf_counter() - started, 2)
+        results['compact_dropped'] = dropped
+    finally:
+        if not args.dir:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    print(json.dumps(results, indent=2))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+"""
+Worker cold-start benchmark.
+
+Boots the app the way a fresh worker does (``legalbackend.wsgi`` plus the
+URLconf, which Django otherwise imports on the first request) and
+``manage.py check``, the start of most management commands, each in
+``--runs`` fresh interpreters, and reports the median wall time and the
+slowest packages to import, from ``python -X importtime``. ``--ref`` measures other git revisions too, each
+in a temporary worktree, so a change can be compared with its parent:
+
+    python benchmarks/cold_start.py --ref HEAD~1 --json cold-start.json
+
+No database connection is opened and no model call is made.
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+BOOT = (
+    'import time\n'
+    'started = time.perf_counter()\n'
+    'from legalbackend.wsgi import application\n'
+    'from django.urls import get_resolver\n'
+    'get_resolver().url_patterns\n'
+    'print(time.perf_counter() - started)\n'
+)
+IMPORT_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$')
+
+
+def environment(tree):
+    return dict(
+        os.environ,
+        DJANGO_SETTINGS_MODULE='legalbackend.settings',
+        PYTHONPATH=tree,
+        LLM_BACKEND='openai',
+        OPENAI_API_KEY=os.environ.get('OPENAI_API_KEY', 'benchmark'),
+        SQLITE_PATH=os.path.join(tempfile.gettempdir(), 'cold-start-bench.sqlite3'),
+    )
+
+
+def timed(command, tree):
+    started = time.perf_counter()
+    result = subprocess.run(command, cwd=tree, env=environment(tree), capture_output=True, text=True)
+    wall = time.perf_counter() - started
+    if result.returncode != 0:
+        raise RuntimeError(f'{" ".join(command)} failed in {tree}:\n{result.stderr[-2000:]}')
+    return wall, result
+
+
+def slowest_imports(tree, limit):
+    """
+    ``[(package, ms), ...]`` of the slowest top-level packages to import,
+    wherever in the boot they were first imported.
+    """
+    _, result = timed([sys.executable, '-X', 'importtime', '-c', BOOT], tree)
+    packages = {}
+    for line in result.stderr.splitlines():
+        match = IMPORT_LINE.match(line)
+        if match and '.' not in match.group(4):
+            # A package's own line carries the cumulative time of its submodules
+            packages[match.group(4)] = max(packages.get(match.group(4), 0), int(match.group(2)) / 1000)
+    return [(name, round(ms, 1)) for name, ms in sorted(packages.items(), key=lambda item: -item[1])[:limit]]
+
+
+def measure(tree, runs, top):
+    # One warm-up of each, so .pyc compilation is not counted
+    timed([sys.executable, '-c', BOOT], tree)
+    timed([sys.executable, 'manage.py', 'check'], tree)
+
+    boot_wall, boot_app, command_wall = [], [], []
+    for _ in range(runs):
+        wall, result = timed([sys.executable, '-c', BOOT], tree)
+        boot_wall.append(wall)
+        boot_app.append(float(result.stdout.strip().splitlines()[-1]))
+        wall, _ = timed([sys.executable, 'manage.py', 'check'], tree)
+        command_wall.append(wall)
+    return {
+        'worker_boot_seconds': round(statistics.median(boot_wall), 3),
+        'app_import_seconds': round(statistics.median(boot_app), 3),
+        'manage_py_seconds': round(statistics.median(command_wall), 3),
+        'slowest_imports_ms': slowest_imports(tree, top),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--ref', action='append', default=[], help='Also measure this git revision (repeatable)')
+    parser.add_argument('--top', type=int, default=10, help='Slowest imports to list')
+    parser.add_argument('--json', help='Write results to this file')
+    args = parser.parse_args()
+
+    results = {'working tree': measure(ROOT, args.runs, args.top)}
+    for ref in args.ref:
+        with tempfile.TemporaryDirectory(prefix='cold-start-') as directory:
+            tree = os.path.join(directory, 'tree')
+            subprocess.run(['git', 'worktree', 'add', '--detach', '--quiet', tree, ref], cwd=ROOT, check=True)
+            try:
+                results[ref] = measure(tree, args.runs, args.top)
+            finally:
+                subprocess.run(['git', 'worktree', 'remove', '--force', tree], cwd=ROOT, check=True)
+
+    for name, result in results.items():
+        print(f'{name:<16} worker boot {result["worker_boot_seconds"]:.3f}s '
+              f'(app imports {result["app_import_seconds"]:.3f}s), manage.py {result["manage_py_seconds"]:.3f}s',
+              file=sys.stderr)
+    print(json.dumps(results, indent=2))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,235 @@
+"""
+Synthetic contracts for the benchmarks.
+
+Everything is generated from a seeded ``random.Random`` so two runs with the
+same seed produce byte-identical corpora, which keeps results comparable
+across commits. Text PDFs are written directly (one Helvetica text stream per
+page), so no PDF library is needed to build them; scans, photos and Word
+files need Pillow and python-docx, which the app already depends on.
+"""
+import random
+
+SUBJECTS = ['The Employee', 'The Employer', 'Either party', 'The Contractor', 'The Tenant', 'The Company']
+VERBS = ['shall be entitled to', 'shall give', 'may terminate', 'shall pay', 'shall not disclose', 'shall provide']
+OBJECTS = [
+    'thirty days written notice', 'annual leave of twenty two working days', 'overtime at one and a half times',
+    'a monthly salary of USD 1,200', 'confidential information', 'contributions to NSSA',
+    'the agreement without cause', 'training and development opportunities', 'sick leave on full pay',
+]
+QUALIFIERS = [
+    'in accordance with the Labour Act [Chapter 28:01]', 'during the probation period of three months',
+    'subject to the governing law of Zimbabwe', 'upon completion of the review period', '',
+]
+HEADINGS = [
+    'Commencement and Duration', 'Position and Duties', 'Remuneration', 'Working Hours and Overtime',
+    'Leave Entitlement', 'Termination', 'NSSA and NEC', 'Confidentiality', 'Governing Law',
+]
+PARTIES = ['Zimbabwe Mining Corporation', 'Harare Logistics (Pvt) Ltd', 'Tendai Moyo', 'Rudo Chikore',
+           'Bulawayo Textiles', 'Farai Ncube', 'Mutare Agro Holdings', 'Nyasha Dube']
+LINES_PER_PAGE = 45
+
+
+def synthetic_clause(rng):
+    return ' '.join(filter(None, [
+        rng.choice(SUBJECTS), rng.choice(VERBS), rng.choice(OBJECTS), rng.choice(QUALIFIERS),
+    ])) + '.'
+
+
+def contract_text(rng, words=800):
+    """
+    An employment-style contract of roughly ``words`` words.
+    """
+    employer, employee = rng.sample(PARTIES, 2)
+    parts = [
+        'EMPLOYMENT CONTRACT',
+        f'This agreement is made between {employer} ("the Employer") and {employee} ("the Employee").',
+    ]
+    count = sum(len(part.split()) for part in parts)
+    section = 0
+    while count < words:
+        section += 1
+        heading = f'{section}. {HEADINGS[(section - 1) % len(HEADINGS)]}'
+        body = ' '.join(synthetic_clause(rng) for _ in range(rng.randint(3, 6)))
+        parts.extend([heading, body])
+        count += len(heading.split()) + len(body.split())
+    return '\n\n'.join(parts)
+
+
+def wrap(text, width=90):
+    lines = []
+    for paragraph in text.split('\n'):
+        line = ''
+        for word in paragraph.split():
+            if line and len(line) + 1 + len(word) > width:
+                lines.append(line)
+                line = word
+            else:
+                line = f'{line} {word}' if line else word
+        lines.append(line)
+    return lines
+
+
+def _escape(line):
+    return line.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+
+def _stream(data, entries=b''):
+    return b'<< %s/Length %d >>\nstream\n%s\nendstream' % (entries, len(data), data)
+
+
+def _pdf(pages):
+    """
+    Assemble a PDF from ``(content stream, resources, extra objects)`` per
+    page; ``{n}`` in resources refers to the page's n-th extra object.
+    """
+    objects = [b'<< /Type /Catalog /Pages 2 0 R >>', None,
+               b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>']
+    kids = []
+    for content, resources, extra in pages:
+        numbers = []
+        for body in extra:
+            objects.append(body)
+            numbers.append(b'%d' % len(objects))
+        objects.append(_stream(content))
+        objects.append(
+            b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Resources %s /Contents %d 0 R >>'
+            % (resources.replace(b'{0}', numbers[0]) if numbers else resources, len(objects))
+        )
+        kids.append(len(objects))
+    objects[1] = b'<< /Type /Pages /Kids [%s] /Count %d >>' % (
+        b' '.join(b'%d 0 R' % kid for kid in kids), len(kids))
+
+    out = bytearray(b'%PDF-1.4\n')
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += b'%d 0 obj\n%s\nendobj\n' % (number, body)
+    xref = len(out)
+    out += b'xref\n0 %d\n0000000000 65535 f \n' % (len(objects) + 1)
+    out += b''.join(b'%010d 00000 n \n' % offset for offset in offsets)
+    out += b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (len(objects) + 1, xref)
+    return bytes(out)
+
+
+def text_pdf(pages):
+    """
+    A PDF with one page per entry of ``pages`` (each a list of lines).
+    """
+    return _pdf([
+        (('BT /F1 10 Tf 50 800 Td 14 TL\n' + ''.join(f'({_escape(line)}) Tj T*\n' for line in lines) + 'ET')
+         .encode('latin-1', 'replace'), b'<< /Font << /F1 3 0 R >> >>', [])
+        for lines in pages
+    ])
+
+
+def contract_pages(rng, pages):
+    """
+    ``pages`` pages of contract lines with a running header and page numbers.
+    """
+    lines = wrap(contract_text(rng, words=pages * 450))
+    body = LINES_PER_PAGE - 4
+    chunks = [lines[i:i + body] for i in range(0, max(len(lines), 1), body)][:pages]
+    while len(chunks) < pages:
+        chunks.append(wrap(contract_text(rng, words=450))[:body])
+    return [
+        ['CONFIDENTIAL - EMPLOYMENT CONTRACT', ''] + chunk + ['', f'Page {number} of {pages}']
+        for number, chunk in enumerate(chunks, 1)
+    ]
+
+
+def contract_pdf(rng, pages):
+    """
+    A text PDF of ``pages`` pages.
+    """
+    return text_pdf(contract_pages(rng, pages))
+
+
+def page_image(lines, width, height, rng=None, skew=0.0, noise=0):
+    """
+    Render lines of text onto a white greyscale page of ``width`` x
+    ``height`` pixels; ``skew`` (degrees) and ``noise`` (speckles per
+    megapixel) make it look photographed rather than scanned.
+    """
+    from PIL import Image, ImageDraw, ImageFilter, ImageFont
+
+    image = Image.new('L', (width, height), 255)
+    draw = ImageDraw.Draw(image)
+    margin = width // 12
+    line_height = (height - 2 * margin) / max(LINES_PER_PAGE, len(lines))
+    font = ImageFont.load_default(size=max(8, int(line_height * 0.7)))
+    for number, line in enumerate(lines):
+        draw.text((margin, margin + number * line_height), line, fill=0, font=font)
+    if noise and rng is not None:
+        for _ in range(int(noise * width * height / 1_000_000)):
+            x, y = rng.randrange(width), rng.randrange(height)
+            draw.point((x, y), fill=rng.randint(0, 160))
+    if skew:
+        image = image.rotate(skew, resample=Image.BICUBIC, expand=False, fillcolor=235)
+        image = image.filter(ImageFilter.GaussianBlur(0.6))
+    return image
+
+
+def jpeg(image, quality=80):
+    import io
+
+    buffer = io.BytesIO()
+    image.save(buffer, format='JPEG', quality=quality)
+    return buffer.getvalue()
+
+
+def scanned_pdf(rng, pages, dpi=200):
+    """
+    An image-only PDF: each page is a JPEG of rendered contract text at
+    ``dpi``, as produced by an office scanner. It has no text layer.
+    """
+    width, height = int(8.27 * dpi), int(11.69 * dpi)
+    result = []
+    for lines in contract_pages(rng, pages):
+        data = jpeg(page_image(lines, width, height, rng, skew=rng.uniform(-0.8, 0.8), noise=40))
+        image = _stream(data, b'/Type /XObject /Subtype /Image /Width %d /Height %d '
+                              b'/ColorSpace /DeviceGray /BitsPerComponent 8 /Filter /DCTDecode ' % (width, height))
+        result.append((b'q 595 0 0 842 0 0 cm /Im1 Do Q', b'<< /XObject << /Im1 {0} 0 R >> >>', [image]))
+    return _pdf(result)
+
+
+def photo_jpeg(rng, width, height):
+    """
+    A phone photo of one contract page: skewed, noisy, slightly blurred.
+    """
+    lines = contract_pages(rng, 1)[0]
+    return jpeg(page_image(lines, width, height, rng, skew=rng.uniform(-4, 4), noise=400), quality=85)
+
+
+def contract_docx(rng, paragraphs, tables=2, rows=10):
+    """
+    A Word contract of ``paragraphs`` paragraphs with ``tables`` tables
+    (a salary schedule of ``rows`` rows each).
+    """
+    import io
+
+    import docx
+
+    document = docx.Document()
+    document.add_heading('EMPLOYMENT CONTRACT', level=1)
+    every = max(1, paragraphs // (tables + 1))
+    for number in range(paragraphs):
+        if number % 10 == 0:
+            document.add_heading(f'{number // 10 + 1}. {HEADINGS[(number // 10) % len(HEADINGS)]}', level=2)
+        document.add_paragraph(' '.join(synthetic_clause(rng) for _ in range(rng.randint(2, 4))))
+        if tables and number and number % every == 0 and number // every <= tables:
+            table = document.add_table(rows=rows + 1, cols=4)
+            for cell, title in zip(table.rows[0].cells, ['Grade', 'Position', 'Monthly salary (USD)', 'Leave days']):
+                cell.text = title
+            for row in table.rows[1:]:
+                for cell, value in zip(row.cells, [
+                    f'G{rng.randint(1, 12)}', rng.choice(['Clerk', 'Engineer', 'Driver', 'Manager', 'Officer']),
+                    f'{rng.randint(300, 4000):,}', str(rng.randint(18, 30)),
+                ]):
+                    cell.text = value
+    buffer = io.BytesIO()
+    document.save(buffer)
+    return buffer.getvalue()
+
+
+def seeded(seed):
+    return random.Random(seed)
@@ -0,0 +1,304 @@
+"""
+End-to-end API benchmark against a seeded synthetic corpus.
+
+Migrates a scratch SQLite database, seeds ``--users`` users with
+``--documents`` documents, ``--analyses`` analyses and ``--reports`` reports,
+starts the fake OpenAI server (``fake_openai.py``) with the requested
+latency, and serves ``legalbackend.asgi`` under uvicorn with the real OpenAI
+backend pointed at it. Each scenario is then driven with ``--requests``
+requests at every ``--concurrency`` level, and the report lists throughput,
+p50/p95/p99/max latency, status codes and the server's peak RSS per
+scenario and level:
+
+    python benchmarks/e2e.py --concurrency 1,10,50 --latency 1.5 --json bench-$(git rev-parse --short HEAD).json
+    python benchmarks/e2e.py --concurrency 1,10,50 --latency 1.5 --compare bench-abc1234.json
+
+The corpus is generated from ``--seed``, so runs with the same arguments are
+comparable across commits; the report records the commit it was run on.
+Requires ``uvicorn`` and ``httpx``.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime, timezone
+
+import corpus
+import fake_openai
+from async_analyze import free_port, percentile, process_stats, start_server
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+REPORT_TYPES = ['bug', 'feature', 'improvement']
+
+
+def seed(workdir, args, base_url):
+    """
+    Migrate and fill a scratch database; return (env, user tokens, admin token).
+    """
+    env = dict(
+        os.environ,
+        DJANGO_SETTINGS_MODULE='legalbackend.settings',
+        SQLITE_PATH=os.path.join(workdir, 'db.sqlite3'),
+        SQLITE_WAL='True',
+        CLAUSE_INDEX_DIR=os.path.join(workdir, 'clause_index'),
+        LLM_BACKEND='openai',
+        OPENAI_API_KEY='benchmark',
+        OPENAI_BASE_URL=base_url,
+        DEBUG='False',
+    )
+    subprocess.run([sys.executable, 'manage.py', 'migrate', '-v', '0'], cwd=ROOT, env=env, check=True)
+    os.environ.update(env)
+
+    import django
+    django.setup()
+    from django.contrib.auth.hashers import make_password
+    from django.db import connections
+    from rest_framework_simplejwt.tokens import RefreshToken
+
+    from analysis.models import Document, DocumentAnalysis, Report, User
+
+    rng = corpus.seeded(args.seed)
+    password = make_password('benchmark')
+    users = User.objects.bulk_create([
+        User(email=f'bench{i}@example.com', username=f'bench{i}', password=password, token_quota=10 ** 9)
+        for i in range(args.users)
+    ])
+    admin = User.objects.create(email='bench-admin@example.com', username='bench-admin', password=password,
+                                account_type='admin', is_staff=True, is_superuser=True)
+    texts = [corpus.contract_text(rng, words=rng.randint(300, 1500)) for _ in range(50)]
+    report = fake_openai.REPORT
+
+    for start in range(0, args.documents, 1000):
+        Document.objects.bulk_create([
+            Document(title=f'contract-{i}.pdf', content=texts[i % len(texts)], user=users[i % len(users)],
+                     status=rng.choice(['pending', 'analyzed']))
+            for i in range(start, min(start + 1000, args.documents))
+        ])
+    for start in range(0, args.analyses, 1000):
+        DocumentAnalysis.objects.bulk_create([
+            DocumentAnalysis(content=texts[i % len(texts)], analysis_result=report, user=users[i % len(users)])
+            for i in range(start, min(start + 1000, args.analyses))
+        ])
+    Report.objects.bulk_create([
+        Report(title=f'Report {i}', description=corpus.synthetic_clause(rng), type=rng.choice(REPORT_TYPES),
+               user=users[i % len(users)])
+        for i in range(args.reports)
+    ])
+    tokens = [str(RefreshToken.for_user(user).access_token) for user in users]
+    admin_token = str(RefreshToken.for_user(admin).access_token)
+    connections.close_all()
+    return env, tokens, admin_token
+
+
+def scenarios(args):
+    """
+    Scenario name -> (admin only, factory of httpx request kwargs for request ``i``).
+    """
+    rng = corpus.seeded(args.seed + 1)
+    texts = [corpus.contract_text(rng, words=args.analyze_words) for _ in range(20)]
+    pdf = corpus.contract_pdf(rng, args.pdf_pages)
+
+    def upload(i):
+        text = f'{texts[i % len(texts)]}\n\nReference {i}'
+        return {'method': 'POST', 'url': '/api/documents/upload/',
+                'files': {'file': (f'contract-{i}.txt', text.encode('utf-8'), 'text/plain')}}
+
+    def extraction(i):
+        return {'method': 'POST', 'url': '/api/documents/upload/',
+                'files': {'file': (f'contract-{i}.pdf', pdf, 'application/pdf')}}
+
+    def analyze(i):
+        # Distinct texts, so no two requests share one model call
+        return {'method': 'POST', 'url': '/api/analyze-text/',
+                'json': {'text': f'{texts[i % len(texts)]}\n\nReference {i}'}}
+
+    return {
+        'upload': (False, upload),
+        'extraction': (False, extraction),
+        'analyze': (False, analyze),
+        'history': (False, lambda i: {'method': 'GET', 'url': '/api/analyses/'}),
+        'documents': (False, lambda i: {'method': 'GET', 'url': '/api/documents/'}),
+        'admin_dashboard': (True, lambda i: {'method': 'GET', 'url': '/api/admin/dashboard/'}),
+        'admin_analytics': (True, lambda i: {'method': 'GET', 'url': '/api/admin/analytics/'}),
+        'admin_users': (True, lambda i: {'method': 'GET', 'url': '/api/admin/users/'}),
+        'admin_reports': (True, lambda i: {'method': 'GET', 'url': '/api/admin/reports/'}),
+    }
+
+
+async def sample_rss(pid, peaks, stop):
+    while not stop.is_set():
+        _, rss = process_stats(pid)
+        if rss is not None:
+            peaks['peak_rss_mib'] = round(max(peaks.get('peak_rss_mib', 0), rss), 1)
+        await asyncio.sleep(0.05)
+
+
+async def drive(port, tokens, build, counter, requests, concurrency, warmup, timeout, server_pid):
+    import httpx
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=f'http://127.0.0.1:{port}', limits=limits, timeout=timeout) as client:
+        async def one():
+            i = next(counter)
+            kwargs = build(i)
+            started = time.perf_counter()
+            try:
+                response = await client.request(
+                    headers={'Authorization': f'Bearer {tokens[i % len(tokens)]}'}, **kwargs
+                )
+                code = response.status_code
+            except httpx.HTTPError as e:
+                code = type(e).__name__
+            return code, time.perf_counter() - started
+
+        for _ in range(warmup):
+            await one()
+
+        queue = asyncio.Queue()
+        for _ in range(requests):
+            queue.put_nowait(None)
+        results = []
+
+        async def worker():
+            while not queue.empty():
+                queue.get_nowait()
+                results.append(await one())
+
+        peaks, stop = {}, asyncio.Event()
+        sampler = asyncio.create_task(sample_rss(server_pid, peaks, stop))
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        wall = time.perf_counter() - started
+        stop.set()
+        await sampler
+
+    latencies = [latency for code, latency in results if isinstance(code, int) and code < 400]
+    return {
+        **peaks,
+        'requests': requests,
+        'succeeded': len(latencies),
+        'status_codes': dict(Counter(str(code) for code, _ in results)),
+        'wall_seconds': round(wall, 3),
+        'throughput_rps': round(len(latencies) / wall, 2) if wall else None,
+        **{
+            f'p{pct}_seconds': round(percentile(latencies, pct), 4) if latencies else None
+            for pct in (50, 95, 99)
+        },
+        'max_seconds': round(max(latencies), 4) if latencies else None,
+    }
+
+
+def git_revision():
+    def git(*command):
+        result = subprocess.run(['git', *command], cwd=ROOT, capture_output=True, text=True)
+        return result.stdout.strip() if result.returncode == 0 else None
+    return {'commit': git('rev-parse', 'HEAD'), 'dirty': bool(git('status', '--porcelain', '--untracked-files=no'))}
+
+
+def compare(results, baseline_path):
+    """
+    Print throughput and p95 changes relative to an earlier report.
+    """
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    print(f'\nCompared with {baseline["meta"].get("commit") or baseline_path}:')
+    print(f'{"scenario":<18}{"conc":>6}{"rps":>10}{"Δrps":>9}{"p95 s":>10}{"Δp95":>9}')
+    for name, levels in results.items():
+        for level, current in levels.items():
+            before = baseline['results'].get(name, {}).get(level)
+
+            def change(key):
+                if not before or not before.get(key) or current.get(key) is None:
+                    return '-'
+                return f'{(current[key] - before[key]) / before[key] * 100:+.1f}%'
+            print(f'{name:<18}{level:>6}{current["throughput_rps"] or 0:>10.2f}{change("throughput_rps"):>9}'
+                  f'{current["p95_seconds"] or 0:>10.3f}{change("p95_seconds"):>9}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--documents', type=int, default=5000)
+    parser.add_argument('--analyses', type=int, default=5000)
+    parser.add_argument('--reports', type=int, default=500)
+    parser.add_argument('--scenarios', default='all', help='Comma-separated scenario names, or "all"')
+    parser.add_argument('--concurrency', default='1,10,50', help='Comma-separated concurrency levels')
+    parser.add_argument('--requests', type=int, default=200, help='Requests per scenario and level')
+    parser.add_argument('--warmup', type=int, default=3, help='Unmeasured requests before each run')
+    parser.add_argument('--latency', type=float, default=1.0, help='Fake OpenAI latency per completion (s)')
+    parser.add_argument('--jitter', type=float, default=0.2, help='Extra random upstream latency, up to (s)')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of upstream calls failing with 503')
+    parser.add_argument('--pdf-pages', type=int, default=10, help='Pages of the PDF in the extraction scenario')
+    parser.add_argument('--analyze-words', type=int, default=1200, help='Words per analyzed contract')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--timeout', type=float, default=600.0)
+    parser.add_argument('--json', help='Write the report to this file')
+    parser.add_argument('--compare', help='Earlier report to compare against')
+    args = parser.parse_args()
+
+    available = scenarios(args)
+    names = list(available) if args.scenarios == 'all' else args.scenarios.split(',')
+    unknown = [name for name in names if name not in available]
+    if unknown:
+        parser.error(f'Unknown scenarios: {", ".join(unknown)} (choose from {", ".join(available)})')
+    levels = [int(level) for level in args.concurrency.split(',')]
+
+    upstream = fake_openai.start(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate)
+    report = {
+        'meta': {
+            **git_revision(),
+            'started_at': datetime.now(timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'arguments': vars(args),
+        },
+        'results': {},
+    }
+    with tempfile.TemporaryDirectory(prefix='e2e-bench-') as workdir:
+        started = time.monotonic()
+        env, tokens, admin_token = seed(workdir, args, f'http://127.0.0.1:{upstream.server_port}/v1')
+        report['meta']['seed_seconds'] = round(time.monotonic() - started, 2)
+
+        port = free_port()
+        server = start_server(env, port, async_views=True)
+        try:
+            for name in names:
+                admin_only, build = available[name]
+                # Numbered across levels: a repeated analyze text would be
+                # answered from the finished flight instead of the model
+                counter = itertools.count()
+                report['results'][name] = {}
+                for level in levels:
+                    result = asyncio.run(drive(
+                        port, [admin_token] if admin_only else tokens, build, counter,
+                        args.requests, level, args.warmup, args.timeout, server.pid,
+                    ))
+                    report['results'][name][str(level)] = result
+                    print(f'{name:<18} c={level:<4} {result["throughput_rps"] or 0:>8.2f} req/s  '
+                          f'p50 {result["p50_seconds"]}s  p95 {result["p95_seconds"]}s  '
+                          f'p99 {result["p99_seconds"]}s  {result["status_codes"]}', file=sys.stderr)
+        finally:
+            server.terminate()
+            server.wait(timeout=10)
+            upstream.shutdown()
+    report['meta']['upstream_requests'] = upstream.requests
+
+    print(json.dumps(report, indent=2))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        compare(report['results'], args.compare)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+"""
+Micro-benchmark of the contract extractors in ``analysis.extraction``.
+
+Generates a seeded corpus of controlled size (``corpus.py``): n-page text
+PDFs, image-only "scanned" PDFs, Word files with salary tables and phone
+photos of a page at several resolutions. Each file is run through its
+extractor (``extract_text_from_pdf``, ``extract_text_from_docx``,
+``extract_text_from_image``) and through ``process_uploaded_file``, in a
+fresh process per case so the peak RSS belongs to that case alone. The
+report gives the median time, pages/s, MB/s, characters extracted and peak
+RSS per case:
+
+    python benchmarks/extraction.py --pdf-pages 1,10,100 --photos 1280x960,3024x4032 --json extraction.json
+
+Image OCR needs the ``tesseract`` binary; without it those cases report the
+error instead of timings.
+"""
+import argparse
+import io
+import json
+import multiprocessing
+import os
+import resource
+import statistics
+import sys
+import time
+
+import corpus
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def peak_rss_mib():
+    # ru_maxrss is in KiB on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def measure(function_name, filename, data, repeat):
+    """
+    Time ``analysis.extraction.<function_name>`` on ``data``; runs in a
+    child process.
+    """
+    from analysis import extraction
+
+    function = getattr(extraction, function_name)
+    baseline = peak_rss_mib()
+    timings, text = [], ''
+    try:
+        for _ in range(repeat):
+            buffer = io.BytesIO(data)
+            buffer.name = filename
+            started = time.perf_counter()
+            text = function(buffer)
+            timings.append(time.perf_counter() - started)
+    except Exception as e:
+        return {'error': f'{type(e).__name__}: {e}'}
+    return {
+        'seconds': statistics.median(timings),
+        'characters': len(text),
+        'peak_rss_mib': round(peak_rss_mib(), 1),
+        'rss_growth_mib': round(peak_rss_mib() - baseline, 1),
+    }
+
+
+def cases(args):
+    """
+    ``(format, label, file name, bytes, pages, extractor)`` for every case.
+    """
+    rng = corpus.seeded(args.seed)
+    for pages in args.pdf_pages:
+        yield 'pdf', f'{pages} pages', 'contract.pdf', corpus.contract_pdf(rng, pages), pages, 'extract_text_from_pdf'
+    for pages in args.scanned_pages:
+        yield ('scanned_pdf', f'{pages} pages @ {args.scan_dpi}dpi', 'scan.pdf',
+               corpus.scanned_pdf(rng, pages, args.scan_dpi), pages, 'extract_text_from_pdf')
+    for paragraphs in args.docx_paragraphs:
+        # Word has no fixed pages; count roughly 25 paragraphs per printed page
+        yield ('docx', f'{paragraphs} paragraphs, {args.docx_tables} tables', 'contract.docx',
+               corpus.contract_docx(rng, paragraphs, args.docx_tables), max(1, paragraphs // 25),
+               'extract_text_from_docx')
+    for width, height in args.photos:
+        yield 'image', f'{width}x{height}', 'photo.jpg', corpus.photo_jpeg(rng, width, height), 1, 'extract_text_from_image'
+
+
+def sizes(value):
+    return [int(part) for part in value.split(',') if part]
+
+
+def resolutions(value):
+    return [tuple(int(n) for n in part.split('x')) for part in value.split(',') if part]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--pdf-pages', type=sizes, default=[1, 10, 50], help='Text PDF page counts')
+    parser.add_argument('--scanned-pages', type=sizes, default=[1, 5], help='Scanned PDF page counts')
+    parser.add_argument('--scan-dpi', type=int, default=200)
+    parser.add_argument('--docx-paragraphs', type=sizes, default=[50, 500], help='Word paragraph counts')
+    parser.add_argument('--docx-tables', type=int, default=3)
+    parser.add_argument('--photos', type=resolutions, default=[(1280, 960), (3024, 4032)],
+                        help='Photo resolutions, e.g. 1280x960,3024x4032')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per case; the median is reported')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', help='Write results to this file')
+    args = parser.parse_args()
+
+    # A fresh interpreter per case, so peak RSS is not inherited from earlier cases
+    context = multiprocessing.get_context('spawn')
+    results = []
+    for fmt, label, filename, data, pages, extractor in cases(args):
+        megabytes = len(data) / (1024 * 1024)
+        for function_name in (extractor, 'process_uploaded_file'):
+            with context.Pool(1) as pool:
+                result = pool.apply(measure, (function_name, filename, data, args.repeat))
+            row = {'format': fmt, 'case': label, 'function': function_name, 'pages': pages,
+                   'bytes': len(data), **result}
+            if 'seconds' in result:
+                row['pages_per_second'] = round(pages / result['seconds'], 2) if result['seconds'] else None
+                row['mb_per_second'] = round(megabytes / result['seconds'], 2) if result['seconds'] else None
+                row['seconds'] = round(result['seconds'], 4)
+            results.append(row)
+            print(f'{fmt:<12} {label:<28} {function_name:<24} ' + (
+                f'{row["seconds"]:>8.3f}s {row["pages_per_second"]:>9.1f} pages/s {row["mb_per_second"]:>8.2f} MB/s '
+                f'{row["peak_rss_mib"]:>7.1f} MiB peak {row["characters"]:>9} chars'
+                if 'seconds' in result else result['error']
+            ), file=sys.stderr)
+
+    print(json.dumps(results, indent=2))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
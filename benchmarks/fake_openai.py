@@ -0,0 +1,134 @@
+"""
+A local OpenAI-compatible chat completions server for benchmarks.
+
+Answers ``POST /v1/chat/completions`` after ``--latency`` seconds (plus up to
+``--jitter``) with a canned legal report and word-count token usage, and
+fails ``--error-rate`` of requests with a 503. Point the app at it with
+``LLM_BACKEND=openai OPENAI_BASE_URL=http://127.0.0.1:<port>/v1`` so the
+real OpenAI SDK, connection pool and retry policy are exercised end to end.
+
+    python benchmarks/fake_openai.py --port 8100 --latency 1.5 --jitter 0.5
+
+Requests are served on their own threads, so concurrent calls overlap like
+they do against the real API.
+"""
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+REPORT = """---REPORT---
+
+1. Parties Identification
+   1.1 First Party
+       • Name: The Employer
+       • Role: Employer
+   1.2 Second Party
+       • Name: The Employee
+       • Role: Employee
+
+2. Clause Extraction and Analysis
+   Termination Conditions
+   i. Extracted Text (verbatim): "Either party may terminate the agreement with thirty days written notice."
+   ii. Legal Basis: Labour Act [Chapter 28:01] §12
+   iii. Requirements Summary: Notice must be given in writing.
+   iv. Risk Assessment: Low – The notice period meets the statutory minimum.
+
+4. Risk Log
+   - Termination – Procedural – Severity (1–5): 2 – Mitigation: Keep written records of notice.
+
+7. Summary
+This is a synthetic report returned by the benchmark server.
+"""
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        try:
+            request = json.loads(self.rfile.read(length) or b'{}')
+        except ValueError:
+            return self.send_json(400, {'error': {'message': 'Invalid JSON body'}})
+        if self.path.rstrip('/') != '/v1/chat/completions':
+            return self.send_json(404, {'error': {'message': f'Unknown path {self.path}'}})
+
+        server = self.server
+        time.sleep(server.latency + random.uniform(0, server.jitter))
+        with server.lock:
+            server.requests += 1
+        if random.random() < server.error_rate:
+            return self.send_json(503, {'error': {'message': 'Injected failure', 'type': 'server_error'}})
+
+        prompt_tokens = sum(len(str(message.get('content', '')).split()) for message in request.get('messages', []))
+        completion_tokens = len(REPORT.split())
+        self.send_json(200, {
+            'id': f'chatcmpl-{uuid.uuid4().hex}',
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': request.get('model', 'fake'),
+            'choices': [{
+                'index': 0,
+                'message': {'role': 'assistant', 'content': REPORT},
+                'finish_reason': 'stop',
+            }],
+            'usage': {
+                'prompt_tokens': prompt_tokens,
+                'completion_tokens': completion_tokens,
+                'total_tokens': prompt_tokens + completion_tokens,
+            },
+        })
+
+
+class Server(ThreadingHTTPServer):
+    daemon_threads = True
+    # Listen backlog; the default of 5 drops connections under benchmark load
+    request_queue_size = 1024
+
+
+def start(port=0, latency=1.0, jitter=0.0, error_rate=0.0):
+    """
+    Serve on a background thread and return the server; its base URL is
+    ``http://127.0.0.1:<server.server_port>/v1``. Stop it with ``shutdown()``.
+    """
+    server = Server(('127.0.0.1', port), Handler)
+    server.latency, server.jitter, server.error_rate = latency, jitter, error_rate
+    server.requests, server.lock = 0, threading.Lock()
+    threading.Thread(target=server.serve_forever, name='fake-openai', daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--port', type=int, default=8100)
+    parser.add_argument('--latency', type=float, default=1.0, help='Seconds per completion')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Extra random latency, up to this many seconds')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of requests answered with a 503')
+    args = parser.parse_args()
+
+    server = start(args.port, args.latency, args.jitter, args.error_rate)
+    print(f'Fake OpenAI API on http://127.0.0.1:{server.server_port}/v1')
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+"""
+API response rendering benchmark.
+
+Builds the payloads of the heaviest JSON endpoints from the synthetic
+contract corpus (``corpus.py``): the analysis history (``--history`` analyses
+of contract text plus a model report each), one document's content and the
+upload echo, with timezone-aware datetimes as the views return them. Each is
+rendered with DRF's stock ``JSONRenderer`` and with
+``analysis.renderers.ORJSONRenderer``, and the rendered body is compressed
+the way ``CompressionMiddleware`` does. The report gives the median CPU time
+per render and per compression and the bytes on the wire for each encoding:
+
+    python benchmarks/rendering.py --history 50,200 --words 2000 --json rendering.json
+
+Runs in-process with no database or HTTP server.
+"""
+import argparse
+import datetime
+import json
+import os
+import statistics
+import sys
+import time
+
+import corpus
+from fake_openai import REPORT
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'legalbackend.settings')
+
+
+def payloads(history_sizes, words):
+    rng = corpus.seeded(7)
+    now = datetime.datetime(2026, 1, 1, 12, 0, 0, 123456, tzinfo=datetime.timezone.utc)
+    document = {
+        'id': 1, 'title': 'Employment contract.pdf', 'content': corpus.contract_text(rng, words),
+        'status': 'uploaded', 'upload_date': now,
+    }
+    cases = {
+        'document_content': document,
+        'upload_echo': dict(document, id=2, content=corpus.contract_text(rng, words)),
+    }
+    for size in history_sizes:
+        cases[f'analysis_history_{size}'] = [{
+            'id': index,
+            'content': corpus.contract_text(rng, words),
+            'analysis_result': REPORT,
+            'created_at': now - datetime.timedelta(minutes=index),
+        } for index in range(size)]
+    return cases
+
+
+def cpu_time(function, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.process_time()
+        function()
+        timings.append(time.process_time() - started)
+    return statistics.median(timings)
+
+
+def measure(data, repeat):
+    from django.conf import settings
+    from rest_framework.renderers import JSONRenderer
+
+    from analysis import compression
+    from analysis.renderers import ORJSONRenderer
+
+    levels = settings.API_COMPRESSION.get('LEVELS', {})
+    result = {}
+    for name, renderer in (('stdlib', JSONRenderer()), ('orjson', ORJSONRenderer())):
+        body = renderer.render(data)
+        result[f'{name}_render_ms'] = round(cpu_time(lambda: renderer.render(data), repeat) * 1000, 3)
+    result['identity_bytes'] = len(body)
+    for encoding in compression.ENCODINGS:
+        level = levels.get(encoding)
+        result[f'{encoding}_bytes'] = len(compression.compress(body, encoding, level))
+        result[f'{encoding}_compress_ms'] = round(
+            cpu_time(lambda: compression.compress(body, encoding, level), repeat) * 1000, 3
+        )
+    result['render_speedup'] = round(result['stdlib_render_ms'] / max(result['orjson_render_ms'], 1e-6), 1)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--history', default='20,200', help='Comma-separated analysis history sizes')
+    parser.add_argument('--words', type=int, default=1500, help='Words per contract')
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--json', help='Write results to this file')
+    args = parser.parse_args()
+
+    import django
+    django.setup()
+
+    results = {}
+    for name, data in payloads([int(size) for size in args.history.split(',')], args.words).items():
+        results[name] = result = measure(data, args.repeat)
+        encoded = ', '.join(
+            f'{key[:-6]} {value / 1024:.0f} KiB' for key, value in result.items() if key.endswith('_bytes')
+        )
+        print(f'{name:<24} render {result["stdlib_render_ms"]:.2f}ms -> {result["orjson_render_ms"]:.2f}ms '
+              f'({result["render_speedup"]}x); {encoded}', file=sys.stderr)
+    print(json.dumps(results, indent=2))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
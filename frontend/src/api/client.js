@@ -118,6 +118,9 @@ export const endpoints = {
     create: 'notifications/',
     list: 'notifications/',
     update: 'notifications/',
+    stream: 'notifications/stream/',
+    unreadCount: 'notifications/unread-count/',
+    markRead: 'notifications/mark-read/',
   },
   admin: {
     dashboard: 'admin/dashboard/',
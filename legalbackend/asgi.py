@@ -2,6 +2,10 @@
 ASGI config for legalbackend project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Serve it with an ASGI server, e.g. ``uvicorn legalbackend.asgi:application``,
+so the async LLM views in ``analysis.async_views`` run on the event loop and
+the notification stream (``analysis.notifications``) can hold thousands of
+idle Server-Sent Events connections per process.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
@@ -1,11 +1,15 @@
 from pathlib import Path
 import os
-from dotenv import load_dotenv
 from datetime import timedelta
 
-# Load environment variables from .env file
-load_dotenv()
-print(f"Loaded OpenAI API Key: {os.getenv('OPENAI_API_KEY')}")
+# Load environment variables from a .env file when python-dotenv is installed;
+# deployments that set the environment directly don't need it
+try:
+    from dotenv import load_dotenv
+except ImportError:
+    pass
+else:
+    load_dotenv()
 
 
 # Set base directory for the project
@@ -23,9 +27,12 @@ SECRET_KEY = os.getenv('DJANGO_SECRET_KEY', 'insecure-default-secret-key')
 DEBUG = os.getenv('DEBUG', 'False') == 'True'
 
 
+# LLM backend: 'openai' for the real API, 'stub' for offline runs and load tests
+LLM_BACKEND = os.getenv('LLM_BACKEND', 'openai')
+
 # Ensure OpenAI API Key is set in the environment
 OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
-if not OPENAI_API_KEY:
+if not OPENAI_API_KEY and LLM_BACKEND == 'openai':
     raise ValueError("OPENAI_API_KEY environment variable is not set")
 
 # Define allowed hosts
@@ -51,9 +58,12 @@ INSTALLED_APPS = [
 
 # Middleware configuration
 MIDDLEWARE = [
+    'analysis.middleware.TracingMiddleware',
+    'analysis.middleware.TimingMiddleware',
+    'analysis.middleware.CompressionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',
+    'analysis.middleware.StaticFilesMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -92,10 +102,15 @@ WSGI_APPLICATION = 'legalbackend.wsgi.application'
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'NAME': os.getenv('SQLITE_PATH', BASE_DIR / 'db.sqlite3'),
     }
 }
 
+# Switch SQLite databases to WAL journaling, so readers run alongside the
+# writer (analysis.signals). The journal mode is stored in the database file,
+# so this is opt-in for servers rather than applied to every file opened.
+SQLITE_WAL = os.getenv('SQLITE_WAL', 'False') == 'True'
+
 
 
 # Password validation settings
@@ -202,11 +217,15 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 # Django REST Framework authentication and permission settings
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'analysis.authentication.ClaimsJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
     ),
+    'DEFAULT_RENDERER_CLASSES': (
+        'analysis.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
 }
 
 
@@ -226,6 +245,14 @@ SIMPLE_JWT = {
     'TOKEN_TYPE_CLAIM': 'token_type',
 }
 
+# Users whose token claims are stale (changed since the token was issued) are
+# read from the database and cached per process; each process polls for
+# changed users every POLL_INTERVAL seconds
+USER_CACHE = {
+    'MAX_SIZE': 10000,
+    'POLL_INTERVAL': float(os.getenv('USER_CACHE_POLL_INTERVAL', '5')),
+}
+
 # File upload settings
 FILE_UPLOAD_MAX_MEMORY_SIZE = 10485760  # 10MB
 DATA_UPLOAD_MAX_MEMORY_SIZE = 10485760  # 10MB
@@ -234,3 +261,166 @@ STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 
 # Custom user model
 AUTH_USER_MODEL = 'analysis.User'
+
+# Similar-clause index: memory-mapped vectors stored on local disk
+CLAUSE_INDEX_DIR = os.getenv('CLAUSE_INDEX_DIR', os.path.join(BASE_DIR, 'clause_index'))
+CLAUSE_INDEX_DIMENSIONS = int(os.getenv('CLAUSE_INDEX_DIMENSIONS', '256'))
+
+# LLM client: connection pool, timeouts (seconds), retry policy and circuit breaker
+LLM = {
+    'BACKEND': LLM_BACKEND,
+    'API_KEY': OPENAI_API_KEY,
+    'BASE_URL': os.getenv('OPENAI_BASE_URL') or None,
+    'TIMEOUT': float(os.getenv('LLM_TIMEOUT', '120')),
+    'CONNECT_TIMEOUT': float(os.getenv('LLM_CONNECT_TIMEOUT', '5')),
+    'MAX_CONNECTIONS': int(os.getenv('LLM_MAX_CONNECTIONS', '20')),
+    'MAX_KEEPALIVE_CONNECTIONS': int(os.getenv('LLM_MAX_KEEPALIVE_CONNECTIONS', '10')),
+    'KEEPALIVE_EXPIRY': 60.0,
+    'MAX_RETRIES': int(os.getenv('LLM_MAX_RETRIES', '3')),
+    'BACKOFF_BASE': 0.5,
+    'BACKOFF_MAX': 20.0,
+    'CIRCUIT_FAILURE_THRESHOLD': int(os.getenv('LLM_CIRCUIT_FAILURE_THRESHOLD', '5')),
+    'CIRCUIT_RESET_TIMEOUT': float(os.getenv('LLM_CIRCUIT_RESET_TIMEOUT', '30')),
+    # Save real responses here so the stub backend can replay them
+    'RECORD_DIR': os.getenv('LLM_RECORD_DIR') or None,
+    # Stub backend: recorded responses, simulated latency and failure rate
+    'STUB_RESPONSES_DIR': os.getenv('LLM_STUB_RESPONSES_DIR') or None,
+    'STUB_LATENCY': float(os.getenv('LLM_STUB_LATENCY', '0')),
+    'STUB_JITTER': float(os.getenv('LLM_STUB_JITTER', '0')),
+    'STUB_ERROR_RATE': float(os.getenv('LLM_STUB_ERROR_RATE', '0')),
+}
+
+# Serve LLM-bound endpoints with native async views (run under ASGI to benefit)
+ASYNC_LLM_VIEWS = os.getenv('ASYNC_LLM_VIEWS', 'True') == 'True'
+
+# Coalescing of identical concurrent analyses (seconds)
+ANALYSIS_COALESCE_RESULT_TTL = int(os.getenv('ANALYSIS_COALESCE_RESULT_TTL', '30'))
+ANALYSIS_COALESCE_WAIT_TIMEOUT = int(os.getenv('ANALYSIS_COALESCE_WAIT_TIMEOUT', '120'))
+ANALYSIS_COALESCE_STALE_AFTER = int(os.getenv('ANALYSIS_COALESCE_STALE_AFTER', '300'))
+ANALYSIS_COALESCE_POLL_INTERVAL = 0.25
+
+# Model routing, tried in order: the first route whose input limit (and contract
+# types, if set) the request fits is used; the last route takes the rest. The
+# fine-tuned model takes the contract types it was trained on up to its input
+# limit; long and unrecognised ('other') contracts go to the large model. With
+# LLM_LARGE_ROUTE=False the fine-tuned model takes everything
+LLM_LARGE_ROUTE = os.getenv('LLM_LARGE_ROUTE', 'True') == 'True'
+LLM_ROUTES = [
+    {
+        'NAME': 'fast',
+        'MODEL': os.getenv('LLM_FAST_MODEL', 'ft:gpt-3.5-turbo-0125:personal:legal-assistance:BFR7HUPE'),
+        'MAX_INPUT_TOKENS': int(os.getenv('LLM_FAST_MAX_INPUT_TOKENS', '6000')),
+        'MAX_TOKENS': 2048,
+        'CONTEXT_WINDOW': 16385,
+        'CONTRACT_TYPES': [
+            name for name in os.getenv('LLM_FAST_CONTRACT_TYPES', 'employment,lease,sale,services,nda,loan').split(',')
+            if name
+        ],
+    },
+]
+if LLM_LARGE_ROUTE:
+    LLM_ROUTES.append({
+        'NAME': 'large',
+        'MODEL': os.getenv('LLM_LARGE_MODEL', 'gpt-4o'),
+        'MAX_INPUT_TOKENS': 120000,
+        'MAX_TOKENS': 4096,
+        'CONTEXT_WINDOW': 128000,
+    })
+
+# Contracts over this many tokens after pre-flight compaction are analyzed in
+# chunks; by default small enough for the last route's context window
+ANALYSIS_TOKEN_BUDGET = int(os.getenv('ANALYSIS_TOKEN_BUDGET', '24000' if LLM_LARGE_ROUTE else '12000'))
+
+# Admission control: concurrent jobs per pool across all processes, how many may
+# queue, how long one waits before a 503 and how long a slot lease lasts (seconds)
+ADMISSION_CONTROL = os.getenv('ADMISSION_CONTROL', 'True') == 'True'
+ADMISSION_POOLS = {
+    'extraction': {
+        'LIMIT': int(os.getenv('ADMISSION_EXTRACTION_LIMIT', '4')),
+        'MAX_QUEUE': int(os.getenv('ADMISSION_EXTRACTION_MAX_QUEUE', '16')),
+        'WAIT_TIMEOUT': 30,
+        'LEASE': 300,
+    },
+    'llm': {
+        'LIMIT': int(os.getenv('ADMISSION_LLM_LIMIT', '32')),
+        'MAX_QUEUE': int(os.getenv('ADMISSION_LLM_MAX_QUEUE', '128')),
+        'WAIT_TIMEOUT': 60,
+        'LEASE': 900,
+    },
+}
+
+# LLM token quotas per account type over a sliding window (seconds); None is
+# unlimited. User.token_quota overrides these per user
+TOKEN_QUOTA_WINDOW = int(os.getenv('TOKEN_QUOTA_WINDOW', '3600'))
+TOKEN_QUOTAS = {
+    'user': 100000,
+    'client': 250000,
+    'lawfirm': 1000000,
+    'admin': None,
+}
+
+# Idempotency-Key replay window, and how long an unfinished request holds its key (seconds)
+IDEMPOTENCY_TTL = int(os.getenv('IDEMPOTENCY_TTL', '86400'))
+IDEMPOTENCY_PROCESSING_TIMEOUT = 600
+
+# Batch analysis: worker threads shared by all batches, size limits, and how long
+# an unfinished batch can go without progress before it is assumed to have lost
+# its worker (seconds)
+BATCH_CONCURRENCY = int(os.getenv('BATCH_CONCURRENCY', '8'))
+BATCH_MAX_ITEMS = 100
+BATCH_MAX_FILE_SIZE = 20 * 1024 * 1024
+# Total decompressed size of the files of one archive
+BATCH_MAX_ARCHIVE_SIZE = 200 * 1024 * 1024
+BATCH_STALE_AFTER = 3600
+
+# USD per million tokens, for cost estimates; fine-tuned models are priced as 'ft:<base model>'
+LLM_PRICING = {
+    'ft:gpt-3.5-turbo-0125': {'INPUT': 3.00, 'OUTPUT': 6.00},
+    'gpt-4o': {'INPUT': 2.50, 'OUTPUT': 10.00},
+    'gpt-4o-mini': {'INPUT': 0.15, 'OUTPUT': 0.60},
+}
+
+# Server-Timing response headers with per-stage durations, and the bearer token
+# Prometheus must send to scrape /metrics (unset: /metrics only works in DEBUG)
+SERVER_TIMING = os.getenv('SERVER_TIMING', 'True') == 'True'
+METRICS_TOKEN = os.getenv('METRICS_TOKEN') or None
+
+# The frontend shell is revalidated on every load (a 304 while unchanged) so a
+# new build's asset hashes are picked up at once
+FRONTEND_CACHE_CONTROL = os.getenv('FRONTEND_CACHE_CONTROL', 'no-cache')
+
+# Compression of API responses: JSON bodies under PATHS of at least MIN_SIZE
+# bytes, at levels low enough to cost less than the transfer time they save
+API_COMPRESSION = {
+    'PATHS': ('/api/',),
+    'CONTENT_TYPES': ('application/json',),
+    'MIN_SIZE': int(os.getenv('API_COMPRESSION_MIN_SIZE', '1024')),
+    'LEVELS': {'gzip': 6, 'br': 4},
+}
+
+# Server-Sent Events notification push (ASGI only): how often each process
+# checks for notifications created by other workers, and the keep-alive
+# interval of idle streams (seconds)
+NOTIFICATION_STREAM = {
+    'POLL_INTERVAL': float(os.getenv('NOTIFICATION_POLL_INTERVAL', '1.0')),
+    'HEARTBEAT': 20.0,
+    'QUEUE_SIZE': 100,
+    'BACKLOG': 100,
+}
+
+# Span tracing: fraction of new traces recorded, whether the sampled flag of
+# an incoming traceparent is followed (only behind a gateway that sets or
+# strips it), and where spans go (an OTLP/HTTP collector such as
+# http://localhost:4318/v1/traces, or OTLP/JSON lines appended to FILE and
+# rotated past FILE_MAX_BYTES; with neither, tracing records nothing)
+TRACING = {
+    'SERVICE_NAME': os.getenv('TRACING_SERVICE_NAME', 'lecua-backend'),
+    'SAMPLE_RATE': float(os.getenv('TRACING_SAMPLE_RATE', '0.01')),
+    'TRUST_UPSTREAM_SAMPLING': os.getenv('TRACING_TRUST_UPSTREAM_SAMPLING', 'False') == 'True',
+    'OTLP_ENDPOINT': os.getenv('TRACING_OTLP_ENDPOINT') or None,
+    'FILE': os.getenv('TRACING_FILE') or None,
+    'FILE_MAX_BYTES': int(os.getenv('TRACING_FILE_MAX_BYTES', str(100 * 1024 * 1024))),
+    'EXPORT_INTERVAL': 5.0,
+    'BATCH_SIZE': 512,
+    'MAX_QUEUE': 10000,
+}
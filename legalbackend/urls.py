@@ -1,9 +1,10 @@
 from django.contrib import admin
 from django.urls import path, include
+from analysis.urls import analyze_text as analyze_text_view
 from analysis.views import (
     user_view, upload_document, get_user_documents,
     get_document_content, analyze_text, EmailTokenObtainPairView, RegisterView, FrontendAppView, get_analysis_history,
-    create_report
+    create_report, metrics_view
 )
 from django.conf import settings
 from django.conf.urls.static import static
@@ -25,7 +26,7 @@ urlpatterns = [
     # URL pattern for analyzing a specific document
     path('api/documents/<int:document_id>/analysis/', analyze_text, name='get_document_analysis'),
     # URL pattern for text analysis
-    path('api/analyze-text/', analyze_text, name='analyze_text'),  # Updated endpoint for text analysis
+    path('api/analyze-text/', analyze_text_view, name='analyze_text'),  # Updated endpoint for text analysis
     # URL pattern for obtaining token using email
     path('api/token/', EmailTokenObtainPairView.as_view(), name='token_obtain_pair'),
     # URL pattern for user registration
@@ -34,6 +35,8 @@ urlpatterns = [
     path('api/analyses/', get_analysis_history, name='analysis-history'),
     # URL pattern for creating reports
     path('api/reports/', create_report, name='create_report'),
+    # URL pattern for Prometheus scrapes
+    path('metrics', metrics_view, name='metrics'),
     # URL pattern for rendering frontend application
     path('', FrontendAppView.as_view(), name='frontend'),
 ] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)  # Serve media files during development